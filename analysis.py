@@ -0,0 +1,97 @@
+# analysis.py - Análisis del texto de un mensaje, calculado una vez por update
+import re
+from collections import OrderedDict
+from functools import cached_property
+
+from matcher import contains, get_automaton
+from simhash import fingerprint_tokens
+
+_NON_COUNTED = re.compile(r'#\w+|@\w+|https?://\S+')
+_WORD = re.compile(r'\b\w+\b')
+_HASHTAG = re.compile(r'#\w+')
+_CHAR_RUN = re.compile(r'(.)\1{4,}')
+
+class MessageAnalysis:
+    """Hechos derivados del texto de un mensaje.
+
+    Cada propiedad se calcula la primera vez que algún handler la pide y se
+    reutiliza en el resto de grupos de handlers del mismo update.
+    """
+
+    def __init__(self, text: str):
+        self.text = text or ""
+        self._matches = None
+
+    @cached_property
+    def lower(self) -> str:
+        return self.text.lower()
+
+    @property
+    def matches(self):
+        """Términos del matcher (hashtags, retos, spam) encontrados en una pasada
+
+        Si las reglas se recargan entre medias, se vuelve a escanear con el
+        autómata nuevo en lugar de servir un resultado sin los términos nuevos.
+        """
+        automaton = get_automaton()
+        matches = self._matches
+        if matches is None or matches.automaton is not automaton:
+            matches = self._matches = automaton.scan(self.lower, lowered=True)
+        return matches
+
+    @cached_property
+    def tokens(self) -> list:
+        return _WORD.findall(self.lower)
+
+    @cached_property
+    def fingerprint(self):
+        """SimHash de 64 bits de las palabras (None si el texto es demasiado corto)"""
+        return fingerprint_tokens(self.tokens)
+
+    @cached_property
+    def word_count(self) -> int:
+        """Palabras sin contar hashtags, menciones ni URLs (como count_words)"""
+        return len(_WORD.findall(_NON_COUNTED.sub('', self.lower)))
+
+    @cached_property
+    def hashtags(self) -> frozenset:
+        """Todos los #hashtags del texto, registrados o no"""
+        return frozenset(_HASHTAG.findall(self.lower))
+
+    @cached_property
+    def caps_ratio(self) -> float:
+        if not self.text:
+            return 0.0
+        return sum(map(str.isupper, self.text)) / len(self.text)
+
+    @cached_property
+    def has_char_run(self) -> bool:
+        """Algún carácter repetido 5 o más veces seguidas"""
+        return _CHAR_RUN.search(self.text) is not None
+
+    def contains(self, term: str) -> bool:
+        """Término como token completo"""
+        return contains(self.text, term, self.matches)
+
+# Análisis de los últimos updates; los handlers de un update se ejecutan
+# seguidos, así que basta con recordar unos pocos
+MAX_CACHED_UPDATES = 256
+_recent = OrderedDict()
+
+def get_analysis(update) -> MessageAnalysis:
+    """Análisis del mensaje del update, compartido entre todos sus handlers"""
+    message = getattr(update, "message", None)
+    text = getattr(message, "text", None) or ""
+    key = getattr(update, "update_id", None)
+    if key is None:
+        return MessageAnalysis(text)
+
+    analysis = _recent.get(key)
+    if analysis is not None and analysis.text == text:
+        _recent.move_to_end(key)
+        return analysis
+
+    analysis = _recent[key] = MessageAnalysis(text)
+    if len(_recent) > MAX_CACHED_UPDATES:
+        _recent.popitem(last=False)
+    return analysis
@@ -5,84 +5,229 @@ from telegram.ext import (
 from handlers.security import handle_hashtags_improved as handle_hashtags  # Importar con alias
 from handlers.ranking import ranking_job, cmd_ranking
 from handlers.retos import reto_job, cmd_reto, cmd_nuevo_reto
-from handlers.spam import spam_handler
-from handlers.phrases import phrase_middleware
+from handlers.spam import spam_stage
+from handlers.security import hashtag_stage, security_sweep_job, security_sync_job, security_manager, SECURITY_SYNC_SECONDS
+from handlers.phrases import phrase_stage
+from handlers.pipeline import run_pipeline
 from handlers.help import cmd_help
 from handlers.start import cmd_start
+from handlers.maintenance import compaction_job
+from handlers.backup import backup_job, cmd_backup, BACKUP_INTERVAL_HOURS
 from utils import cmd_mipuntaje, cmd_miperfil, cmd_mirank
-from db import set_chat_config, get_chat_config, create_tables
+import storage
+import rules
+from rules import get_rules, is_admin
+from db_async import set_chat_config, get_configured_chats
+import db_async
+from outbox import outbox, MAX_IN_FLIGHT as OUTBOX_CONCURRENCY
 import asyncio
 import os
+import signal
 from aiohttp import web
 from aiohttp.web import Request, Response
 import json
+from collections import OrderedDict
 
-# Crear tablas en el inicio
-create_tables()
+# Abrir el almacenamiento (SQLite: crea/migra las tablas y carga los rankings)
+storage.get_backend().open()
+
+# Reglas de puntuación: se validan y compilan ahora (un rules.json roto no arranca)
+print(f"[INFO] Reglas cargadas: {get_rules().summary()}")
 
 # CONFIGURACIÓN CRÍTICA: Chat principal para jobs automáticos
 MAIN_CHAT_ID = os.environ.get("MAIN_CHAT_ID")  # Configurar en variables de entorno
 if not MAIN_CHAT_ID:
     print("[WARNING] MAIN_CHAT_ID no configurado - jobs automáticos deshabilitados")
 
-async def post_init(application):
-    """Inicializa los jobs automáticos con chat_id configurado"""
-    if MAIN_CHAT_ID:
+def schedule_chat_jobs(job_queue, chat_id: int, config: dict):
+    """Programa ranking y reto semanales para un chat (sin duplicar jobs)"""
+    if config.get("rankings_enabled") and not job_queue.get_jobs_by_name(f"ranking:{chat_id}"):
         # Job ranking semanal: domingos a las 20:00 UTC
-        application.job_queue.run_repeating(
+        job_queue.run_repeating(
             ranking_job, 
             interval=604800,  # 7 días en segundos
             first=0,
-            data=int(MAIN_CHAT_ID)  # Pasar chat_id como data
+            data=chat_id,  # Pasar chat_id como data
+            name=f"ranking:{chat_id}"
         )
-        
+    
+    if config.get("challenges_enabled") and not job_queue.get_jobs_by_name(f"reto:{chat_id}"):
         # Job reto semanal: lunes a las 10:00 UTC
-        application.job_queue.run_repeating(
+        job_queue.run_repeating(
             reto_job, 
             interval=604800,  # 7 días en segundos
             first=3600,  # 1 hora después del ranking
-            data=int(MAIN_CHAT_ID)  # Pasar chat_id como data
+            data=chat_id,  # Pasar chat_id como data
+            name=f"reto:{chat_id}"
         )
-        
+
+async def schedule_jobs(application):
+    """Programa los jobs automáticos (mantenimiento y chats configurados) en el JobQueue
+
+    Se llama desde setup_bot: el bot arranca la Application a mano, así que
+    PTB no ejecuta post_init.
+    """
+    if application.job_queue is None:
+        print("[ERROR] JobQueue no disponible: instala python-telegram-bot[job-queue]")
+        return
+    
+    if MAIN_CHAT_ID:
         # Configurar el chat en la base de datos
         try:
-            set_chat_config(int(MAIN_CHAT_ID), "Chat Principal Bot", True, True)
-            print(f"[INFO] Jobs configurados para chat_id: {MAIN_CHAT_ID}")
+            await set_chat_config(int(MAIN_CHAT_ID), "Chat Principal Bot", True, True)
         except Exception as e:
             print(f"[ERROR] Error configurando chat en DB: {e}")
     else:
-        print("[WARNING] Jobs automáticos no configurados - falta MAIN_CHAT_ID")
+        print("[WARNING] MAIN_CHAT_ID no configurado - sólo se usarán los chats registrados")
+    
+    # Compactación diaria del ledger (por lotes, no bloquea los mensajes)
+    application.job_queue.run_repeating(
+        compaction_job,
+        interval=86400,  # 1 día en segundos
+        first=600,
+        name="compaction"
+    )
+    
+    # Copia de seguridad en caliente (API de backup de SQLite, por pasos)
+    application.job_queue.run_repeating(
+        backup_job,
+        interval=BACKUP_INTERVAL_HOURS * 3600,
+        first=1800,
+        name="backup"
+    )
+    
+    # Cada grupo registrado tiene sus propios jobs y su propio ranking
+    for chat in await get_configured_chats():
+        schedule_chat_jobs(application.job_queue, chat["chat_id"], chat)
+        print(f"[INFO] Jobs configurados para chat_id: {chat['chat_id']}")
 
-async def fallback_debug(update, context):
-    """Handler debug mejorado con más información - SOLO PARA MENSAJES NO PROCESADOS"""
-    if update.message and update.message.text:
-        # Solo procesar si no es un hashtag (ya que debería haber sido procesado antes)
-        if not any(word.startswith('#') for word in update.message.text.split()):
-            print(f"[DEBUG] Mensaje sin hashtag: {update.message.text}")
-            print(f"[DEBUG] Usuario: {update.effective_user.username} (ID: {update.effective_user.id})")
-            print(f"[DEBUG] Chat: {update.effective_chat.id}")
-            
-            # TEMPORAL: Respuesta de debug solo para mensajes sin hashtags
-            try:
-                await update.message.reply_text(f"🐛 Debug: Mensaje sin hashtag procesado")
-            except Exception as e:
-                print(f"[ERROR] Error en fallback_debug: {e}")
+# Tareas periódicas propias del proceso (no dependen del JobQueue de PTB)
+background_tasks = []
+
+async def run_every(job, interval: float, first: float = 0):
+    """Ejecuta job(None) cada interval segundos hasta que se cancele la tarea"""
+    await asyncio.sleep(first)
+    while True:
+        await job(None)
+        await asyncio.sleep(interval)
+
+def start_background_task(job, interval: float, first: float = 0):
+    task = asyncio.get_running_loop().create_task(run_every(job, interval, first), name=job.__name__)
+    background_tasks.append(task)
+    return task
+
+async def shutdown_bot(runner=None):
+    """Cierre ordenado (SIGTERM/SIGINT): nada pendiente se pierde al reiniciar"""
+    print("[INFO] Cerrando el bot...")
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    
+    # Dejar de recibir webhooks (espera a los que están en curso)
+    if runner is not None:
+        await runner.cleanup()
+    
+    # Terminar los updates ya recibidos (sus premios pasan por el write-behind)
+    if bot_app is not None and bot_app.running:
+        try:
+            await bot_app.stop()
+        except Exception as e:
+            print(f"[ERROR] Error deteniendo la aplicación: {e}")
+    
+    # Premios aún en el write-behind: se escriben antes de vaciar el outbox, para
+    # que los logros que desbloquean se encolen y se envíen con control de flood
+    try:
+        await db_async.write_buffer.flush()
+    except Exception as e:
+        print(f"[ERROR] Error escribiendo los premios pendientes: {e}")
+    await asyncio.sleep(0)  # los handlers que esperaban el commit encolan sus anuncios
+    
+    # Respuestas ya encoladas: se envían mientras el cliente HTTP sigue abierto
+    await outbox.stop()
+    
+    # Último sync: los límites y bloqueos de este proceso quedan guardados
+    try:
+        await security_manager.sync()
+    except Exception as e:
+        print(f"[ERROR] Error guardando el estado de seguridad: {e}")
+    
+    if bot_app is not None:
+        try:
+            await bot_app.shutdown()
+        except Exception as e:
+            print(f"[ERROR] Error cerrando la aplicación: {e}")
+    
+    # Cierra el executor y la base de datos (el buffer ya está vacío)
+    await db_async.aclose()
+    print("[INFO] Bot detenido")
+
+async def debug_stage(ctx):
+    """Etapa debug mejorada con más información - SOLO PARA MENSAJES NO PROCESADOS"""
+    # Solo si ninguna etapa anterior respondió y el mensaje no tiene hashtags
+    if ctx.parts or ctx.analysis.hashtags:
+        return
+    update = ctx.update
+    print(f"[DEBUG] Mensaje sin hashtag: {update.message.text}")
+    print(f"[DEBUG] Usuario: {update.effective_user.username} (ID: {update.effective_user.id})")
+    print(f"[DEBUG] Chat: {update.effective_chat.id}")
+    
+    # TEMPORAL: Respuesta de debug solo para mensajes sin hashtags
+    ctx.say("🐛 Debug: Mensaje sin hashtag procesado")
+
+# Etapas de cada mensaje de texto, en orden; todas escriben en la misma respuesta
+MESSAGE_STAGES = (
+    hashtag_stage,  # puntos, retos y logros (puede detener el pipeline)
+    spam_stage,     # aviso de spam
+    phrase_stage,   # reacción cinéfila si no hubo ya una
+    debug_stage,    # mensajes sin hashtags (último)
+)
+
+async def handle_message(update, context):
+    """Un solo handler para los mensajes de texto: pipeline de etapas, una respuesta"""
+    await run_pipeline(update, context, MESSAGE_STAGES)
 
 # Variable global para el bot
 bot_app = None
 
+# update_ids recientes: Telegram reenvía el webhook si tardamos o fallamos,
+# y una reentrega no debe volver a puntuar (lo más antiguo se descarta primero)
+MAX_RECENT_UPDATES = 10000
+recent_update_ids = OrderedDict()
+
+def seen_update(update_id) -> bool:
+    """Registra el update_id y devuelve True si ya se había recibido"""
+    if update_id is None:
+        return False
+    if update_id in recent_update_ids:
+        return True
+    recent_update_ids[update_id] = None
+    if len(recent_update_ids) > MAX_RECENT_UPDATES:
+        recent_update_ids.popitem(last=False)
+    return False
+
 async def webhook_handler(request: Request) -> Response:
     """Maneja las actualizaciones de Telegram con mejor logging"""
     try:
         body = await request.text()
         update_dict = json.loads(body)
         
+        update_id = update_dict.get("update_id")
+        if seen_update(update_id):
+            print(f"[WEBHOOK] Update {update_id} repetido, ignorado")
+            return Response(text="OK")
+        
         print(f"[WEBHOOK] Recibido: {json.dumps(update_dict, indent=2)[:500]}...")
         
         if bot_app:
             from telegram import Update
             update = Update.de_json(update_dict, bot_app.bot)
-            await bot_app.process_update(update)
+            try:
+                await bot_app.process_update(update)
+            except Exception:
+                # Falló: el reintento de Telegram sí debe procesarse
+                recent_update_ids.pop(update_id, None)
+                raise
         else:
             print("[ERROR] bot_app no está inicializado")
         
@@ -99,18 +244,17 @@ async def health_check(request: Request) -> Response:
 
 async def cmd_configurar_chat(update, context):
     """Comando para administradores: configurar chat actual para jobs automáticos"""
-    ADMIN_IDS = [int(x) for x in os.environ.get("ADMIN_IDS", "").split(",") if x.strip()]
-    
-    if not ADMIN_IDS or update.effective_user.id not in ADMIN_IDS:
-        await update.message.reply_text("❌ Solo administradores pueden usar este comando")
+    if not is_admin(update.effective_user.id):
+        await outbox.reply(update.message, "❌ Solo administradores pueden usar este comando")
         return
     
     chat_id = update.effective_chat.id
     chat_title = update.effective_chat.title or "Chat Privado"
     
     try:
-        set_chat_config(chat_id, chat_title, True, True)
-        await update.message.reply_text(
+        await set_chat_config(chat_id, chat_title, True, True)
+        schedule_chat_jobs(context.job_queue, chat_id, {"rankings_enabled": True, "challenges_enabled": True})
+        await outbox.reply(update.message,
             f"✅ Chat configurado correctamente\n"
             f"📱 ID: `{chat_id}`\n"
             f"📝 Título: {chat_title}\n"
@@ -120,66 +264,92 @@ async def cmd_configurar_chat(update, context):
         print(f"[INFO] Chat {chat_id} configurado manualmente")
     except Exception as e:
         print(f"[ERROR] Error configurando chat: {e}")
-        await update.message.reply_text("❌ Error al configurar el chat")
+        await outbox.reply(update.message, "❌ Error al configurar el chat")
 
 async def cmd_test_job(update, context):
     """Comando de prueba para administradores"""
-    ADMIN_IDS = [int(x) for x in os.environ.get("ADMIN_IDS", "").split(",") if x.strip()]
-    
-    if not ADMIN_IDS or update.effective_user.id not in ADMIN_IDS:
+    if not is_admin(update.effective_user.id):
         return
     
     if len(context.args) > 0 and context.args[0] == "ranking":
         # Test del job de ranking
         await ranking_job(context)
-        await update.message.reply_text("✅ Job de ranking ejecutado manualmente")
+        await outbox.reply(update.message, "✅ Job de ranking ejecutado manualmente")
     elif len(context.args) > 0 and context.args[0] == "reto":
         # Test del job de reto
         await reto_job(context)
-        await update.message.reply_text("✅ Job de reto ejecutado manualmente")
+        await outbox.reply(update.message, "✅ Job de reto ejecutado manualmente")
     else:
-        await update.message.reply_text(
+        await outbox.reply(update.message,
             "🧪 Comandos de prueba:\n"
             "`/testjob ranking` - Ejecutar ranking manual\n"
             "`/testjob reto` - Ejecutar reto manual",
             parse_mode='Markdown'
         )
 
+async def cmd_recargar_reglas(update, context):
+    """Comando para administradores: recargar rules.json sin reiniciar"""
+    if not is_admin(update.effective_user.id):
+        await outbox.reply(update.message, "❌ Solo administradores pueden usar este comando")
+        return
+    
+    try:
+        loaded = rules.reload_rules()
+    except rules.RuleError as e:
+        print(f"[ERROR] Error recargando reglas: {e}")
+        await outbox.reply(update.message, f"❌ Reglas no recargadas (siguen las anteriores):\n{e}")
+        return
+    
+    await outbox.reply(update.message, f"✅ Reglas recargadas: {loaded.summary()}")
+
+def reload_rules_on_signal():
+    """SIGHUP: recargar rules.json (con errores se mantienen las reglas vigentes)"""
+    try:
+        rules.reload_rules()
+    except rules.RuleError as e:
+        print(f"[ERROR] Error recargando reglas (SIGHUP): {e}")
+
 # NUEVO: Comando de test simple
 async def cmd_test(update, context):
     """Comando simple para verificar que el bot responde"""
-    await update.message.reply_text("✅ Bot funcionando correctamente!")
+    await outbox.reply(update.message, "✅ Bot funcionando correctamente!")
     print(f"[TEST] Bot respondió a {update.effective_user.username}")
 
 # NUEVO: Comando de debug para hashtags
 async def cmd_debug(update, context):
     """Comando de debug para probar hashtags manualmente"""
-    ADMIN_IDS = [int(x) for x in os.environ.get("ADMIN_IDS", "").split(",") if x.strip()]
-    
-    if not ADMIN_IDS or update.effective_user.id not in ADMIN_IDS:
+    if not is_admin(update.effective_user.id):
         return
     
     # Simular mensaje con hashtag
     if context.args:
         test_text = " ".join(context.args)
         print(f"[DEBUG] Testing hashtag processing with: {test_text}")
-        await update.message.reply_text(f"🧪 Testing: {test_text}")
+        await outbox.reply(update.message, f"🧪 Testing: {test_text}")
         
         # Intentar procesar con la función de hashtags
         try:
             # Crear un mensaje simulado para probar
             await handle_hashtags(update, context)
         except Exception as e:
-            await update.message.reply_text(f"❌ Error en hashtag processing: {e}")
+            await outbox.reply(update.message, f"❌ Error en hashtag processing: {e}")
             print(f"[ERROR] Error en handle_hashtags: {e}")
     else:
-        await update.message.reply_text("Uso: /debug #hashtag texto")
+        await outbox.reply(update.message, "Uso: /debug #hashtag texto")
 
 async def setup_bot():
     """Configura el bot de Telegram"""
     global bot_app
     
-    bot_app = ApplicationBuilder().token(os.environ["BOT_TOKEN"]).post_init(post_init).build()
+    # Pool HTTP explícito: los envíos simultáneos del outbox más margen para
+    # las demás llamadas (setWebhook, getFile...); por defecto PTB usa 1 conexión
+    bot_app = (
+        ApplicationBuilder()
+        .token(os.environ["BOT_TOKEN"])
+        .connection_pool_size(OUTBOX_CONCURRENCY + 4)
+        .pool_timeout(10.0)
+        .build()
+    )
     
     # ========== COMANDOS (GRUPO 0 - PRIORIDAD MÁXIMA) ==========
     bot_app.add_handler(CommandHandler("start", cmd_start))
@@ -196,34 +366,16 @@ async def setup_bot():
     bot_app.add_handler(CommandHandler("nuevoreto", cmd_nuevo_reto))
     bot_app.add_handler(CommandHandler("testjob", cmd_test_job))
     bot_app.add_handler(CommandHandler("debug", cmd_debug))  # NUEVO
+    bot_app.add_handler(CommandHandler("backup", cmd_backup))
+    bot_app.add_handler(CommandHandler("recargarreglas", cmd_recargar_reglas))
     
-    # ========== HANDLERS DE MENSAJES (GRUPOS SEPARADOS) ==========
-    
-    # GRUPO -1: HASHTAGS (PRIORIDAD MÁXIMA PARA MENSAJES)
-    hashtag_filter = filters.TEXT & ~filters.COMMAND & filters.Regex(r'#\w+')
-    bot_app.add_handler(
-        MessageHandler(hashtag_filter, handle_hashtags), 
-        group=-1
-    )
-    print("[INFO] Handler hashtags registrado en grupo -1 (máxima prioridad)")
-    
-    # GRUPO 0: DETECCIÓN DE SPAM
+    # ========== MENSAJES: UN HANDLER, UN PIPELINE ==========
+    # Los filtros se evalúan una vez; las etapas deciden el resto
     bot_app.add_handler(
-        MessageHandler(filters.TEXT & ~filters.COMMAND, spam_handler), 
-        group=0
-    )
-    
-    # GRUPO 1: FRASES TRIGGER (solo "cine")
-    bot_app.add_handler(
-        MessageHandler(filters.TEXT & ~filters.COMMAND, phrase_middleware), 
+        MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message), 
         group=1
     )
-    
-    # GRUPO 2: FALLBACK DEBUG (ÚLTIMA PRIORIDAD)
-    bot_app.add_handler(
-        MessageHandler(filters.TEXT & ~filters.COMMAND, fallback_debug), 
-        group=2
-    )
+    print(f"[INFO] Pipeline de mensajes registrado: {', '.join(stage.__name__ for stage in MESSAGE_STAGES)}")
     
     print("[INFO] ========== HANDLERS REGISTRADOS ==========")
     print(f"[INFO] - Comandos: {len([h for h in bot_app.handlers[0] if isinstance(h, CommandHandler)])}")
@@ -233,10 +385,22 @@ async def setup_bot():
             print(f"[INFO] - Grupo {group_num}: {len(message_handlers)} message handlers")
     print("[INFO] =============================================")
     
+    # Estado de seguridad compartido (límites y blacklist) antes del primer update
+    try:
+        await security_manager.sync()
+    except Exception as e:
+        print(f"[ERROR] Error cargando el estado de seguridad: {e}")
+    
     # Inicializar
     await bot_app.initialize()
     await bot_app.start()
     
+    # Jobs automáticos (el JobQueue ya está en marcha tras start())
+    await schedule_jobs(bot_app)
+    
+    # Todos los envíos pasan por el outbox (flood control, prioridades, fusión)
+    outbox.start()
+    
     # Configurar webhook
     webhook_url = f"{os.environ['RENDER_EXTERNAL_URL']}/webhook"
     result = await bot_app.bot.set_webhook(url=webhook_url)
@@ -249,40 +413,62 @@ async def main():
     # Mostrar configuración al inicio
     print("[INFO] ==> Configuración del Bot <==")
     print(f"[INFO] MAIN_CHAT_ID: {MAIN_CHAT_ID}")
-    print(f"[INFO] ADMIN_IDS: {os.environ.get('ADMIN_IDS', 'No configurado')}")
+    print(f"[INFO] ADMIN_IDS: {', '.join(map(str, sorted(get_rules().admin_ids))) or 'No configurado'}")
     print(f"[INFO] BOT_TOKEN: {'✅ Configurado' if os.environ.get('BOT_TOKEN') else '❌ Falta'}")
     print(f"[INFO] RENDER_EXTERNAL_URL: {os.environ.get('RENDER_EXTERNAL_URL', 'No configurado')}")
     
-    # Configurar el bot
-    await setup_bot()
-    
-    # Crear servidor web con aiohttp
-    app = web.Application()
-    app.router.add_post('/webhook', webhook_handler)
-    app.router.add_get('/', health_check)
-    
-    # Obtener puerto de Render
-    port = int(os.environ.get("PORT", 8000))
-    
-    print(f"[INFO] Iniciando servidor en puerto {port}")
-    
-    # Iniciar servidor
-    runner = web.AppRunner(app)
-    await runner.setup()
-    site = web.TCPSite(runner, '0.0.0.0', port)
-    await site.start()
-    
-    print("[INFO] ========== BOT INICIADO ==========")
-    print("[INFO] Bot y servidor iniciados correctamente")
-    print("[INFO] Comandos disponibles:")
-    print("[INFO] - /test - Verificar funcionamiento")
-    print("[INFO] - /debug #hashtag - Probar hashtag processing (admin)")
-    print("[INFO] - /configurarchat - Configurar chat actual")
-    print("[INFO] - /testjob ranking - Probar job ranking")
-    print("[INFO] =====================================")
+    # SIGTERM (deploy) y SIGINT terminan el bucle pasando por shutdown_bot
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
     
-    # Mantener corriendo
-    await asyncio.Event().wait()
+    runner = None
+    try:
+        # Configurar el bot
+        await setup_bot()
+        
+        # kill -HUP <pid> recarga las reglas sin reiniciar
+        if hasattr(signal, "SIGHUP"):
+            loop.add_signal_handler(signal.SIGHUP, reload_rules_on_signal)
+        
+        # Límites y blacklist compartidos entre procesos (setup_bot ya cargó el estado)
+        start_background_task(security_sync_job, SECURITY_SYNC_SECONDS, first=SECURITY_SYNC_SECONDS)
+        
+        # Limpieza del rate limiter (usuarios inactivos) y contadores de límites
+        start_background_task(security_sweep_job, 600, first=600)
+        
+        # Crear servidor web con aiohttp
+        app = web.Application()
+        app.router.add_post('/webhook', webhook_handler)
+        app.router.add_get('/', health_check)
+        
+        # Obtener puerto de Render
+        port = int(os.environ.get("PORT", 8000))
+        
+        print(f"[INFO] Iniciando servidor en puerto {port}")
+        
+        # Iniciar servidor
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '0.0.0.0', port)
+        await site.start()
+        
+        print("[INFO] ========== BOT INICIADO ==========")
+        print("[INFO] Bot y servidor iniciados correctamente")
+        print("[INFO] Comandos disponibles:")
+        print("[INFO] - /test - Verificar funcionamiento")
+        print("[INFO] - /debug #hashtag - Probar hashtag processing (admin)")
+        print("[INFO] - /configurarchat - Configurar chat actual")
+        print("[INFO] - /testjob ranking - Probar job ranking")
+        print("[INFO] - /backup - Copia de seguridad ahora (admin)")
+        print("[INFO] - /recargarreglas - Recargar rules.json (admin o SIGHUP)")
+        print("[INFO] =====================================")
+        
+        # Mantener corriendo hasta SIGTERM/SIGINT
+        await stop.wait()
+    finally:
+        await shutdown_bot(runner)
 
 if __name__ == "__main__":
     import nest_asyncio
@@ -1,13 +1,158 @@
+import os
+import queue
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from leaderboard import Leaderboard
 
 DB_PATH = "puntum.db"
 
+# Tamaño del pool de lectura y de la cache de sentencias preparadas por conexión
+READER_POOL_SIZE = 4
+STATEMENT_CACHE_SIZE = 256
+
+# Pragmas aplicados a cada conexión (WAL persiste en el fichero, el resto es por conexión)
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",     # En WAL, NORMAL sólo hace fsync en checkpoints
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000",      # ~16 MB de páginas en cache
+    "PRAGMA mmap_size=134217728",    # 128 MB mapeados en memoria
+    "PRAGMA temp_store=MEMORY",
+)
+
 def get_connection():
-    return sqlite3.connect(DB_PATH)
+    """Open a new tuned connection (the caller is responsible for closing it)"""
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=5.0,
+        check_same_thread=False,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+class ConnectionPool:
+    """One long-lived writer connection plus a small pool of reader connections.
+
+    SQLite allows a single writer at a time, so writes are serialized on one
+    connection behind a lock; in WAL mode readers never block the writer and
+    can run concurrently on their own connections. Connections are reused so
+    the statement cache (prepared statements) survives between calls.
+    """
+
+    def __init__(self, path: str, readers: int = READER_POOL_SIZE):
+        self.path = path
+        self._size = readers
+        self._writer = None
+        self._write_lock = threading.Lock()
+        self._readers = queue.LifoQueue()
+        self._created = 0
+        self._create_lock = threading.Lock()
+
+    @contextmanager
+    def writer(self):
+        """Yield the writer connection inside a transaction (commit or rollback on exit)"""
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = get_connection()
+            conn = self._writer
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    @contextmanager
+    def reader(self):
+        """Borrow a reader connection from the pool"""
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    def _acquire_reader(self):
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._create_lock:
+            if self._created < self._size:
+                self._created += 1
+                return get_connection()
+        return self._readers.get()
+
+    def backup(self, target, pages: int, pause: float):
+        """Copy the database into `target` (a connection), `pages` pages per step
+
+        The source is the writer connection: a write made through any other
+        connection restarts an SQLite backup, so under steady traffic it would
+        never finish. The write lock is released between steps; writes that
+        land meanwhile go through this same connection and SQLite applies them
+        to the copy as well.
+        """
+        def between_steps(status, remaining, total):
+            self._write_lock.release()
+            try:
+                time.sleep(pause)
+            finally:
+                self._write_lock.acquire()
+
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = get_connection()
+            conn = self._writer
+            if conn.in_transaction:
+                conn.commit()
+            conn.backup(target, pages=pages, progress=between_steps)
+
+    def close(self):
+        """Close every pooled connection"""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        self._created = 0
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Get the shared connection pool, (re)creating it if DB_PATH changed"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.path != DB_PATH:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(DB_PATH)
+        return _pool
+
+def close_pool():
+    """Close the shared pool (shutdown / tests)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
 
 def create_tables():
-    conn = get_connection()
+    """Create or upgrade the schema in place (runs pending migrations)"""
+    return migrate()
+
+def _create_tables(conn):
     cursor = conn.cursor()
 
     cursor.execute(
@@ -55,77 +200,687 @@ def create_tables():
         )"""
     )
 
-    conn.commit()
-    conn.close()
+def _create_indexes(conn):
+    # Consultas por usuario ordenadas por fecha (stats, contribuciones recientes)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_points_user_time ON points(user_id, timestamp)")
+    # Rankings por chat y rango temporal
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_points_chat_time ON points(chat_id, timestamp)")
+    # Bonus de retos por usuario
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_points_user_bonus ON points(user_id, is_challenge_bonus)")
 
-def add_points(user_id, username, points, hashtag=None, message_text=None, chat_id=None, message_id=None, is_challenge_bonus=False, context=None):
-    conn = get_connection()
-    cursor = conn.cursor()
+def _create_rollups(conn):
+    # Cubetas diarias por usuario y por (chat, usuario), mantenidas en cada premio
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS user_daily_points (
+            day TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            points INTEGER DEFAULT 0,
+            awards INTEGER DEFAULT 0,
+            PRIMARY KEY (day, user_id)
+        ) WITHOUT ROWID"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS chat_daily_points (
+            chat_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            points INTEGER DEFAULT 0,
+            awards INTEGER DEFAULT 0,
+            PRIMARY KEY (chat_id, day, user_id)
+        ) WITHOUT ROWID"""
+    )
+    rebuild_rollups(conn)
 
-    cursor.execute(
-        """INSERT INTO points (user_id, username, points, hashtag, chat_id, message_id, is_challenge_bonus)
-           VALUES (?, ?, ?, ?, ?, ?, ?)""",
-        (user_id, username, points, hashtag, chat_id, message_id, int(is_challenge_bonus))
+def _create_chat_totals(conn):
+    # Total por (chat, usuario): base de los rankings por grupo
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS chat_user_totals (
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            points INTEGER DEFAULT 0,
+            awards INTEGER DEFAULT 0,
+            PRIMARY KEY (chat_id, user_id)
+        ) WITHOUT ROWID"""
+    )
+    conn.execute(
+        """INSERT OR REPLACE INTO chat_user_totals (chat_id, user_id, points, awards)
+           SELECT chat_id, user_id, SUM(points), SUM(awards)
+           FROM chat_daily_points
+           GROUP BY chat_id, user_id"""
     )
 
-    # Update or create user record
-    cursor.execute(
-        """INSERT OR REPLACE INTO users (id, username, points, count, level, created_at)
-           VALUES (?, ?, 
-                   COALESCE((SELECT points FROM users WHERE id = ?), 0) + ?,
-                   COALESCE((SELECT count FROM users WHERE id = ?), 0) + 1,
-                   ?, 
-                   COALESCE((SELECT created_at FROM users WHERE id = ?), CURRENT_TIMESTAMP))""",
-        (user_id, username, user_id, points, user_id, calculate_level(get_user_total_points(user_id) + points), user_id)
+def _has_column(conn, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+def _award_count_sql(conn) -> str:
+    # Las filas compactadas representan varios premios (columna awards, migración 6)
+    return "SUM(awards)" if _has_column(conn, "points", "awards") else "COUNT(*)"
+
+def _add_compaction_columns(conn):
+    if not _has_column(conn, "points", "awards"):
+        conn.execute("ALTER TABLE points ADD COLUMN awards INTEGER DEFAULT 1")
+    if not _has_column(conn, "points", "compacted"):
+        conn.execute("ALTER TABLE points ADD COLUMN compacted INTEGER DEFAULT 0")
+    # Sólo indexa lo que aún se puede compactar
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_points_uncompacted ON points(timestamp) WHERE compacted = 0"
+    )
+    # auto_vacuum=INCREMENTAL necesita un VACUUM completo: es un paso aparte
+    # (enable_incremental_vacuum), no parte del arranque
+
+def _add_message_award_index(conn):
+    # Reentregas antiguas ya duplicadas: se conserva la primera fila de cada premio
+    removed = conn.execute(
+        """DELETE FROM points
+           WHERE message_id IS NOT NULL
+             AND rowid NOT IN (
+                 SELECT MIN(rowid) FROM points
+                 WHERE message_id IS NOT NULL
+                 GROUP BY chat_id, message_id, is_challenge_bonus, COALESCE(hashtag, '')
+             )"""
+    ).rowcount
+    if removed:
+        print(f"[INFO] Eliminados {removed} premios duplicados por reentregas")
+        rebuild_user_totals(conn)
+        rebuild_rollups(conn)
+        conn.execute("DELETE FROM chat_user_totals")
+        _create_chat_totals(conn)
+    # Parcial: las filas compactadas (sin message_id) no pagan el índice
+    conn.execute(
+        """CREATE UNIQUE INDEX IF NOT EXISTS idx_points_message_award
+           ON points(chat_id, message_id, is_challenge_bonus, COALESCE(hashtag, ''))
+           WHERE message_id IS NOT NULL"""
     )
 
-    conn.commit()
-    conn.close()
+def _create_security_state(conn):
+    # Estado del limitador y blacklist compartido entre procesos del bot
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS rate_limit_state (
+            user_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            tat REAL NOT NULL,
+            PRIMARY KEY (user_id, action)
+        ) WITHOUT ROWID"""
+    )
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS security_blacklist (
+            user_id INTEGER PRIMARY KEY,
+            reason TEXT,
+            until REAL NOT NULL
+        )"""
+    )
+
+# Migraciones ordenadas: (versión, descripción, paso). Nunca reordenar ni
+# modificar una ya publicada; los cambios de esquema van en una nueva versión.
+MIGRATIONS = [
+    (1, "base schema", _create_tables),
+    (2, "points indexes", _create_indexes),
+    (3, "rebuild users aggregate", lambda conn: rebuild_user_totals(conn)),
+    (4, "daily rollup tables", _create_rollups),
+    (5, "per-chat user totals", _create_chat_totals),
+    (6, "ledger compaction columns", _add_compaction_columns),
+    (7, "unique award per message", _add_message_award_index),
+    (8, "shared security state", _create_security_state),
+]
+
+def get_schema_version(conn) -> int:
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )"""
+    )
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
 
-    if context and chat_id:
+def migrate() -> int:
+    """Apply pending migrations in order, each one in its own transaction
+
+    The sqlite3 module only opens transactions implicitly before DML, so DDL
+    (CREATE, ALTER) would autocommit statement by statement. Each step runs
+    inside an explicit BEGIN ... COMMIT instead: a step that fails halfway
+    leaves nothing behind and is retried whole on the next start.
+    """
+    with get_pool().writer() as conn:
+        current = get_schema_version(conn)
+        conn.commit()
+
+        isolation_level = conn.isolation_level
+        conn.isolation_level = None  # transacciones explícitas
         try:
-            from handlers.achievements import check_achievements
-            check_achievements(user_id, username, context, chat_id)
+            for version, description, step in MIGRATIONS:
+                if version <= current:
+                    continue
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    step(conn)
+                    conn.execute(
+                        "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                        (version, description)
+                    )
+                    conn.execute("COMMIT")
+                except Exception as e:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    print(f"[ERROR] Migración {version} ({description}) falló: {e}")
+                    raise
+                print(f"[INFO] Migración aplicada: {version} - {description}")
+                current = version
+        finally:
+            conn.isolation_level = isolation_level
+
+    invalidate_user_stats()
+
+    return current
+
+def add_points(user_id, username, points, hashtag=None, message_text=None, chat_id=None, message_id=None, is_challenge_bonus=False, context=None):
+    unlocked = add_points_batch([make_award(user_id, username, points, hashtag, chat_id, message_id, is_challenge_bonus)])["unlocked"]
+
+    if context and chat_id and unlocked.get(user_id):
+        try:
+            from handlers.achievements import announce_achievements
+            context.application.create_task(announce_achievements(context, chat_id, unlocked[user_id]))
         except ImportError:
             pass  # Achievements module is optional
 
     return {"ok": True}
 
-def add_achievement(user_id: int, achievement_id: int):
-    conn = get_connection()
-    cursor = conn.cursor()
+def make_award(user_id, username, points, hashtag=None, chat_id=None, message_id=None, is_challenge_bonus=False, timestamp=None) -> dict:
+    """Build the award record accepted by add_points_batch (timestamp None = now, UTC)"""
+    return {
+        "user_id": user_id,
+        "username": username,
+        "points": points,
+        "hashtag": hashtag,
+        "chat_id": chat_id,
+        "message_id": message_id,
+        "is_challenge_bonus": int(is_challenge_bonus),
+        "timestamp": timestamp,
+    }
+
+# Listeners llamados tras cada commit de premios, dentro de la escritura:
+# listener(txn, awards) -> {user_id: [logros desbloqueados]} o None
+# txn ofrece scope, user_stats(user_id) y add_achievement(user_id, achievement_id)
+# sobre el almacenamiento que confirmó los premios (SQLite o memoria)
+_commit_listeners = []
+
+def register_commit_listener(listener):
+    """Register a callback run after every committed batch of awards"""
+    if listener not in _commit_listeners:
+        _commit_listeners.append(listener)
+
+def notify_commit(txn, awards) -> dict:
+    """Run the commit listeners; returns {user_id: [newly unlocked achievements]}"""
+    unlocked = {}
+    for listener in _commit_listeners:
+        try:
+            for user_id, items in (listener(txn, awards) or {}).items():
+                unlocked.setdefault(user_id, []).extend(items)
+        except Exception as e:
+            print(f"[ERROR] Listener de premios falló: {e}")
+    return unlocked
+
+class _WriterTxn:
+    """Listener view of the SQLite writer transaction"""
+
+    __slots__ = ("conn",)
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    @property
+    def scope(self):
+        # Cambia con cada pool (otra base de datos o reapertura)
+        return get_pool()
+
+    def user_stats(self, user_id: int):
+        return query_user_stats(self.conn, user_id)
+
+    def add_achievement(self, user_id: int, achievement_id: int):
+        add_achievement(user_id, achievement_id, self.conn)
+
+def add_points_batch(awards) -> dict:
+    """Write several awards in a single transaction (one commit for the whole batch)
+
+    Awards already recorded for the same message are skipped (idempotent
+    redeliveries). Returns {"written": [bool per award], "unlocked":
+    {user_id: [newly unlocked achievements]}} from the commit listeners.
+    """
+    with get_pool().writer() as conn:
+        cursor = conn.cursor()
+        written = [_write_award(cursor, award) for award in awards]
+        conn.commit()
+        new_awards = [award for award, ok in zip(awards, written) if ok]
+        # Aún con el lock del escritor: nadie puede recargar el ranking a medias
+        unlocked = _after_commit(conn, new_awards) if new_awards else {}
+        conn.commit()
+    for user_id in {award["user_id"] for award in new_awards}:
+        invalidate_user_stats(user_id)
+    return {"written": written, "unlocked": unlocked}
+
+def _after_commit(conn, awards) -> dict:
+    """Update in-memory state (leaderboards, listeners) for committed awards"""
+    if _leaderboard_ready:
+        for award in awards:
+            _leaderboard.add(award["user_id"], award["username"], award["points"])
+            if award["chat_id"] is not None:
+                _get_chat_board(award["chat_id"]).add(award["user_id"], award["username"], award["points"])
+
+    return notify_commit(_WriterTxn(conn), awards)
+
+def _write_award(cursor, award: dict) -> bool:
+    """Insert one award and update its aggregates; False if it was a duplicate"""
+    # El índice único por (chat, mensaje, tipo, hashtag) descarta reentregas
     cursor.execute(
+        """INSERT OR IGNORE INTO points (user_id, username, points, hashtag, chat_id, message_id, is_challenge_bonus, timestamp)
+           VALUES (:user_id, :username, :points, :hashtag, :chat_id, :message_id, :is_challenge_bonus,
+                   COALESCE(:timestamp, CURRENT_TIMESTAMP))""",
+        award
+    )
+    if cursor.rowcount == 0:
+        return False
+
+    # Cubetas diarias para rankings semanales/mensuales sin recorrer el ledger
+    cursor.execute(
+        """INSERT INTO user_daily_points (day, user_id, points, awards)
+           VALUES (DATE(COALESCE(:timestamp, 'now')), :user_id, :points, 1)
+           ON CONFLICT(day, user_id) DO UPDATE SET
+               points = user_daily_points.points + excluded.points,
+               awards = user_daily_points.awards + 1""",
+        award
+    )
+    if award["chat_id"] is not None:
+        cursor.execute(
+            """INSERT INTO chat_daily_points (chat_id, day, user_id, points, awards)
+               VALUES (:chat_id, DATE(COALESCE(:timestamp, 'now')), :user_id, :points, 1)
+               ON CONFLICT(chat_id, day, user_id) DO UPDATE SET
+                   points = chat_daily_points.points + excluded.points,
+                   awards = chat_daily_points.awards + 1""",
+            award
+        )
+        cursor.execute(
+            """INSERT INTO chat_user_totals (chat_id, user_id, points, awards)
+               VALUES (:chat_id, :user_id, :points, 1)
+               ON CONFLICT(chat_id, user_id) DO UPDATE SET
+                   points = chat_user_totals.points + excluded.points,
+                   awards = chat_user_totals.awards + 1""",
+            award
+        )
+
+    # users es el agregado acumulado: un único upsert, coste constante por premio
+    cursor.execute(
+        f"""INSERT INTO users (id, username, points, count, level)
+            VALUES (:user_id, :username, :points, 1, {_level_sql(":points")})
+            ON CONFLICT(id) DO UPDATE SET
+                username = COALESCE(excluded.username, users.username),
+                points = users.points + excluded.points,
+                count = users.count + 1,
+                level = {_level_sql("users.points + excluded.points")}""",
+        award
+    )
+    return True
+
+# Importación masiva: premios por transacción
+IMPORT_BATCH_SIZE = 20000
+
+_IMPORT_COLUMNS = "user_id, username, points, hashtag, chat_id, message_id, is_challenge_bonus, timestamp"
+
+def import_awards(awards, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """Bulk-load historical awards (each with its timestamp) in large transactions
+
+    Every batch goes into a TEMP staging table with executemany and is copied
+    to the ledger with a single INSERT OR IGNORE ... RETURNING, so awards
+    already recorded for the same message are skipped exactly like live ones.
+    The aggregates are then updated once per user/day/chat for the batch.
+    Returns {"read", "written", "unlocked"} (unlocked achievements are not
+    announced).
+    """
+    totals = {"read": 0, "written": 0, "unlocked": 0}
+    batch = []
+    for award in awards:
+        batch.append(award)
+        if len(batch) >= batch_size:
+            _import_batch(batch, totals)
+            batch = []
+    if batch:
+        _import_batch(batch, totals)
+    return totals
+
+def _import_batch(batch, totals: dict):
+    with get_pool().writer() as conn:
+        conn.execute(
+            f"""CREATE TEMP TABLE IF NOT EXISTS import_staging ({_IMPORT_COLUMNS})"""
+        )
+        conn.execute("DELETE FROM import_staging")
+        conn.executemany(
+            f"""INSERT INTO import_staging ({_IMPORT_COLUMNS})
+                VALUES (:user_id, :username, :points, :hashtag, :chat_id, :message_id,
+                        :is_challenge_bonus, :timestamp)""",
+            batch
+        )
+        rows = conn.execute(
+            f"""INSERT OR IGNORE INTO points ({_IMPORT_COLUMNS})
+                SELECT {_IMPORT_COLUMNS} FROM import_staging WHERE 1 ORDER BY rowid
+                RETURNING {_IMPORT_COLUMNS}"""
+        ).fetchall()
+        written = [
+            dict(zip(("user_id", "username", "points", "hashtag", "chat_id", "message_id",
+                      "is_challenge_bonus", "timestamp"), row))
+            for row in rows
+        ]
+        _write_import_aggregates(conn, written)
+        conn.commit()
+        unlocked = _after_commit(conn, written) if written else {}
+
+    for user_id in {award["user_id"] for award in written}:
+        invalidate_user_stats(user_id)
+    totals["read"] += len(batch)
+    totals["written"] += len(written)
+    totals["unlocked"] += sum(len(items) for items in unlocked.values())
+
+def _write_import_aggregates(conn, awards):
+    """Apply a batch of written awards to users and the rollup tables"""
+    users = {}
+    daily = {}
+    chat_daily = {}
+    chat_totals = {}
+    for award in awards:
+        user_id = award["user_id"]
+        day = award["timestamp"][:10]
+        user = users.setdefault(user_id, {"user_id": user_id, "username": None, "points": 0, "awards": 0, "since": award["timestamp"]})
+        user["username"] = award["username"] or user["username"]
+        user["points"] += award["points"]
+        user["awards"] += 1
+        user["since"] = min(user["since"], award["timestamp"])
+        _accumulate(daily, (day, user_id), award["points"])
+        if award["chat_id"] is not None:
+            _accumulate(chat_daily, (award["chat_id"], day, user_id), award["points"])
+            _accumulate(chat_totals, (award["chat_id"], user_id), award["points"])
+
+    conn.executemany(
+        f"""INSERT INTO users (id, username, points, count, level, created_at)
+            VALUES (:user_id, :username, :points, :awards, {_level_sql(":points")}, :since)
+            ON CONFLICT(id) DO UPDATE SET
+                username = COALESCE(excluded.username, users.username),
+                points = users.points + excluded.points,
+                count = users.count + excluded.count,
+                level = {_level_sql("users.points + excluded.points")},
+                created_at = MIN(users.created_at, excluded.created_at)""",
+        list(users.values())
+    )
+    conn.executemany(
+        """INSERT INTO user_daily_points (day, user_id, points, awards)
+           VALUES (?, ?, ?, ?)
+           ON CONFLICT(day, user_id) DO UPDATE SET
+               points = user_daily_points.points + excluded.points,
+               awards = user_daily_points.awards + excluded.awards""",
+        [(*key, *value) for key, value in daily.items()]
+    )
+    conn.executemany(
+        """INSERT INTO chat_daily_points (chat_id, day, user_id, points, awards)
+           VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT(chat_id, day, user_id) DO UPDATE SET
+               points = chat_daily_points.points + excluded.points,
+               awards = chat_daily_points.awards + excluded.awards""",
+        [(*key, *value) for key, value in chat_daily.items()]
+    )
+    conn.executemany(
+        """INSERT INTO chat_user_totals (chat_id, user_id, points, awards)
+           VALUES (?, ?, ?, ?)
+           ON CONFLICT(chat_id, user_id) DO UPDATE SET
+               points = chat_user_totals.points + excluded.points,
+               awards = chat_user_totals.awards + excluded.awards""",
+        [(*key, *value) for key, value in chat_totals.items()]
+    )
+
+def _accumulate(buckets: dict, key, points: int):
+    bucket = buckets.get(key)
+    if bucket is None:
+        buckets[key] = [points, 1]
+    else:
+        bucket[0] += points
+        bucket[1] += 1
+
+def rebuild_user_totals(conn=None):
+    """Recompute every users row from the points ledger (repair / migrations)"""
+    global _leaderboard_ready
+    if conn is None:
+        with get_pool().writer() as conn:
+            return rebuild_user_totals(conn)
+
+    _leaderboard_ready = False  # se recarga desde users en el próximo uso
+
+    conn.execute(
+        f"""INSERT INTO users (id, username, points, count, level, created_at)
+            SELECT user_id, username, total, awards, {_level_sql("total")}, since
+            FROM (
+                SELECT user_id,
+                       (SELECT p2.username FROM points p2 WHERE p2.user_id = p.user_id
+                        ORDER BY p2.timestamp DESC LIMIT 1) AS username,
+                       SUM(points) AS total,
+                       {_award_count_sql(conn)} AS awards,
+                       MIN(timestamp) AS since
+                FROM points p
+                WHERE user_id IS NOT NULL
+                GROUP BY user_id
+            ) WHERE 1
+            ON CONFLICT(id) DO UPDATE SET
+                username = COALESCE(excluded.username, users.username),
+                points = excluded.points,
+                count = excluded.count,
+                level = excluded.level"""
+    )
+
+def rebuild_rollups(conn=None):
+    """Recompute the daily rollup buckets from the points ledger"""
+    if conn is None:
+        with get_pool().writer() as conn:
+            return rebuild_rollups(conn)
+
+    award_count = _award_count_sql(conn)
+    conn.execute("DELETE FROM user_daily_points")
+    conn.execute("DELETE FROM chat_daily_points")
+    conn.execute(
+        f"""INSERT INTO user_daily_points (day, user_id, points, awards)
+           SELECT DATE(timestamp), user_id, SUM(points), {award_count}
+           FROM points
+           WHERE user_id IS NOT NULL
+           GROUP BY DATE(timestamp), user_id"""
+    )
+    conn.execute(
+        f"""INSERT INTO chat_daily_points (chat_id, day, user_id, points, awards)
+           SELECT chat_id, DATE(timestamp), user_id, SUM(points), {award_count}
+           FROM points
+           WHERE user_id IS NOT NULL AND chat_id IS NOT NULL
+           GROUP BY chat_id, DATE(timestamp), user_id"""
+    )
+
+# Retención del ledger: las filas más antiguas que la ventana se pliegan en
+# filas agregadas por (usuario, chat, hashtag, tipo de bonus, día)
+MIN_RETENTION_DAYS = 14  # los retos semanales necesitan el detalle de la semana
+COMPACTION_CHUNK_SIZE = 2000
+
+def compact_points_chunk(retention_days: int, chunk_size: int = COMPACTION_CHUNK_SIZE) -> int:
+    """Fold up to chunk_size ledger rows older than the retention window.
+
+    Each chunk is one short write transaction. Totals, per-hashtag counts,
+    active days and rollups stay the same: aggregated rows keep the sum of
+    points and the number of awards they replace. Returns rows folded.
+    """
+    retention_days = max(MIN_RETENTION_DAYS, retention_days)
+    cutoff = (datetime.utcnow() - timedelta(days=retention_days)).strftime("%Y-%m-%d 00:00:00")
+
+    with get_pool().writer() as conn:
+        rowids = [
+            row[0] for row in conn.execute(
+                """SELECT rowid FROM points
+                   WHERE compacted = 0 AND timestamp < ?
+                   LIMIT ?""",
+                (cutoff, chunk_size)
+            )
+        ]
+        if not rowids:
+            return 0
+
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS compact_ids (id INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM compact_ids")
+        conn.executemany("INSERT INTO compact_ids (id) VALUES (?)", ((rowid,) for rowid in rowids))
+        conn.execute(
+            """INSERT INTO points (user_id, username, points, hashtag, timestamp, chat_id,
+                                   message_id, is_challenge_bonus, awards, compacted)
+               SELECT user_id, MAX(username), SUM(points), hashtag, MIN(timestamp), chat_id,
+                      NULL, is_challenge_bonus, SUM(awards), 1
+               FROM points
+               WHERE rowid IN (SELECT id FROM compact_ids)
+               GROUP BY user_id, chat_id, hashtag, is_challenge_bonus, DATE(timestamp)"""
+        )
+        conn.execute("DELETE FROM points WHERE rowid IN (SELECT id FROM compact_ids)")
+        conn.execute("DELETE FROM compact_ids")
+    return len(rowids)
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+def auto_vacuum_mode() -> int:
+    """Current PRAGMA auto_vacuum (0 none, 1 full, 2 incremental)"""
+    # En el escritor: un lector abierto antes del VACUUM aún ve el modo anterior
+    with get_pool().writer() as conn:
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+
+def enable_incremental_vacuum() -> int:
+    """Switch the file to auto_vacuum=INCREMENTAL with one full VACUUM
+
+    The VACUUM rewrites the whole database while holding the writer lock and
+    needs as much free disk space as the file, so it is an explicit admin
+    step (python -m handlers.maintenance --enable-incremental-vacuum) and
+    never part of startup. Returns the resulting auto_vacuum mode.
+    """
+    with get_pool().writer() as conn:
+        conn.commit()
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+        return conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+
+def incremental_vacuum(pages: int = 256) -> int:
+    """Release up to `pages` free pages to the filesystem; returns pages still free"""
+    with get_pool().writer() as conn:
+        conn.commit()
+        # executescript avanza la pragma hasta el final (execute sólo libera una página)
+        conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+        return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+# Copias en caliente: pasos pequeños para que el lock del escritor se suelte a menudo
+BACKUP_PAGES_PER_STEP = 64
+BACKUP_STEP_PAUSE = 0.01
+
+def backup_database(dest_path: str, pages: int = BACKUP_PAGES_PER_STEP, pause: float = BACKUP_STEP_PAUSE) -> dict:
+    """Online backup of the database into dest_path, verified with integrity_check
+
+    The copy is written to a temporary file and only renamed into place once
+    the check passes, so dest_path never holds a torn or corrupt snapshot.
+    Returns {"path", "size", "integrity"}; raises if the check fails.
+    """
+    tmp_path = dest_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    target = sqlite3.connect(tmp_path)
+    try:
+        get_pool().backup(target, pages, pause)
+        integrity = target.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        target.close()
+
+    if integrity != "ok":
+        os.remove(tmp_path)
+        raise sqlite3.DatabaseError(f"Copia inválida ({integrity})")
+
+    os.replace(tmp_path, dest_path)
+    return {"path": dest_path, "size": os.path.getsize(dest_path), "integrity": integrity}
+
+def sync_security_state(consumed, blacklist, now: float):
+    """Merge this process's rate-limit usage and blacklist into the shared state
+
+    consumed: [(user_id, action, start, cost)] accepted since the last sync,
+    applied as GCRA increments (tat = MAX(tat, start) + cost) so usage from
+    every process adds up. blacklist: [(user_id, reason, until)]; the later
+    expiry wins. Expired rows are dropped in the same transaction.
+    Returns (active TATs [(user_id, action, tat)], active blacklist
+    [(user_id, reason, until)]) for the caller to merge back.
+    """
+    with get_pool().writer() as conn:
+        conn.executemany(
+            """INSERT INTO rate_limit_state (user_id, action, tat)
+               VALUES (:user_id, :action, :start + :cost)
+               ON CONFLICT(user_id, action) DO UPDATE SET tat = MAX(tat, :start) + :cost""",
+            [
+                {"user_id": user_id, "action": action, "start": start, "cost": cost}
+                for user_id, action, start, cost in consumed
+            ]
+        )
+        conn.executemany(
+            """INSERT INTO security_blacklist (user_id, reason, until) VALUES (?, ?, ?)
+               ON CONFLICT(user_id) DO UPDATE SET
+                   reason = CASE WHEN excluded.until > until THEN excluded.reason ELSE reason END,
+                   until = MAX(until, excluded.until)""",
+            blacklist
+        )
+        conn.execute("DELETE FROM rate_limit_state WHERE tat <= ?", (now,))
+        conn.execute("DELETE FROM security_blacklist WHERE until <= ?", (now,))
+        tats = conn.execute("SELECT user_id, action, tat FROM rate_limit_state").fetchall()
+        active = conn.execute("SELECT user_id, reason, until FROM security_blacklist").fetchall()
+    return [tuple(row) for row in tats], [tuple(row) for row in active]
+
+def add_achievement(user_id: int, achievement_id: int, conn=None):
+    if conn is None:
+        with get_pool().writer() as conn:
+            add_achievement(user_id, achievement_id, conn)
+        invalidate_user_stats(user_id)
+        return
+
+    conn.execute(
         """INSERT OR IGNORE INTO user_achievements (user_id, achievement_id)
            VALUES (?, ?)""",
         (user_id, achievement_id)
     )
-    conn.commit()
-    conn.close()
+
+def message_scored(chat_id: int, message_id: int) -> bool:
+    """True if the message already has awards (a redelivery must not be scored again)"""
+    with get_pool().reader() as conn:
+        row = conn.execute(
+            """SELECT 1 FROM points WHERE chat_id = ? AND message_id = ? LIMIT 1""",
+            (chat_id, message_id)
+        ).fetchone()
+    return row is not None
 
 def get_user_total_points(user_id: int) -> int:
     """Get total points for a user"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        """SELECT COALESCE(SUM(points), 0) FROM points WHERE user_id = ?""",
-        (user_id,)
-    )
-    result = cursor.fetchone()
-    conn.close()
+    with get_pool().reader() as conn:
+        result = conn.execute(
+            """SELECT points FROM users WHERE id = ?""",
+            (user_id,)
+        ).fetchone()
     return result[0] if result else 0
 
+# (puntos mínimos, nivel) de mayor a menor
+LEVEL_THRESHOLDS = (
+    (1000, 5),
+    (500, 4),
+    (250, 3),
+    (100, 2),
+)
+
 def calculate_level(points: int) -> int:
     """Calculate user level based on points"""
-    if points >= 1000:
-        return 5
-    elif points >= 500:
-        return 4
-    elif points >= 250:
-        return 3
-    elif points >= 100:
-        return 2
-    else:
-        return 1
+    for min_points, level in LEVEL_THRESHOLDS:
+        if points >= min_points:
+            return level
+    return 1
+
+def _level_sql(total: str) -> str:
+    """SQL CASE equivalent to calculate_level for the given expression"""
+    whens = " ".join(f"WHEN {total} >= {min_points} THEN {level}" for min_points, level in LEVEL_THRESHOLDS)
+    return f"CASE {whens} ELSE 1 END"
 
 def get_level_info(level: int) -> dict:
     """Get level information including name and requirements"""
@@ -139,28 +894,142 @@ def get_level_info(level: int) -> dict:
     
     return level_data.get(level, level_data[1])
 
+class UserStats:
+    """Compact per-user statistics record.
+
+    Supports stats["points"] and stats.get("points") so handlers written
+    against the old dict keep working.
+    """
+
+    __slots__ = (
+        "username",
+        "points",
+        "count",
+        "level",
+        "level_name",
+        "points_to_next",
+        "recent_contributions",
+        "member_since",
+        "hashtag_counts",
+        "active_days",
+        "daily_challenges_week",
+        "weekly_challenge_done",
+        "achievements",
+    )
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields[name])
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+# Cache de stats por usuario; se invalida en cada premio o logro del usuario.
+# La generación evita guardar un resultado leído antes de una invalidación.
+_stats_cache = {}
+_stats_generation = {}
+_stats_week = None
+_stats_lock = threading.Lock()
+
+def _current_week() -> str:
+    # Misma semana que strftime('%W', 'now') en SQLite (UTC)
+    return datetime.utcnow().strftime("%W")
+
+def get_cached_user_stats(user_id: int):
+    """Return cached stats for a user without touching the database (or None)"""
+    global _stats_week
+    with _stats_lock:
+        week = _current_week()
+        if week != _stats_week:
+            # daily_challenges_week / weekly_challenge_done dependen de la semana
+            _stats_cache.clear()
+            _stats_week = week
+        return _stats_cache.get(user_id)
+
+def invalidate_user_stats(user_id=None):
+    """Drop cached stats for one user (or for everyone when user_id is None)"""
+    with _stats_lock:
+        if user_id is None:
+            _stats_cache.clear()
+            for key in _stats_generation:
+                _stats_generation[key] += 1
+            return
+        _stats_cache.pop(user_id, None)
+        _stats_generation[user_id] = _stats_generation.get(user_id, 0) + 1
+
 def get_user_stats(user_id: int):
     """Get comprehensive user statistics"""
-    conn = get_connection()
+    cached = get_cached_user_stats(user_id)
+    if cached is not None:
+        return cached
+
+    with _stats_lock:
+        generation = _stats_generation.get(user_id, 0)
+
+    with get_pool().reader() as conn:
+        stats = query_user_stats(conn, user_id)
+
+    if stats is not None:
+        with _stats_lock:
+            if _stats_generation.get(user_id, 0) == generation:
+                _stats_cache[user_id] = stats
+    return stats
+
+def query_user_stats(conn, user_id: int):
+    """Read a user's stats on the given connection (no cache)"""
+    # Una sola lectura consistente: agregados por (hashtag, día) + recientes + logros.
+    # awards cuenta los premios que representa cada fila (las compactadas valen varios)
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
     cursor = conn.cursor()
 
-    # Get basic user info and totals
     cursor.execute(
-        """SELECT COALESCE(SUM(points), 0) as total_points, 
-                  COUNT(*) as total_contributions,
-                  username,
-                  MIN(timestamp) as member_since
-           FROM points 
-           WHERE user_id = ?""",
+        """SELECT hashtag,
+                  DATE(timestamp) AS day,
+                  SUM(awards),
+                  SUM(points),
+                  MIN(timestamp),
+                  SUM(CASE WHEN is_challenge_bonus = 1 AND hashtag = '(reto_diario)'
+                           AND strftime('%W', timestamp) = strftime('%W', 'now')
+                      THEN awards ELSE 0 END),
+                  MAX(is_challenge_bonus = 1 AND hashtag LIKE '#%'
+                      AND strftime('%W', timestamp) = strftime('%W', 'now'))
+           FROM points
+           WHERE user_id = ?
+           GROUP BY hashtag, day""",
         (user_id,)
     )
-    basic_stats = cursor.fetchone()
-    
-    if not basic_stats or basic_stats[0] == 0:
-        conn.close()
+    total_points = 0
+    total_contributions = 0
+    member_since = None
+    hashtag_counts = {}
+    active_days = set()
+    daily_challenges_week = 0
+    weekly_done = False
+    for hashtag, day, count, points, first_seen, daily_week, weekly in cursor.fetchall():
+        total_points += points or 0
+        total_contributions += count
+        hashtag_counts[hashtag] = hashtag_counts.get(hashtag, 0) + count
+        active_days.add(day)
+        daily_challenges_week += daily_week or 0
+        weekly_done = weekly_done or bool(weekly)
+        if first_seen and (member_since is None or first_seen < member_since):
+            member_since = first_seen
+
+    if total_points == 0:
         return None
-    
-    total_points, total_contributions, username, member_since = basic_stats
+
     current_level = calculate_level(total_points)
     level_info = get_level_info(current_level)
     
@@ -169,54 +1038,18 @@ def get_user_stats(user_id: int):
     if level_info["next_points"]:
         points_to_next = level_info["next_points"] - total_points
     
-    # Get recent contributions
+    # Get recent contributions (índice points(user_id, timestamp))
     cursor.execute(
-        """SELECT hashtag, points, timestamp
+        """SELECT hashtag, points, timestamp, username
            FROM points 
            WHERE user_id = ? 
            ORDER BY timestamp DESC 
            LIMIT 5""",
         (user_id,)
     )
-    recent_contributions = cursor.fetchall()
-
-    # Get hashtag counts
-    cursor.execute(
-        """SELECT hashtag, COUNT(*) FROM points
-           WHERE user_id = ?
-           GROUP BY hashtag
-           ORDER BY COUNT(*) DESC""",
-        (user_id,)
-    )
-    hashtag_counts = {row[0]: row[1] for row in cursor.fetchall()}
-
-    # Get active days
-    cursor.execute(
-        """SELECT DISTINCT DATE(timestamp) FROM points
-           WHERE user_id = ?""",
-        (user_id,)
-    )
-    active_days = {row[0] for row in cursor.fetchall()}
-
-    # Get daily challenges this week
-    cursor.execute(
-        """SELECT COUNT(*) FROM points
-           WHERE user_id = ? AND is_challenge_bonus = 1
-           AND hashtag = '(reto_diario)'
-           AND strftime('%W', timestamp) = strftime('%W', 'now')""",
-        (user_id,)
-    )
-    daily_challenges_week = cursor.fetchone()[0]
-
-    # Check if weekly challenge is done
-    cursor.execute(
-        """SELECT 1 FROM points
-           WHERE user_id = ? AND is_challenge_bonus = 1
-           AND hashtag LIKE '#%' AND strftime('%W', timestamp) = strftime('%W', 'now')
-           LIMIT 1""",
-        (user_id,)
-    )
-    weekly_done = bool(cursor.fetchone())
+    recent_rows = cursor.fetchall()
+    recent_contributions = [row[:3] for row in recent_rows]
+    username = recent_rows[0][3] if recent_rows else None
 
     # Get achievements
     cursor.execute(
@@ -225,110 +1058,209 @@ def get_user_stats(user_id: int):
         (user_id,)
     )
     achievements = [row[0] for row in cursor.fetchall()]
-
-    conn.close()
     
-    return {
-        "username": username,
-        "points": total_points,
-        "count": total_contributions,
-        "level": current_level,
-        "level_name": level_info["name"],
-        "points_to_next": max(0, points_to_next),
-        "recent_contributions": recent_contributions,
-        "member_since": member_since,
-        "hashtag_counts": hashtag_counts,
-        "active_days": active_days,
-        "daily_challenges_week": daily_challenges_week,
-        "weekly_challenge_done": weekly_done,
-        "achievements": achievements
-    }
+    return UserStats(
+        username=username,
+        points=total_points,
+        count=total_contributions,
+        level=current_level,
+        level_name=level_info["name"],
+        points_to_next=max(0, points_to_next),
+        recent_contributions=recent_contributions,
+        member_since=member_since,
+        hashtag_counts=dict(sorted(hashtag_counts.items(), key=lambda item: item[1], reverse=True)),
+        active_days=active_days,
+        daily_challenges_week=daily_challenges_week,
+        weekly_challenge_done=weekly_done,
+        achievements=achievements
+    )
 
-def get_top10():
-    """Get top 10 users by points including their level"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
+# Rankings en memoria (global y por chat), cargados desde users/chat_user_totals
+# y actualizados en cada commit
+_leaderboard = Leaderboard()
+_chat_leaderboards = {}
+_leaderboard_ready = False
+
+def _get_chat_board(chat_id: int) -> Leaderboard:
+    board = _chat_leaderboards.get(chat_id)
+    if board is None:
+        board = _chat_leaderboards[chat_id] = Leaderboard()
+    return board
+
+def warm_leaderboard():
+    """Load the in-memory leaderboards from the users and chat_user_totals aggregates"""
+    global _leaderboard_ready
+    # Con el lock del escritor para no perder ni duplicar premios concurrentes
+    with get_pool().writer() as conn:
+        rows = conn.execute(
+            """SELECT id, username, points FROM users WHERE points > 0"""
+        ).fetchall()
+        _leaderboard.load(rows)
+
+        chat_rows = {}
+        for chat_id, user_id, username, points in conn.execute(
+            """SELECT c.chat_id, c.user_id, u.username, c.points
+               FROM chat_user_totals c
+               LEFT JOIN users u ON u.id = c.user_id
+               WHERE c.points > 0"""
+        ):
+            chat_rows.setdefault(chat_id, []).append((user_id, username, points))
+        _chat_leaderboards.clear()
+        for chat_id, board_rows in chat_rows.items():
+            _get_chat_board(chat_id).load(board_rows)
+
+        _leaderboard_ready = True
+
+def get_leaderboard(chat_id: int = None) -> Leaderboard:
+    """Get the global (or per-chat) leaderboard, warming it from the database if needed"""
+    if not _leaderboard_ready:
+        warm_leaderboard()
+    if chat_id is None:
+        return _leaderboard
+    return _chat_leaderboards.get(chat_id) or Leaderboard()
+
+def leaderboard_ready() -> bool:
+    return _leaderboard_ready
+
+def get_top10(chat_id: int = None):
+    """Get top 10 users by points including their level (global or for one chat)"""
     try:
-        # Obtener usuarios con sus puntos totales y calcular nivel
-        cursor.execute("""
-            SELECT 
-                username, 
-                SUM(points) as total_points,
-                user_id
-            FROM points
-            GROUP BY user_id, username
-            ORDER BY total_points DESC
-            LIMIT 10
-        """)
-        
-        results = cursor.fetchall()
-        
-        # Agregar nivel calculado a cada usuario
-        top_users = []
-        for username, total_points, user_id in results:
-            level = calculate_level(total_points)
-            top_users.append((username, total_points, level))
-        
-        return top_users
-        
+        return [
+            (username, total_points, calculate_level(total_points))
+            for user_id, username, total_points in get_leaderboard(chat_id).top(10)
+        ]
     except Exception as e:
         print(f"[ERROR] get_top10: {e}")
         return []
-    finally:
-        conn.close()
+
+def get_user_rank(user_id: int, chat_id: int = None):
+    """Get a user's exact position in the global or chat ranking (None if no points)"""
+    board = get_leaderboard(chat_id)
+    rank = board.rank(user_id)
+    if rank is None:
+        return None
+    return {"rank": rank, "points": board.score(user_id), "total_users": len(board)}
+
+def get_rank_neighborhood(user_id: int, radius: int = 2, chat_id: int = None):
+    """Get the users ranked around a user as [(rank, username, points)]"""
+    return [
+        (rank, username, points)
+        for rank, _, username, points in get_leaderboard(chat_id).around(user_id, radius)
+    ]
+
+def get_top_range(start_day: str, end_day: str, limit: int = 10, chat_id: int = None):
+    """Get top users by points earned between two days (inclusive, 'YYYY-MM-DD')
+
+    Sums the daily rollup buckets, so the cost depends on the number of days
+    and active users in the range, never on the size of the ledger.
+    """
+    if chat_id is None:
+        query = """SELECT u.username, SUM(r.points) AS total, COALESCE(u.points, 0)
+                   FROM user_daily_points r
+                   LEFT JOIN users u ON u.id = r.user_id
+                   WHERE r.day BETWEEN ? AND ?
+                   GROUP BY r.user_id
+                   HAVING total > 0
+                   ORDER BY total DESC, r.user_id
+                   LIMIT ?"""
+        params = (start_day, end_day, limit)
+    else:
+        query = """SELECT u.username, SUM(r.points) AS total, COALESCE(u.points, 0)
+                   FROM chat_daily_points r
+                   LEFT JOIN users u ON u.id = r.user_id
+                   WHERE r.chat_id = ? AND r.day BETWEEN ? AND ?
+                   GROUP BY r.user_id
+                   HAVING total > 0
+                   ORDER BY total DESC, r.user_id
+                   LIMIT ?"""
+        params = (chat_id, start_day, end_day, limit)
+
+    try:
+        with get_pool().reader() as conn:
+            rows = conn.execute(query, params).fetchall()
+        # El nivel sigue siendo el del total histórico del usuario
+        return [(username, total, calculate_level(all_time)) for username, total, all_time in rows]
+    except Exception as e:
+        print(f"[ERROR] get_top_range: {e}")
+        return []
+
+def get_week_bounds(today=None):
+    """(start, end) of the last 7 days ending today, as 'YYYY-MM-DD' (UTC)"""
+    today = today or datetime.utcnow().date()
+    return (today - timedelta(days=6)).isoformat(), today.isoformat()
+
+def get_month_bounds(today=None):
+    """(start, end) of the current month up to today, as 'YYYY-MM-DD' (UTC)"""
+    today = today or datetime.utcnow().date()
+    return today.replace(day=1).isoformat(), today.isoformat()
+
+def get_weekly_top10(chat_id: int = None):
+    """Get top 10 users of the last 7 days"""
+    return get_top_range(*get_week_bounds(), limit=10, chat_id=chat_id)
+
+def get_monthly_top10(chat_id: int = None):
+    """Get top 10 users of the current month"""
+    return get_top_range(*get_month_bounds(), limit=10, chat_id=chat_id)
+
+# Registro de chats en memoria, write-through: se carga una vez y cada
+# set_chat_config escribe en la base de datos y después en el registro
+_chat_registry = {}
+_chat_registry_ready = False
+_chat_registry_lock = threading.Lock()
+
+def _load_chat_registry():
+    global _chat_registry_ready
+    with get_pool().reader() as conn:
+        rows = conn.execute(
+            """SELECT chat_id, chat_name, rankings_enabled, challenges_enabled
+               FROM chat_config"""
+        ).fetchall()
+    with _chat_registry_lock:
+        _chat_registry.clear()
+        for chat_id, chat_name, rankings_enabled, challenges_enabled in rows:
+            _chat_registry[chat_id] = {
+                "chat_name": chat_name,
+                "rankings_enabled": bool(rankings_enabled),
+                "challenges_enabled": bool(challenges_enabled)
+            }
+        _chat_registry_ready = True
+
+def chat_registry_ready() -> bool:
+    return _chat_registry_ready
 
 def set_chat_config(chat_id: int, chat_name: str, rankings_enabled: bool = True, challenges_enabled: bool = True):
     """Configure chat settings"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        """INSERT OR REPLACE INTO chat_config (chat_id, chat_name, rankings_enabled, challenges_enabled)
-           VALUES (?, ?, ?, ?)""",
-        (chat_id, chat_name, rankings_enabled, challenges_enabled)
-    )
-    conn.commit()
-    conn.close()
+    if not _chat_registry_ready:
+        _load_chat_registry()
+    with get_pool().writer() as conn:
+        conn.execute(
+            """INSERT OR REPLACE INTO chat_config (chat_id, chat_name, rankings_enabled, challenges_enabled)
+               VALUES (?, ?, ?, ?)""",
+            (chat_id, chat_name, rankings_enabled, challenges_enabled)
+        )
+        conn.commit()
+        with _chat_registry_lock:
+            _chat_registry[chat_id] = {
+                "chat_name": chat_name,
+                "rankings_enabled": bool(rankings_enabled),
+                "challenges_enabled": bool(challenges_enabled)
+            }
 
 def get_chat_config(chat_id: int):
     """Get chat configuration"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        """SELECT chat_name, rankings_enabled, challenges_enabled
-           FROM chat_config 
-           WHERE chat_id = ?""",
-        (chat_id,)
-    )
-    result = cursor.fetchone()
-    conn.close()
-    
-    if result:
-        return {
-            "chat_name": result[0],
-            "rankings_enabled": bool(result[1]),
-            "challenges_enabled": bool(result[2])
-        }
-    return None
+    if not _chat_registry_ready:
+        _load_chat_registry()
+    config = _chat_registry.get(chat_id)
+    return dict(config) if config else None
 
 def get_configured_chats():
     """Get all configured chats"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        """SELECT chat_id, chat_name, rankings_enabled, challenges_enabled
-           FROM chat_config
-           WHERE rankings_enabled = 1 OR challenges_enabled = 1"""
-    )
-    results = cursor.fetchall()
-    conn.close()
-    
+    if not _chat_registry_ready:
+        _load_chat_registry()
+    with _chat_registry_lock:
+        items = list(_chat_registry.items())
     return [
-        {
-            "chat_id": row[0],
-            "chat_name": row[1],
-            "rankings_enabled": bool(row[2]),
-            "challenges_enabled": bool(row[3])
-        }
-        for row in results
+        {"chat_id": chat_id, **config}
+        for chat_id, config in items
+        if config["rankings_enabled"] or config["challenges_enabled"]
     ]
@@ -0,0 +1,249 @@
+# db_async.py - API asíncrona sobre db.py para no bloquear el event loop
+import asyncio
+import functools
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import storage
+from handlers.achievements import announce_achievements
+
+# Un hilo por conexión del pool (lectores + escritor); las escrituras se
+# serializan igualmente en el lock del escritor de db.ConnectionPool
+_executor = ThreadPoolExecutor(
+    max_workers=db.READER_POOL_SIZE + 1,
+    thread_name_prefix="puntum-db",
+)
+
+async def run_db(func, *args, **kwargs):
+    """Ejecuta una función síncrona de db en el executor de base de datos"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+async def run_storage(func, *args, **kwargs):
+    """Llama a un método del backend activo: en el executor sólo si hace I/O"""
+    if storage.get_backend().blocking:
+        return await run_db(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+class PointsWriteBuffer:
+    """Write-behind de premios con group commit.
+
+    Los premios de todos los handlers se acumulan y se escriben juntos en una
+    sola transacción cuando pasan FLUSH_INTERVAL segundos desde el primero
+    pendiente o cuando se llega a MAX_BATCH. Cada llamador espera al commit
+    de su lote, así que al volver su premio ya es visible.
+    """
+
+    FLUSH_INTERVAL = 0.05
+    MAX_BATCH = 64
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, max_batch: int = MAX_BATCH):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending = []               # [(premios, future)]; un grupo nunca se parte
+        self._pending_count = 0
+        self._pending_users = Counter()  # user_id -> premios sin confirmar
+        self._timer = None
+        self._flush_lock = asyncio.Lock()
+
+    async def submit(self, award: dict):
+        """Encola un premio y espera a que su lote quede confirmado"""
+        return await self.submit_many([award])
+
+    async def submit_many(self, awards):
+        """Encola varios premios que se escriben juntos en la misma transacción"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((awards, future))
+        self._pending_count += len(awards)
+        for award in awards:
+            self._pending_users[award["user_id"]] += 1
+
+        if self._pending_count >= self.max_batch:
+            self._schedule_flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._schedule_flush)
+
+        return await future
+
+    def has_pending(self, user_id: int) -> bool:
+        return self._pending_users[user_id] > 0
+
+    async def sync_user(self, user_id: int):
+        """Read-your-writes: vacía el buffer si el usuario tiene premios sin confirmar"""
+        if self.has_pending(user_id):
+            await self.flush()
+
+    def _schedule_flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending:
+            asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Escribe todo lo pendiente en una transacción (los lotes se confirman en orden)"""
+        async with self._flush_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            batch, self._pending = self._pending, []
+            self._pending_count = 0
+            if not batch:
+                return
+
+            awards = [award for group, _ in batch for award in group]
+            try:
+                result = await run_storage(storage.get_backend().add_points_batch, awards)
+            except Exception as e:
+                print(f"[ERROR] Error escribiendo lote de {len(awards)} premios: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                # Los logros de cada usuario se entregan sólo a su primer grupo del lote
+                unlocked = result["unlocked"]
+                written = iter(result["written"])
+                for group, future in batch:
+                    achievements = []
+                    for user_id in {award["user_id"] for award in group}:
+                        achievements.extend(unlocked.pop(user_id, []))
+                    group_written = sum(next(written) for _ in group)
+                    if not future.done():
+                        future.set_result({"ok": True, "achievements": achievements, "written": group_written})
+            finally:
+                for award in awards:
+                    self._pending_users[award["user_id"]] -= 1
+                    if self._pending_users[award["user_id"]] <= 0:
+                        del self._pending_users[award["user_id"]]
+
+write_buffer = PointsWriteBuffer()
+
+async def create_tables():
+    backend = storage.get_backend()
+    return await run_storage(backend.open)
+
+async def add_points(user_id, username, points, hashtag=None, message_text=None, chat_id=None, message_id=None, is_challenge_bonus=False, context=None):
+    """Versión awaitable de db.add_points; el premio se agrupa en el write-behind"""
+    result = await write_buffer.submit(
+        db.make_award(user_id, username, points, hashtag, chat_id, message_id, is_challenge_bonus)
+    )
+
+    if context and chat_id and result["achievements"]:
+        await announce_achievements(context, chat_id, result["achievements"])
+
+    return result
+
+class ScoringUnit:
+    """Unidad de trabajo por mensaje: acumula todos los premios de un update
+    (puntos base y bonus de retos) y los escribe juntos en una transacción."""
+
+    def __init__(self, user_id: int, username: str, chat_id: int = None, message_id: int = None):
+        self.user_id = user_id
+        self.username = username
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.awards = []
+        self.duplicate = False  # True si el mensaje ya estaba puntuado (reentrega)
+
+    def add(self, points: int, hashtag=None, is_challenge_bonus=False):
+        self.awards.append(db.make_award(
+            self.user_id, self.username, points, hashtag,
+            self.chat_id, self.message_id, is_challenge_bonus
+        ))
+
+    @property
+    def total(self) -> int:
+        return sum(award["points"] for award in self.awards)
+
+    async def commit(self):
+        """Escribe todos los premios de una vez; devuelve los logros desbloqueados"""
+        if not self.awards:
+            return []
+        result = await write_buffer.submit_many(self.awards)
+        self.duplicate = result["written"] == 0
+        return result["achievements"]
+
+async def add_achievement(user_id: int, achievement_id: int):
+    backend = storage.get_backend()
+    return await run_storage(backend.add_achievement, user_id, achievement_id)
+
+async def message_scored(user_id: int, chat_id: int, message_id: int) -> bool:
+    """True si el mensaje ya está puntuado (incluye los premios aún en el buffer del usuario)"""
+    await write_buffer.sync_user(user_id)
+    backend = storage.get_backend()
+    return await run_storage(backend.message_scored, chat_id, message_id)
+
+async def get_user_total_points(user_id: int) -> int:
+    await write_buffer.sync_user(user_id)
+    backend = storage.get_backend()
+    return await run_storage(backend.get_user_total_points, user_id)
+
+async def get_user_stats(user_id: int):
+    await write_buffer.sync_user(user_id)
+    backend = storage.get_backend()
+    cached = backend.get_cached_user_stats(user_id)
+    if cached is not None:
+        return cached
+    return await run_storage(backend.get_user_stats, user_id)
+
+async def get_top10(chat_id: int = None):
+    backend = storage.get_backend()
+    if backend.leaderboard_ready():
+        return backend.get_top10(chat_id)  # sólo memoria, no hace falta el executor
+    return await run_storage(backend.get_top10, chat_id)
+
+async def get_user_rank(user_id: int, chat_id: int = None):
+    await write_buffer.sync_user(user_id)
+    backend = storage.get_backend()
+    if backend.leaderboard_ready():
+        return backend.get_user_rank(user_id, chat_id)
+    return await run_storage(backend.get_user_rank, user_id, chat_id)
+
+async def get_rank_neighborhood(user_id: int, radius: int = 2, chat_id: int = None):
+    await write_buffer.sync_user(user_id)
+    backend = storage.get_backend()
+    if backend.leaderboard_ready():
+        return backend.get_rank_neighborhood(user_id, radius, chat_id)
+    return await run_storage(backend.get_rank_neighborhood, user_id, radius, chat_id)
+
+async def get_top_range(start_day: str, end_day: str, limit: int = 10, chat_id: int = None):
+    backend = storage.get_backend()
+    return await run_storage(backend.get_top_range, start_day, end_day, limit, chat_id)
+
+async def get_weekly_top10(chat_id: int = None):
+    return await get_top_range(*db.get_week_bounds(), limit=10, chat_id=chat_id)
+
+async def get_monthly_top10(chat_id: int = None):
+    return await get_top_range(*db.get_month_bounds(), limit=10, chat_id=chat_id)
+
+async def set_chat_config(chat_id: int, chat_name: str, rankings_enabled: bool = True, challenges_enabled: bool = True):
+    backend = storage.get_backend()
+    return await run_storage(backend.set_chat_config, chat_id, chat_name, rankings_enabled, challenges_enabled)
+
+async def get_chat_config(chat_id: int):
+    backend = storage.get_backend()
+    if backend.chat_registry_ready():
+        return backend.get_chat_config(chat_id)
+    return await run_storage(backend.get_chat_config, chat_id)
+
+async def get_configured_chats():
+    backend = storage.get_backend()
+    if backend.chat_registry_ready():
+        return backend.get_configured_chats()
+    return await run_storage(backend.get_configured_chats)
+
+async def sync_security_state(consumed, blacklist, now: float):
+    backend = storage.get_backend()
+    return await run_storage(backend.sync_security_state, consumed, blacklist, now)
+
+async def aclose():
+    """Vacía el write-behind y cierra el executor y el almacenamiento"""
+    await write_buffer.flush()
+    shutdown()
+
+def shutdown():
+    """Espera a las operaciones pendientes y cierra el almacenamiento"""
+    _executor.shutdown(wait=True)
+    storage.get_backend().close()
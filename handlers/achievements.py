@@ -1,58 +1,229 @@
 # handlers/achievements.py
-import datetime
-from db import add_achievement, get_user_stats
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from functools import lru_cache
 
-# Lista de logros predefinidos
+import db
+from outbox import outbox
+
+# Lista de logros predefinidos. "requires" son umbrales mínimos sobre los
+# contadores por usuario; un logro se evalúa sólo cuando cambia uno de ellos.
+#   "hashtag:<tag>"          premios con ese hashtag
+#   "active_days"            días distintos con actividad
+#   "daily_challenges_week"  retos diarios completados esta semana
+#   "weekly_challenge_done"  1 si completó el reto semanal esta semana
 ACHIEVEMENTS = [
     {
         "id": 1,
         "name": "🥇 Primer aporte",
         "description": "Tu primer mensaje con #aporte",
-        "trigger": lambda stats: stats.get("hashtag_counts", {}).get("#aporte", 0) >= 1
+        "requires": {"hashtag:#aporte": 1}
     },
     {
         "id": 2,
         "name": "✍️ Crítico en camino",
         "description": "Has publicado 3 críticas",
-        "trigger": lambda stats: stats.get("hashtag_counts", {}).get("#crítica", 0) >= 3
+        "requires": {"hashtag:#crítica": 3}
     },
     {
         "id": 3,
         "name": "📚 Cinéfilo activo",
         "description": "Participaste 5 días diferentes",
-        "trigger": lambda stats: len(stats.get("active_days", set())) >= 5
+        "requires": {"active_days": 5}
     },
     {
         "id": 4,
         "name": "🔥 Retador constante",
         "description": "Completaste 3 retos diarios en una semana",
-        "trigger": lambda stats: stats.get("daily_challenges_week", 0) >= 3
+        "requires": {"daily_challenges_week": 3}
     },
     {
         "id": 5,
         "name": "🏆 Desafío maestro",
         "description": "Completaste el reto semanal y 3 diarios en una semana",
-        "trigger": lambda stats: stats.get("weekly_challenge_done", False) and stats.get("daily_challenges_week", 0) >= 3
+        "requires": {"weekly_challenge_done": 1, "daily_challenges_week": 3}
     }
 ]
 
-def check_achievements(user_id: int, username: str, context, chat_id: int):
-    """Verifica si un usuario ha desbloqueado nuevos logros"""
-    stats = get_user_stats(user_id)
-    nuevos_logros = []
-
-    for logro in ACHIEVEMENTS:
-        if logro["id"] not in stats.get("achievements", []):
-            if logro["trigger"](stats):
-                nuevos_logros.append(logro)
-                add_achievement(user_id, logro["id"])
-
-    for logro in nuevos_logros:
-        context.bot.send_message(
-            chat_id=chat_id,
-            text=(
-                f"🎉 *¡Nuevo logro desbloqueado!*\n\n"
-                f"{logro['name']}\n{logro['description']}"
-            ),
-            parse_mode="Markdown"
-        )
+def _index_rules(rules):
+    """contador -> logros que dependen de él"""
+    index = {}
+    for rule in rules:
+        for counter in rule["requires"]:
+            index.setdefault(counter, []).append(rule)
+    return index
+
+RULES_BY_COUNTER = _index_rules(ACHIEVEMENTS)
+
+# Usuarios con contadores en memoria (LRU); un usuario expulsado se
+# reconstruye desde sus estadísticas en su próximo premio
+MAX_CACHED_USERS = 5000
+
+# Más allá del mayor umbral no hace falta seguir guardando días distintos
+MAX_ACTIVE_DAYS = max(
+    (rule["requires"]["active_days"] for rule in ACHIEVEMENTS if "active_days" in rule["requires"]),
+    default=0
+)
+
+def _week_of(timestamp) -> str:
+    # Misma semana que strftime('%W', ...) de las stats (UTC)
+    if timestamp:
+        return _week_of_day(timestamp[:10])
+    return datetime.utcnow().strftime("%W")
+
+@lru_cache(maxsize=1024)
+def _week_of_day(day: str) -> str:
+    # Las importaciones de historial repiten los mismos días miles de veces
+    return date.fromisoformat(day).strftime("%W")
+
+def _day_of(timestamp) -> str:
+    return timestamp[:10] if timestamp else datetime.utcnow().strftime("%Y-%m-%d")
+
+class UserCounters:
+    """Contadores que alimentan los logros de un usuario"""
+
+    __slots__ = ("hashtags", "days", "week", "daily_challenges_week", "weekly_challenge_done", "unlocked")
+
+    def __init__(self, week: str):
+        self.hashtags = {}
+        self.days = set()
+        self.week = week
+        self.daily_challenges_week = 0
+        self.weekly_challenge_done = 0
+        self.unlocked = set()
+
+    @classmethod
+    def from_stats(cls, stats):
+        counters = cls(_week_of(None))
+        if stats:
+            counters.hashtags = {tag: count for tag, count in stats.hashtag_counts.items() if tag}
+            counters.days = set(sorted(stats.active_days)[:MAX_ACTIVE_DAYS])
+            counters.daily_challenges_week = stats.daily_challenges_week
+            counters.weekly_challenge_done = int(stats.weekly_challenge_done)
+            counters.unlocked = set(stats.achievements)
+        return counters
+
+    def value(self, counter: str) -> int:
+        if counter.startswith("hashtag:"):
+            return self.hashtags.get(counter[len("hashtag:"):], 0)
+        if counter == "active_days":
+            return len(self.days)
+        return getattr(self, counter)
+
+    def apply(self, award) -> set:
+        """Aplica un premio y devuelve los contadores que cambiaron"""
+        changed = set()
+        awards = award.get("awards", 1)
+
+        if award["hashtag"]:
+            self.hashtags[award["hashtag"]] = self.hashtags.get(award["hashtag"], 0) + awards
+            changed.add(f"hashtag:{award['hashtag']}")
+
+        if len(self.days) < MAX_ACTIVE_DAYS:
+            day = _day_of(award["timestamp"])
+            if day not in self.days:
+                self.days.add(day)
+                changed.add("active_days")
+
+        week = _week_of(award["timestamp"])
+        current_week = _week_of(None)
+        if self.week != current_week:
+            self.week = current_week
+            self.daily_challenges_week = 0
+            self.weekly_challenge_done = 0
+        if award["is_challenge_bonus"] and week == current_week:
+            if award["hashtag"] == "(reto_diario)":
+                self.daily_challenges_week += awards
+                changed.add("daily_challenges_week")
+            elif (award["hashtag"] or "").startswith("#") and not self.weekly_challenge_done:
+                self.weekly_challenge_done = 1
+                changed.add("weekly_challenge_done")
+
+        return changed
+
+class AchievementEngine:
+    """Motor incremental: mantiene contadores por usuario y evalúa sólo las
+    reglas cuyas entradas cambiaron con cada premio confirmado."""
+
+    def __init__(self, rules=ACHIEVEMENTS, max_users: int = MAX_CACHED_USERS):
+        self._rules_by_counter = _index_rules(rules)
+        self._all_rules = list(rules)
+        self._users = OrderedDict()  # user_id -> UserCounters, el más reciente al final
+        self.max_users = max_users
+        self._scope = None
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self._users.clear()
+            self._scope = None
+
+    def on_commit(self, txn, awards):
+        """Listener de db: se llama dentro de la escritura tras cada commit"""
+        by_user = {}
+        for award in awards:
+            by_user.setdefault(award["user_id"], []).append(award)
+
+        unlocked = {}
+        with self._lock:
+            if txn.scope is not self._scope:
+                # Otro almacenamiento: los contadores cargados ya no valen
+                self._users.clear()
+                self._scope = txn.scope
+            for user_id, user_awards in by_user.items():
+                counters = self._users.get(user_id)
+                if counters is None:
+                    # Primera vez: la lectura ya incluye los premios recién confirmados
+                    counters = UserCounters.from_stats(txn.user_stats(user_id))
+                    self._users[user_id] = counters
+                    if len(self._users) > self.max_users:
+                        self._users.popitem(last=False)
+                    candidates = self._all_rules
+                else:
+                    self._users.move_to_end(user_id)
+                    changed = set()
+                    for award in user_awards:
+                        changed |= counters.apply(award)
+                    candidates = self._candidates(changed)
+
+                nuevos = self._evaluate(counters, candidates)
+                for logro in nuevos:
+                    txn.add_achievement(user_id, logro["id"])
+                if nuevos:
+                    unlocked[user_id] = nuevos
+        return unlocked
+
+    def _candidates(self, changed):
+        seen = set()
+        candidates = []
+        for counter in changed:
+            for rule in self._rules_by_counter.get(counter, ()):
+                if rule["id"] not in seen:
+                    seen.add(rule["id"])
+                    candidates.append(rule)
+        return candidates
+
+    def _evaluate(self, counters, candidates):
+        nuevos = []
+        for rule in candidates:
+            if rule["id"] in counters.unlocked:
+                continue
+            if all(counters.value(counter) >= minimum for counter, minimum in rule["requires"].items()):
+                counters.unlocked.add(rule["id"])
+                nuevos.append(rule)
+        return nuevos
+
+achievement_engine = AchievementEngine()
+db.register_commit_listener(achievement_engine.on_commit)
+
+def format_achievement(logro) -> str:
+    return (
+        f"🎉 *¡Nuevo logro desbloqueado!*\n\n"
+        f"{logro['name']}\n{logro['description']}"
+    )
+
+async def announce_achievements(context, chat_id: int, logros):
+    """Anuncia en el chat los logros desbloqueados por un premio"""
+    for logro in logros:
+        await outbox.send(context.bot, chat_id, format_achievement(logro), parse_mode="Markdown")
@@ -0,0 +1,79 @@
+# handlers/backup.py - Copias de seguridad en caliente de puntum.db
+import asyncio
+import glob
+import os
+from datetime import datetime
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+import db
+import storage
+from db_async import run_db
+from outbox import outbox
+from rules import is_admin
+
+# Directorio y número de copias que se conservan (las más antiguas se borran)
+BACKUP_DIR = os.environ.get("BACKUP_DIR", "backups")
+BACKUP_KEEP = int(os.environ.get("BACKUP_KEEP", "7"))
+BACKUP_INTERVAL_HOURS = int(os.environ.get("BACKUP_INTERVAL_HOURS", "24"))
+
+# Una sola copia a la vez (job y comando comparten el lock)
+_backup_lock = asyncio.Lock()
+
+def snapshot_path(now=None) -> str:
+    now = now or datetime.utcnow()
+    return os.path.join(BACKUP_DIR, f"puntum-{now.strftime('%Y%m%d-%H%M%S')}.db")
+
+def rotate_backups(keep: int = BACKUP_KEEP) -> list:
+    """Borra las copias más antiguas y devuelve las que se eliminaron"""
+    # El nombre lleva la fecha, así que el orden alfabético es el cronológico
+    snapshots = sorted(glob.glob(os.path.join(BACKUP_DIR, "puntum-*.db")))
+    removed = snapshots[:-keep] if keep > 0 else []
+    for path in removed:
+        os.remove(path)
+    return removed
+
+async def run_backup() -> dict:
+    """Copia la base de datos por pasos en el executor, la verifica y rota las antiguas"""
+    async with _backup_lock:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        result = await run_db(db.backup_database, snapshot_path())
+        result["removed"] = await run_db(rotate_backups, BACKUP_KEEP)
+        return result
+
+async def backup_job(context):
+    """Job periódico de copia de seguridad"""
+    if storage.get_backend().name != "sqlite":
+        return
+    try:
+        result = await run_backup()
+        print(f"[INFO] Copia de seguridad creada: {result['path']} ({result['size']} bytes)")
+    except Exception as e:
+        print(f"[ERROR] Error en backup_job: {e}")
+
+async def cmd_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Comando para administradores: crear una copia de seguridad ahora"""
+    if not is_admin(update.effective_user.id):
+        await outbox.reply(update.message, "❌ Solo administradores pueden usar este comando")
+        return
+
+    if storage.get_backend().name != "sqlite":
+        await outbox.reply(update.message, "ℹ️ El almacenamiento actual no usa base de datos")
+        return
+
+    if _backup_lock.locked():
+        await outbox.reply(update.message, "⏳ Ya hay una copia de seguridad en curso")
+        return
+
+    try:
+        result = await run_backup()
+        await outbox.reply(update.message,
+            f"✅ Copia creada: `{os.path.basename(result['path'])}`\n"
+            f"📦 {result['size'] // 1024} KB · integridad: {result['integrity']}\n"
+            f"🗑️ Copias antiguas eliminadas: {len(result['removed'])}",
+            parse_mode='Markdown'
+        )
+    except Exception as e:
+        print(f"[ERROR] Error en cmd_backup: {e}")
+        await outbox.reply(update.message, f"❌ Error creando la copia: {e}")
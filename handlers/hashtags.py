@@ -1,20 +1,12 @@
 from telegram import Update
-from db import add_points
+from db_async import add_points
+from outbox import outbox
 from handlers.retos import get_weekly_challenge, validate_challenge_submission, get_current_challenge
 from handlers.retos_diarios import get_today_challenge
 from handlers.phrases import get_random_reaction
+from rules import get_rules
 import re
 
-POINTS = {
-    "#aporte": 3,
-    "#recomendación": 5,
-    "#reseña": 7,
-    "#crítica": 10,
-    "#debate": 4,
-    "#pregunta": 2,
-    "#spoiler": 1,
-}
-
 user_hashtag_cache = {}
 
 def count_words(text):
@@ -57,7 +49,7 @@ async def handle_hashtags(update: Update, context):
     print(f"[DEBUG] handle_hashtags procesando: {text[:50]}...")
 
     # Procesar hashtags básicos
-    for tag, value in POINTS.items():
+    for tag, value in get_rules().points.items():
         if tag in text.lower():
             # Verificar spam
             if is_spam(user.id, tag):
@@ -91,7 +83,7 @@ async def handle_hashtags(update: Update, context):
     if points > 0 or warnings:
         # Agregar puntos básicos a la base de datos
         try:
-            result = add_points(
+            result = await add_points(
                 user.id,
                 user.username,
                 points,
@@ -129,7 +121,7 @@ async def handle_hashtags(update: Update, context):
                     if validate_challenge_submission(current_challenge, text):
                         bonus = current_challenge.get("bonus_points", 10)
                         try:
-                            bonus_result = add_points(
+                            bonus_result = await add_points(
                                 user.id,
                                 user.username,
                                 bonus,
@@ -168,7 +160,7 @@ async def handle_hashtags(update: Update, context):
                 if cumple:
                     daily_bonus = daily.get("bonus_points", 5)
                     try:
-                        bonus_result = add_points(
+                        bonus_result = await add_points(
                             user.id,
                             user.username,
                             daily_bonus,
@@ -188,7 +180,7 @@ async def handle_hashtags(update: Update, context):
         # Enviar respuesta si hay contenido
         if response.strip():
             try:
-                await update.message.reply_text(response.strip())
+                await outbox.reply(update.message, response.strip())
             except Exception as e:
                 print(f"[ERROR] Error enviando respuesta: {e}")
 
@@ -196,6 +188,6 @@ async def handle_hashtags(update: Update, context):
     spam_words = ["gratis", "oferta", "descuento", "promoción", "gana dinero", "click aquí"]
     if any(spam_word in text.lower() for spam_word in spam_words):
         try:
-            await update.message.reply_text("🛑 ¡Cuidado con el spam! Esto es un grupo de cine, no de ofertas.")
+            await outbox.reply(update.message, "🛑 ¡Cuidado con el spam! Esto es un grupo de cine, no de ofertas.")
         except Exception as e:
             print(f"[ERROR] Error enviando advertencia de spam: {e}")
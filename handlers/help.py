@@ -1,6 +1,8 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 
+from outbox import outbox
+
 async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
     mensaje = (
         "🎬 *Bienvenido a Puntum Bot: cinefilia sin censura* 🎬\n\n"
@@ -34,4 +36,4 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "_Puntum Bot no es solo un bot\\. Es una experiencia Tarantinesca\\._ 💥"
     )
     
-    await update.message.reply_markdown_v2(mensaje)
+    await outbox.reply(update.message, mensaje, parse_mode="MarkdownV2")
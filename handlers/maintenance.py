@@ -0,0 +1,64 @@
+# handlers/maintenance.py - Tareas periódicas de mantenimiento de la base de datos
+import argparse
+import asyncio
+import os
+
+import db
+import storage
+from db_async import run_db
+
+# Días de detalle que se conservan en el ledger antes de compactar
+POINTS_RETENTION_DAYS = int(os.environ.get("POINTS_RETENTION_DAYS", "90"))
+# Pausa entre lotes para que los mensajes en vivo tomen el lock de escritura
+CHUNK_PAUSE = 0.05
+VACUUM_PAGES_PER_STEP = 256
+
+async def compaction_job(context):
+    """Job diario: compacta el ledger antiguo por lotes y libera espacio"""
+    if storage.get_backend().name != "sqlite":
+        return  # sólo el ledger de SQLite crece con el tiempo
+    try:
+        folded = 0
+        while True:
+            rows = await run_db(db.compact_points_chunk, POINTS_RETENTION_DAYS)
+            if not rows:
+                break
+            folded += rows
+            await asyncio.sleep(CHUNK_PAUSE)
+
+        # incremental_vacuum también por pasos acotados (sólo hace algo en modo INCREMENTAL)
+        if await run_db(db.auto_vacuum_mode) == db.AUTO_VACUUM_INCREMENTAL:
+            free_pages = await run_db(db.incremental_vacuum, VACUUM_PAGES_PER_STEP)
+            while free_pages:
+                await asyncio.sleep(CHUNK_PAUSE)
+                remaining = await run_db(db.incremental_vacuum, VACUUM_PAGES_PER_STEP)
+                if remaining >= free_pages:
+                    break
+                free_pages = remaining
+        elif folded:
+            print("[INFO] auto_vacuum no es INCREMENTAL: el espacio liberado no se devuelve al disco "
+                  "(python -m handlers.maintenance --enable-incremental-vacuum con el bot parado)")
+
+        if folded:
+            print(f"[INFO] Compactación: {folded} filas antiguas plegadas")
+    except Exception as e:
+        print(f"[ERROR] Error en compaction_job: {e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Mantenimiento de puntum.db (ejecutar con el bot parado)")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="pasa la base a auto_vacuum=INCREMENTAL (un VACUUM completo; necesita tanto espacio libre como ocupa)")
+    parser.add_argument("--db", help="base de datos (por defecto puntum.db)")
+    args = parser.parse_args()
+
+    if args.db:
+        db.DB_PATH = args.db
+    if args.enable_incremental_vacuum:
+        mode = db.enable_incremental_vacuum()
+        print(f"[INFO] auto_vacuum = {mode}")
+    else:
+        parser.print_help()
+    db.close_pool()
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,7 @@
 # phrases.py (nuevo sistema de frases cinéfilas por categoría)
 import random
-from telegram import Update
-from telegram.ext import ContextTypes
+
+from rules import get_rules
 
 # Historial simple para evitar repeticiones por usuario
 last_reaction_by_user = {}
@@ -56,23 +56,21 @@ def get_random_reaction(hashtag: str, user_id: int) -> str:
     last_reaction_by_user[user_id] = elegida
     return elegida
 
-# Middleware function for handling phrase reactions
-async def phrase_middleware(update: Update, context: ContextTypes.DEFAULT_TYPE):
+# Etapa del pipeline para las reacciones cinéfilas
+async def phrase_stage(ctx):
     """
-    Middleware that detects hashtags in messages and responds with cinematic phrases
+    Pipeline stage that reacts with a cinematic phrase to the first hashtag found,
+    unless an earlier stage already reacted (scored hashtags carry their own reaction)
+    or the message was scored with 0 points
     """
-    if not update.message or not update.message.text:
+    if ctx.reacted or ctx.points == 0:
         return
     
-    message_text = update.message.text.lower()
-    user_id = update.effective_user.id
-    
-    # List of supported hashtags
-    hashtags = ["#aporte", "#recomendación", "#reseña", "#crítica", "#debate", "#pregunta", "#spoiler"]
+    analysis = ctx.analysis
     
-    # Check if any hashtag is present in the message
-    for hashtag in hashtags:
-        if hashtag in message_text:
-            reaction = get_random_reaction(hashtag, user_id)
-            await update.message.reply_text(reaction)
+    # Check if any scoring hashtag (rules.json) is present in the message
+    for hashtag in get_rules().hashtags:
+        if analysis.contains(hashtag):
+            ctx.say(get_random_reaction(hashtag, ctx.user_id))
+            ctx.reacted = True
             break  # Only respond to the first hashtag found
@@ -0,0 +1,114 @@
+# handlers/pipeline.py - Un recorrido por mensaje y una sola respuesta
+import logging
+
+from telegram.helpers import escape_markdown
+
+from analysis import get_analysis
+from outbox import outbox
+
+logger = logging.getLogger(__name__)
+
+MAX_REPLY_LENGTH = 4000  # Límite de Telegram (4096) con margen
+
+def _truncate(text: str, limit: int, escape: bool) -> str:
+    """Prefijo de text que ocupa limit caracteres como mucho (ya escapado si escape)"""
+    if not escape:
+        return text[:max(limit, 0)]
+    result = []
+    for ch in text:
+        ch = escape_markdown(ch)
+        limit -= len(ch)
+        if limit < 0:
+            break
+        result.append(ch)
+    return "".join(result)
+
+class PipelineContext:
+    """Estado de un mensaje mientras pasa por las etapas del pipeline.
+
+    Las etapas no responden por su cuenta: añaden partes con say() y, si el
+    mensaje no debe seguir, llaman a stop(). Al final se envía una sola
+    respuesta con todas las partes (o ninguna).
+    """
+
+    __slots__ = ("update", "context", "analysis", "parts", "stopped", "reacted", "points")
+
+    def __init__(self, update, context):
+        self.update = update
+        self.context = context
+        self.analysis = get_analysis(update)
+        self.parts = []        # [(texto, es_markdown)]
+        self.stopped = False
+        self.reacted = False   # alguna etapa ya reaccionó al hashtag
+        self.points = None     # puntos del mensaje (None si no se llegó a puntuar)
+
+    @property
+    def text(self) -> str:
+        return self.update.message.text
+
+    @property
+    def user_id(self) -> int:
+        return self.update.effective_user.id
+
+    @property
+    def chat_id(self) -> int:
+        return self.update.effective_chat.id
+
+    def say(self, text: str, markdown: bool = False):
+        """Añade una parte a la respuesta (markdown: ya viene con formato Markdown)"""
+        if text:
+            self.parts.append((text, markdown))
+
+    def stop(self, silent: bool = False):
+        """No ejecutar más etapas (silent: descartar también la respuesta)"""
+        self.stopped = True
+        if silent:
+            self.parts.clear()
+
+    def render(self):
+        """Texto final y parse_mode; si alguna parte es Markdown se escapan las demás
+
+        Si no cabe en MAX_REPLY_LENGTH se corta entre partes: sólo una parte de
+        texto plano se recorta, y antes de escaparla, para no partir una entidad
+        ni un escape de Markdown.
+        """
+        markdown_mode = any(markdown for _, markdown in self.parts)
+        separator = "\n\n" if markdown_mode else "\n"
+        pieces = []
+        length = 0
+        for part, markdown in self.parts:
+            text = escape_markdown(part) if markdown_mode and not markdown else part
+            room = MAX_REPLY_LENGTH - length - (len(separator) if pieces else 0)
+            if len(text) > room:
+                if not markdown:
+                    text = _truncate(part, room - 3, escape=markdown_mode)
+                    if text:
+                        pieces.append(text + "...")
+                break
+            pieces.append(text)
+            length += len(text) + (len(separator) if len(pieces) > 1 else 0)
+        if not pieces:
+            # Una sola parte Markdown más larga que el límite: va como texto plano
+            return self.parts[0][0][:MAX_REPLY_LENGTH] + "...", None
+        return separator.join(pieces), "Markdown" if markdown_mode else None
+
+    async def send(self):
+        """Encola la respuesta acumulada en el outbox (un envío como mucho)"""
+        if not self.parts:
+            return
+        text, parse_mode = self.render()
+        await outbox.reply(self.update.message, text, parse_mode=parse_mode)
+
+async def run_pipeline(update, context, stages):
+    """Pasa el mensaje por las etapas en orden y envía una sola respuesta"""
+    if not update.message or not update.message.text:
+        return
+    ctx = PipelineContext(update, context)
+    for stage in stages:
+        try:
+            await stage(ctx)
+        except Exception as e:
+            logger.error(f"Error in pipeline stage {stage.__name__}: {e}")
+        if ctx.stopped:
+            break
+    await ctx.send()
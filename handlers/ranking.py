@@ -1,7 +1,9 @@
-from db import get_top10
+from db_async import get_top10, get_weekly_top10, get_monthly_top10
 from telegram import Update
 import datetime
 import random
+from db import get_week_bounds
+from outbox import outbox
 
 # Frases cinematográficas para el ranking
 RANKING_PHRASES = [
@@ -20,26 +22,44 @@ CLOSING_PHRASES = [
     "🎯 Próximo capítulo: domingo que viene, misma hora"
 ]
 
+def ranking_scope(update: Update):
+    """chat_id del ranking a usar: el del grupo, o None (global) en privado"""
+    chat = update.effective_chat
+    if chat and chat.type in ("group", "supergroup"):
+        return chat.id
+    return None
+
 async def cmd_ranking(update: Update, context):
     """Comando manual para mostrar ranking actual"""
     print(f"[DEBUG] Comando /ranking ejecutado por {update.effective_user.first_name}")
     print(f"[DEBUG] Chat ID: {update.effective_chat.id}")
     
     try:
-        # Debug de la función get_top10
-        print("[DEBUG] Llamando a get_top10()...")
-        top = get_top10()
-        print(f"[DEBUG] Resultado de get_top10(): {top}")
+        # En grupos, cada chat tiene su propio ranking; en privado, el global
+        chat_id = ranking_scope(update)
+
+        # /ranking semana y /ranking mes usan las cubetas diarias
+        periodo = context.args[0].lower() if context.args else ""
+        if periodo in ("semana", "semanal"):
+            titulo = "🎬 *TOP 10 CINÉFILOS DE LA SEMANA*\n\n"
+            top = await get_weekly_top10(chat_id)
+        elif periodo in ("mes", "mensual"):
+            titulo = "🎬 *TOP 10 CINÉFILOS DEL MES*\n\n"
+            top = await get_monthly_top10(chat_id)
+        else:
+            titulo = "🎬 *TOP 10 CINÉFILOS ACTUALES*\n\n"
+            top = await get_top10(chat_id)
+        print(f"[DEBUG] Resultado del ranking ({periodo or 'global'}): {top}")
         print(f"[DEBUG] Tipo de dato: {type(top)}")
         print(f"[DEBUG] Longitud: {len(top) if top else 'None'}")
         
         if not top:
             print("[DEBUG] No hay datos - enviando mensaje de no participantes")
-            await update.message.reply_text("📝 Aún no hay participantes. ¡Sé el primero en usar hashtags!")
+            await outbox.reply(update.message, "📝 Aún no hay participantes. ¡Sé el primero en usar hashtags!")
             return
         
         print("[DEBUG] Construyendo mensaje del ranking...")
-        msg = "🎬 *TOP 10 CINÉFILOS ACTUALES*\n\n"
+        msg = titulo
         
         # Iterar sobre los datos correctamente
         for i, (username, points, level) in enumerate(top, 1):
@@ -63,7 +83,7 @@ async def cmd_ranking(update: Update, context):
         print(f"[DEBUG] Mensaje construido: {msg[:200]}...")  # Solo primeros 200 chars
         print("[DEBUG] Enviando mensaje...")
         
-        await update.message.reply_text(msg, parse_mode='Markdown')
+        await outbox.reply(update.message, msg, parse_mode='Markdown')
         print("[DEBUG] Mensaje enviado exitosamente")
         
     except Exception as e:
@@ -73,7 +93,7 @@ async def cmd_ranking(update: Update, context):
         print(f"[ERROR] Traceback: {traceback.format_exc()}")
         
         # Enviar mensaje de error al usuario
-        await update.message.reply_text(
+        await outbox.reply(update.message,
             f"❌ Error al obtener el ranking: {str(e)}\n"
             "Contacta al administrador si persiste el problema."
         )
@@ -90,12 +110,9 @@ async def ranking_job(context):
             print("[ERROR] No hay chat_id configurado para ranking automático")
             return
         
-        top = get_top10()
+        top = await get_weekly_top10(chat_id)
         if not top:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="📝 Esta semana no hubo participación. ¡Anímense con los hashtags!"
-            )
+            await outbox.send(context.bot, chat_id, "📝 Esta semana no hubo participación. ¡Anímense con los hashtags!")
             return
         
         # Crear mensaje épico del ranking
@@ -128,8 +145,8 @@ async def ranking_job(context):
         
         msg += f"\n{random.choice(CLOSING_PHRASES)}"
         
-        await context.bot.send_message(chat_id=chat_id, text=msg, parse_mode='Markdown')
-        print(f"[INFO] Ranking semanal enviado a chat {chat_id}")
+        await outbox.send(context.bot, chat_id, msg, parse_mode='Markdown')
+        print(f"[INFO] Ranking semanal encolado para chat {chat_id}")
         
         # Opcional: Reset de puntos semanales (descomentar si quieres ranking semanal real)
         # reset_weekly_points()
@@ -149,11 +166,11 @@ def get_next_sunday():
     return next_sunday.strftime("%d/%m/%Y")
 
 def get_last_week_range():
-    """Obtiene el rango de la semana pasada"""
-    today = datetime.date.today()
-    last_sunday = today - datetime.timedelta(days=today.weekday() + 1)
-    last_saturday = last_sunday + datetime.timedelta(days=6)
-    return f"{last_sunday.strftime('%d/%m')} - {last_saturday.strftime('%d/%m')}"
+    """Obtiene el rango de los últimos 7 días (el mismo que usa el ranking semanal)"""
+    start, end = get_week_bounds()
+    start = datetime.date.fromisoformat(start)
+    end = datetime.date.fromisoformat(end)
+    return f"{start.strftime('%d/%m')} - {end.strftime('%d/%m')}"
 
 def reset_weekly_points():
     """Reinicia puntos semanales (opcional - usar solo si quieres ranking semanal real)"""
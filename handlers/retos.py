@@ -2,35 +2,21 @@ from telegram import Update
 from telegram.ext import ContextTypes
 from datetime import datetime
 
-# Retos predefinidos con validaciones string-based
-WEEKLY_CHALLENGES = [
-    {
-        "id": 1,
-        "title": "Documental Latinoamericano",
-        "description": "Recomienda un documental latinoamericano anterior al año 2000",
-        "hashtag": "#recomendación",
-        "bonus_points": 10,
-        "validation_keywords": ["argentina", "méxico", "brasil", "chile", "colombia", "perú", "venezuela", "bolivia", "ecuador"],
-        "validation_type": "country_keywords"
-    },
-    {
-        "id": 2,
-        "title": "Cine de Terror Clásico",
-        "description": "Reseña una película de terror de los años 70-80",
-        "hashtag": "#reseña",
-        "bonus_points": 15,
-        "validation_keywords": ["70", "80", "1970", "1980", "terror", "horror"],
-        "validation_type": "genre_keywords"
-    },
-]
+from matcher import contains
+from rules import get_rules
+from outbox import outbox
 
-def get_weekly_challenge():
-    """Devuelve el reto predefinido en función de la semana actual"""
-    week_number = datetime.now().isocalendar()[1]
-    return WEEKLY_CHALLENGES[week_number % len(WEEKLY_CHALLENGES)]
+def get_weekly_challenge(when=None):
+    """Devuelve el reto predefinido (weekly_challenges de rules.json) de la semana actual o la de `when`"""
+    week_number = (when or datetime.now()).isocalendar()[1]
+    challenges = get_rules().weekly_challenges
+    return challenges[week_number % len(challenges)]
 
-def get_current_challenge():
+def get_current_challenge(when=None):
     """Alias para get_weekly_challenge para mantener compatibilidad"""
+    if when is not None:
+        # Historial: el reto personalizado sólo vale para la semana en curso
+        return get_weekly_challenge(when)
     try:
         # Primero intenta obtener un reto personalizado desde la DB
         from db import get_challenge_from_db  # Solo importar si existe
@@ -62,13 +48,10 @@ def clear_challenge_safe():
         print(f"[WARNING] clear_challenge no disponible: {e}")
         return False
 
-def validate_challenge_submission(challenge, message_text):
+def validate_challenge_submission(challenge, message_text, matches=None):
     """Valida si un mensaje cumple con los requisitos del reto"""
-    message_text = message_text.lower()
-    if challenge.get("validation_type") == "country_keywords":
-        return any(keyword in message_text for keyword in challenge["validation_keywords"])
-    elif challenge.get("validation_type") == "genre_keywords":
-        return any(keyword in message_text for keyword in challenge["validation_keywords"])
+    if challenge.get("validation_type") in ("country_keywords", "genre_keywords"):
+        return any(contains(message_text, keyword, matches) for keyword in challenge["validation_keywords"])
     return False
 
 async def reto_job(context: ContextTypes.DEFAULT_TYPE):
@@ -89,12 +72,8 @@ async def reto_job(context: ContextTypes.DEFAULT_TYPE):
             f"🏆 Bonus: +{reto['bonus_points']} puntos adicionales"
         )
         
-        await context.bot.send_message(
-            chat_id=chat_id,
-            text=text,
-            parse_mode="Markdown"
-        )
-        print(f"[INFO] Reto semanal enviado al chat {chat_id}")
+        await outbox.send(context.bot, chat_id, text, parse_mode="Markdown")
+        print(f"[INFO] Reto semanal encolado para el chat {chat_id}")
         
     except Exception as e:
         print(f"[ERROR] Error en reto_job: {e}")
@@ -109,28 +88,28 @@ async def cmd_reto(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"*Hashtag:* `{reto['hashtag']}`\n"
         f"*Bonus:* +{reto['bonus_points']} puntos"
     )
-    await update.message.reply_text(text, parse_mode="Markdown")
+    await outbox.reply(update.message, text, parse_mode="Markdown")
 
 async def cmd_nuevo_reto(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando para admin: limpiar reto personalizado"""
     try:
         result = set_challenge_safe("")
         if result:
-            await update.message.reply_text("✅ El reto personalizado ha sido limpiado. Se usará el reto automático.")
+            await outbox.reply(update.message, "✅ El reto personalizado ha sido limpiado. Se usará el reto automático.")
         else:
-            await update.message.reply_text("⚠️ Función de retos personalizados no disponible. Usando reto automático.")
+            await outbox.reply(update.message, "⚠️ Función de retos personalizados no disponible. Usando reto automático.")
     except Exception as e:
         print(f"[ERROR] Error en cmd_nuevo_reto: {e}")
-        await update.message.reply_text("❌ Error al limpiar el reto personalizado.")
+        await outbox.reply(update.message, "❌ Error al limpiar el reto personalizado.")
 
 async def cmd_borrar_reto(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando para admin: borrar reto personalizado"""
     try:
         result = clear_challenge_safe()
         if result:
-            await update.message.reply_text("🗑️ Reto semanal personalizado eliminado.")
+            await outbox.reply(update.message, "🗑️ Reto semanal personalizado eliminado.")
         else:
-            await update.message.reply_text("⚠️ Función de retos personalizados no disponible.")
+            await outbox.reply(update.message, "⚠️ Función de retos personalizados no disponible.")
     except Exception as e:
         print(f"[ERROR] Error en cmd_borrar_reto: {e}")
-        await update.message.reply_text("❌ Error al borrar el reto personalizado.")
+        await outbox.reply(update.message, "❌ Error al borrar el reto personalizado.")
@@ -1,17 +1,10 @@
 from datetime import datetime
 
-def get_today_challenge():
-    # Reto diario por día de la semana
-    weekday = datetime.now().weekday()
+from rules import get_rules
 
-    retos = [
-        {"keywords": ["terror", "miedo"], "bonus_points": 5},
-        {"hashtag": "#recomendación", "bonus_points": 4, "min_words": 30},
-        {"keywords": ["Oscar", "ganadora"], "bonus_points": 6},
-        {"hashtag": "#reseña", "bonus_points": 7, "min_words": 50},
-        {"keywords": ["animación", "dibujos"], "bonus_points": 5},
-        {"keywords": ["blanco y negro"], "bonus_points": 5},
-        {"hashtag": "#debate", "bonus_points": 6, "min_words": 20}
-    ]
-
-    return retos[weekday % len(retos)]
\ No newline at end of file
+def get_today_challenge(when=None):
+    # Reto diario por día de la semana (lunes = 0) de hoy o de la fecha `when`,
+    # según daily_challenges de rules.json
+    weekday = (when or datetime.now()).weekday()
+    challenges = get_rules().daily_challenges
+    return challenges[weekday % len(challenges)]
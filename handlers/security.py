@@ -1,83 +1,164 @@
 # handlers/security.py - Sistema de seguridad y manejo de hashtags
+import os
 import time
 import re
 from functools import wraps
 from typing import Dict, List, Optional
 import logging
 from telegram import Update
+from db_async import ScoringUnit, message_scored, sync_security_state
+from analysis import MessageAnalysis
+from matcher import register_terms
+from ratelimit import RateLimiter
+from simhash import NearDuplicateIndex
+from rules import get_rules
+from spamclf import load_model as load_spam_model
+from handlers.achievements import format_achievement
+from handlers.pipeline import run_pipeline
+from outbox import outbox
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Probabilidad de spam a partir de la cual se avisa (y no se puntúa) y se bloquea
+SPAM_THRESHOLD = float(os.environ.get("SPAM_THRESHOLD", "0.8"))
+SPAM_BLOCK_THRESHOLD = float(os.environ.get("SPAM_BLOCK_THRESHOLD", "0.97"))
+
+# Casi-copias de un mensaje reciente: propias no puntúan, ajenas puntúan a medias
+DUPLICATE_OWN = "own"
+DUPLICATE_OTHER = "other"
+DUPLICATE_OTHER_FACTOR = 0.5
+
 class SecurityManager:
     def __init__(self):
-        # Rate limiting: usuario_id -> {acción: [timestamps]}
-        self.rate_limits = {}
         # Blacklist temporal para usuarios problemáticos
         self.temp_blacklist = {}
-        # Patrones de spam más sofisticados
-        self.spam_patterns = [
-            r'(?i)(descarga|download)\s+(gratis|free)',
-            r'(?i)(oferta|promocion|descuento)\s*[0-9]+%',
-            r'(?i)(gana|earn)\s+(dinero|money)',
-            r'https?://(?!t\.me|youtube\.com|imdb\.com)',  # URLs sospechosas
-            r'(?i)telegram\s*@\w+',  # Promoción de otros canales
+        # Clasificador lineal entrenado con spamclf.py; sin modelo se usan los patrones
+        try:
+            self.classifier = load_spam_model()
+        except (OSError, ValueError) as e:
+            logger.error(f"Spam model not loaded, using patterns: {e}")
+            self.classifier = None
+        # Patrones de spam (respaldo sin modelo), con las palabras que deben aparecer
+        # para que valga la pena evaluarlos (las busca el matcher en su pasada)
+        self.spam_rules = [
+            (r'(?i)(descarga|download)\s+(gratis|free)', ("descarga", "download")),
+            (r'(?i)(oferta|promocion|descuento)\s*[0-9]+%', ("oferta", "promocion", "descuento")),
+            (r'(?i)(gana|earn)\s+(dinero|money)', ("gana", "earn")),
+            (r'https?://(?!t\.me|youtube\.com|imdb\.com)', ("http",)),  # URLs sospechosas
+            (r'(?i)telegram\s*@\w+', ("telegram",)),  # Promoción de otros canales
         ]
-        # Límites por acción (acción: (max_count, window_seconds))
+        self.spam_patterns = [pattern for pattern, _ in self.spam_rules]
+        register_terms("spam", (anchor for _, anchors in self.spam_rules for anchor in anchors))
+        # Límites por acción (acción: (max_count, window_seconds[, burst]))
         self.action_limits = {
             'hashtag_usage': (5, 300),      # 5 hashtags por 5 min
             'message_send': (10, 60),       # 10 mensajes por minuto
             'command_usage': (3, 30),       # 3 comandos por 30 seg
         }
+        # Rate limiting GCRA: un TAT por usuario y acción, slots reutilizables.
+        # El consumo se comparte en lote con el resto de procesos (ver sync)
+        self.limiter = RateLimiter(self.action_limits, track_changes=True)
+        # Bloqueos añadidos desde el último sync: user_id -> info
+        self._blacklist_changes = {}
+        # Huellas SimHash de los mensajes puntuados recientes (por chat y por usuario)
+        self.duplicates = NearDuplicateIndex()
     
     def is_rate_limited(self, user_id: int, action: str) -> bool:
-        """Verifica si un usuario excede los límites de rate"""
-        current_time = time.time()
-        
-        if user_id not in self.rate_limits:
-            self.rate_limits[user_id] = {}
-        
-        if action not in self.rate_limits[user_id]:
-            self.rate_limits[user_id][action] = []
-        
-        user_actions = self.rate_limits[user_id][action]
-        max_count, window = self.action_limits.get(action, (10, 60))
-        
-        # Limpiar timestamps antiguos
-        cutoff = current_time - window
-        user_actions[:] = [t for t in user_actions if t > cutoff]
-        
-        if len(user_actions) >= max_count:
+        """Verifica si un usuario excede los límites de rate (y registra la acción si no)"""
+        if self.limiter.hit(user_id, action):
             logger.warning(f"Rate limit exceeded for user {user_id} on action {action}")
             return True
-        
-        # Registrar nueva acción
-        user_actions.append(current_time)
         return False
     
-    def is_spam_content(self, text: str, user_id: int) -> Optional[str]:
+    def sweep(self) -> dict:
+        """Olvida usuarios inactivos del limitador y bloqueos ya vencidos"""
+        now = time.time()
+        evicted = self.limiter.sweep(now)
+        expired = [user_id for user_id, info in self.temp_blacklist.items() if now > info['until']]
+        for user_id in expired:
+            del self.temp_blacklist[user_id]
+        self.duplicates.sweep(now)
+        return {"evicted": evicted, "expired": len(expired)}
+    
+    async def sync(self) -> dict:
+        """Comparte límites y blacklist con los demás procesos a través del almacenamiento
+
+        Envía de una vez el consumo aceptado y los bloqueos nuevos desde el
+        último sync y recibe el estado común, de modo que los límites suman el
+        uso de todos los procesos (con el retraso de un intervalo de sync) y
+        sobreviven a los reinicios.
+        """
+        consumed = self.limiter.drain()
+        changes, self._blacklist_changes = self._blacklist_changes, {}
+        blacklist = [(user_id, info['reason'], info['until']) for user_id, info in changes.items()]
+        now = time.time()
+        try:
+            tats, active = await sync_security_state(consumed, blacklist, now)
+        except Exception:
+            # Se reintenta en el próximo sync
+            self.limiter.requeue(consumed)
+            for user_id, info in changes.items():
+                self._blacklist_changes.setdefault(user_id, info)
+            raise
+
+        self.limiter.merge(tats, now)
+        for user_id, reason, until in active:
+            current = self.temp_blacklist.get(user_id)
+            if current is None or until > current['until']:
+                self.temp_blacklist[user_id] = {'reason': reason, 'until': until}
+        return {"sent": len(consumed) + len(blacklist), "received": len(tats) + len(active)}
+    
+    def stats(self) -> dict:
+        """Contadores del limitador (comprobaciones y límites aplicados por acción)"""
+        return {**self.limiter.stats(), "blacklisted": len(self.temp_blacklist),
+                "fingerprints": len(self.duplicates)}
+    
+    def check_duplicate(self, chat_id: int, user_id: int, message_id: int, analysis, now: float = None):
+        """DUPLICATE_OWN / DUPLICATE_OTHER si el mensaje es casi copia de uno reciente, None si no"""
+        return duplicate_kind(
+            self.duplicates.check_and_add(chat_id, user_id, analysis.fingerprint, message_id, now),
+            user_id,
+        )
+    
+    def spam_probability(self, text: str, analysis=None) -> float:
+        """Probabilidad de spam según el clasificador (sin modelo: SPAM_THRESHOLD si algún patrón coincide)"""
+        if self.classifier is not None:
+            return self.classifier.score(text)
+        if analysis is None:
+            analysis = MessageAnalysis(text)
+        # Sólo los patrones que tienen alguna de sus palabras en el mensaje
+        for pattern, anchors in self.spam_rules:
+            if any(anchor in analysis.matches.substrings for anchor in anchors) and re.search(pattern, text):
+                return SPAM_THRESHOLD
+        return 0.0
+    
+    def is_spam_content(self, text: str, user_id: int, analysis=None, probability: float = None) -> Optional[str]:
         """Detecta contenido spam y retorna razón si lo encuentra"""
-        # Verificar patrones de spam
-        for pattern in self.spam_patterns:
-            if re.search(pattern, text):
-                return f"Patrón spam detectado"
+        if analysis is None:
+            analysis = MessageAnalysis(text)
+        if probability is None:
+            probability = self.spam_probability(text, analysis)
+        if probability >= SPAM_THRESHOLD:
+            if self.classifier is not None:
+                return f"Clasificador de spam ({probability:.0%})"
+            return "Patrón spam detectado"
         
         # Verificar exceso de mayúsculas
         if len(text) > 20:
-            caps_ratio = sum(1 for c in text if c.isupper()) / len(text)
-            if caps_ratio > 0.7:
+            if analysis.caps_ratio > 0.7:
                 return "Exceso de mayúsculas"
         
         # Verificar repetición excesiva de caracteres
-        if re.search(r'(.)\1{4,}', text):
+        if analysis.has_char_run:
             return "Repetición excesiva de caracteres"
         
         return None
     
     def add_to_blacklist(self, user_id: int, reason: str, duration: int = 3600):
         """Añade usuario a blacklist temporal"""
-        self.temp_blacklist[user_id] = {
+        self.temp_blacklist[user_id] = self._blacklist_changes[user_id] = {
             'reason': reason,
             'until': time.time() + duration
         }
@@ -95,13 +176,13 @@ class SecurityManager:
         
         return blacklist_info['reason']
     
-    def validate_hashtag_message(self, text: str, user_id: int) -> Dict[str, any]:
+    def validate_hashtag_message(self, text: str, user_id: int, analysis=None) -> Dict[str, any]:
         """Validación completa para mensajes con hashtags"""
         result = {
             'is_valid': True,
             'warnings': [],
             'blocks': [],
-            'spam_score': 0
+            'spam_score': 0.0  # probabilidad de spam (0..1)
         }
         
         # Verificar blacklist
@@ -118,22 +199,53 @@ class SecurityManager:
             return result
         
         # Verificar spam
-        spam_reason = self.is_spam_content(text, user_id)
+        probability = self.spam_probability(text, analysis)
+        result['spam_score'] = probability
+        spam_reason = self.is_spam_content(text, user_id, analysis, probability)
         if spam_reason:
-            result['spam_score'] = 10
+            # Mayúsculas o repeticiones también cuentan como contenido sospechoso
+            result['spam_score'] = max(probability, SPAM_THRESHOLD)
             result['warnings'].append(f"Contenido sospechoso: {spam_reason}")
             
-            # Si es spam severo, bloquear
-            if any(severe in spam_reason.lower() for severe in ['descarga', 'promocion', 'gana dinero']):
+            # Si es spam casi seguro, bloquear
+            if probability >= SPAM_BLOCK_THRESHOLD:
                 result['is_valid'] = False
                 result['blocks'].append("Contenido promocional no permitido")
                 self.add_to_blacklist(user_id, spam_reason, 1800)  # 30 min
         
         return result
 
+def duplicate_kind(match, user_id: int):
+    """Tipo de copia según quién escribió el original (None si no hay coincidencia)"""
+    if match is None:
+        return None
+    return DUPLICATE_OWN if match.user_id == user_id else DUPLICATE_OTHER
+
 # Instancia global del security manager
 security_manager = SecurityManager()
 
+async def security_sweep_job(context):
+    """Job periódico: desaloja usuarios inactivos y registra los contadores de límites"""
+    try:
+        result = security_manager.sweep()
+        stats = security_manager.stats()
+        logger.info(
+            f"Security sweep: {result['evicted']} usuarios desalojados, {stats['users']} activos, "
+            f"límites aplicados {stats['limited']} de {stats['checks']}"
+        )
+    except Exception as e:
+        logger.error(f"Error en security_sweep_job: {e}")
+
+# Cada cuántos segundos se comparte el estado de seguridad entre procesos
+SECURITY_SYNC_SECONDS = int(os.environ.get("SECURITY_SYNC_SECONDS", "5"))
+
+async def security_sync_job(context):
+    """Job periódico: sincroniza límites y blacklist con el almacenamiento compartido"""
+    try:
+        await security_manager.sync()
+    except Exception as e:
+        logger.error(f"Error en security_sync_job: {e}")
+
 # Decorador para proteger comandos
 def rate_limit(action: str):
     def decorator(func):
@@ -142,7 +254,7 @@ def rate_limit(action: str):
             user_id = update.effective_user.id
             
             if security_manager.is_rate_limited(user_id, action):
-                await update.message.reply_text(
+                await outbox.reply(update.message,
                     "⏰ Vas muy rápido. Espera un momento antes de usar este comando."
                 )
                 return
@@ -153,32 +265,6 @@ def rate_limit(action: str):
 
 # === HANDLER DE HASHTAGS MEJORADO ===
 
-POINTS = {
-    "#aporte": 3,
-    "#recomendación": 5,
-    "#reseña": 7,
-    "#crítica": 10,
-    "#debate": 4,
-    "#pregunta": 2,
-    "#spoiler": 1,
-}
-
-# Validaciones específicas por hashtag
-HASHTAG_VALIDATIONS = {
-    "#reseña": {
-        "min_words": 15,  # Reducido para pruebas
-        "bonus_patterns": [r'\b\d{4}\b', r'\b[A-Z][a-z]+\b']  # Año, Nombres propios
-    },
-    "#crítica": {
-        "min_words": 25,
-        "bonus_patterns": [r'\b(?:cinematografía|guión|banda sonora|actuación|dirección)\b']
-    },
-    "#recomendación": {
-        "min_words": 10,
-        "bonus_patterns": [r'\b\d{4}\b', r'\b(?:Netflix|Prime|Disney|HBO)\b']  # Año o plataforma
-    }
-}
-
 def count_words(text):
     """Cuenta palabras excluyendo hashtags y menciones"""
     # Remover hashtags, menciones y URLs
@@ -187,8 +273,8 @@ def count_words(text):
     words = re.findall(r'\b\w+\b', clean_text.lower())
     return len(words)
 
-def validate_hashtag_content(hashtag: str, text: str) -> Dict[str, any]:
-    """Valida contenido específico por hashtag"""
+def validate_hashtag_content(hashtag: str, text: str, analysis=None, rules=None) -> Dict[str, any]:
+    """Valida contenido específico por hashtag (según las validaciones de rules.json)"""
     result = {
         'is_valid': True,
         'points_modifier': 1.0,
@@ -196,14 +282,14 @@ def validate_hashtag_content(hashtag: str, text: str) -> Dict[str, any]:
         'bonus_reason': None
     }
     
-    if hashtag not in HASHTAG_VALIDATIONS:
+    validation = (rules or get_rules()).validations.get(hashtag)
+    if validation is None:
         return result
     
-    validation = HASHTAG_VALIDATIONS[hashtag]
-    word_count = count_words(text)
+    word_count = analysis.word_count if analysis else count_words(text)
     
     # Verificar longitud mínima
-    min_words = validation.get('min_words', 0)
+    min_words = validation.min_words
     if word_count < min_words:
         # Para pruebas, solo advertencia en lugar de invalidar
         result['warnings'].append(
@@ -212,8 +298,7 @@ def validate_hashtag_content(hashtag: str, text: str) -> Dict[str, any]:
         result['points_modifier'] = 0.7  # Reducir puntos pero no invalidar
     
     # Verificar elementos bonus
-    bonus_patterns = validation.get('bonus_patterns', [])
-    bonus_found = sum(1 for pattern in bonus_patterns if re.search(pattern, text, re.IGNORECASE))
+    bonus_found = sum(1 for pattern in validation.bonus_patterns if pattern.search(text))
     if bonus_found > 0:
         result['points_modifier'] = min(1.5, 1.0 + (bonus_found * 0.2))  # Máximo 50% bonus
         result['bonus_reason'] = f"Bonus por información adicional (+{int((result['points_modifier']-1)*100)}%)"
@@ -233,213 +318,248 @@ def get_simple_reaction(hashtag: str) -> str:
     }
     return reactions.get(hashtag, "🎬 ¡Gracias por participar!")
 
-async def handle_hashtags_improved(update: Update, context):
-    """Handler mejorado para procesar hashtags con seguridad avanzada"""
-    if not update.message or not update.message.text:
-        return
+class MessageScore:
+    """Resultado de puntuar un mensaje, sin efectos: premios y textos de la respuesta"""
+
+    __slots__ = ("hashtags", "awards", "found_tags", "warnings", "bonus_messages", "challenge_messages")
+
+    def __init__(self):
+        self.hashtags = []            # hashtags puntuables en el orden de rules.json
+        self.awards = []              # [(puntos, hashtag, is_challenge_bonus)]
+        self.found_tags = []
+        self.warnings = []
+        self.bonus_messages = []
+        self.challenge_messages = []
+
+    def add(self, points: int, hashtag=None, is_challenge_bonus=False):
+        self.awards.append((points, hashtag, is_challenge_bonus))
+
+    @property
+    def base_points(self) -> int:
+        """Puntos por hashtags (sin bonus de retos)"""
+        return sum(points for points, _, is_bonus in self.awards if not is_bonus)
+
+def score_message(text: str, when=None, analysis=None, duplicate=None) -> MessageScore:
+    """Aplica las reglas de puntuación a un texto (when: fecha para los retos, None = ahora)
+
+    duplicate: resultado de duplicate_kind(); una copia propia no puntúa y una
+    ajena puntúa a medias y sin bonus de retos.
+    """
+    score = MessageScore()
+    # Una sola lectura de las reglas vigentes para todo el mensaje (antes de escanear,
+    # para que sus términos ya estén registrados en el matcher)
+    rules = get_rules()
+    if analysis is None:
+        analysis = MessageAnalysis(text)
+    score.hashtags = [tag for tag in rules.hashtags if analysis.contains(tag)]
     
-    text = update.message.text
-    user = update.effective_user
+    if duplicate == DUPLICATE_OWN:
+        score.warnings.append("♻️ Este mensaje es casi igual a otro tuyo reciente: no suma puntos.")
+        return score
+    factor = 1.0
+    if duplicate == DUPLICATE_OTHER:
+        factor = DUPLICATE_OTHER_FACTOR
+        score.warnings.append("♻️ Texto casi igual a un mensaje reciente de otra persona: puntos reducidos a la mitad.")
+    
+    for hashtag in score.hashtags:
+        base_points = rules.points[hashtag]
+        try:
+            # Validar contenido específico del hashtag
+            validation_result = validate_hashtag_content(hashtag, text, analysis, rules)
+            
+            # Calcular puntos con modificadores
+            final_points = max(1, int(base_points * validation_result['points_modifier'] * factor))
+            score.add(final_points, hashtag=hashtag)
+            
+            tag_text = f"{hashtag} (+{final_points})"
+            if validation_result['points_modifier'] != 1.0:
+                tag_text += f" [x{validation_result['points_modifier']:.1f}]"
+            
+            score.found_tags.append(tag_text)
+            
+            if validation_result['bonus_reason']:
+                score.bonus_messages.append(validation_result['bonus_reason'])
+            
+            # Agregar a warnings si hay
+            score.warnings.extend(validation_result['warnings'])
+            
+        except Exception as e:
+            logger.error(f"Error validating hashtag {hashtag}: {e}")
+            # Usar puntos base sin validación
+            base_points = max(1, int(base_points * factor))
+            score.add(base_points, hashtag=hashtag)
+            score.found_tags.append(f"{hashtag} (+{base_points})")
+    
+    # Los retos sólo cuentan si el mensaje ya puntúa por algún hashtag (y no es una copia)
+    if score.base_points > 0 and duplicate is None:
+        try:
+            check_challenges(text, score, when, analysis)
+        except Exception as e:
+            logger.error(f"Error checking challenges: {e}")
+    
+    return score
+
+async def hashtag_stage(ctx):
+    """Etapa del pipeline: valida y puntúa los hashtags del mensaje"""
+    text = ctx.text
+    user = ctx.update.effective_user
     user_id = user.id
     username = user.username or f"user_{user_id}"
+    analysis = ctx.analysis
     
-    logger.info(f"Processing message from {username} (ID: {user_id}): {text[:50]}...")
-    
-    # Verificar si hay hashtags válidos
-    found_hashtags = [tag for tag in POINTS.keys() if tag in text.lower()]
+    # Verificar si hay hashtags válidos (como token completo: #reseñas no es #reseña)
+    found_hashtags = [tag for tag in get_rules().hashtags if analysis.contains(tag)]
     if not found_hashtags:
-        logger.debug("No hashtags found, skipping")
         return
     
+    logger.info(f"Processing message from {username} (ID: {user_id}): {text[:50]}...")
+    
+    # Una reentrega con otro update_id (p. ej. tras un reinicio) no gasta el límite de hashtags
+    message_id = ctx.update.message.message_id
+    try:
+        if await message_scored(user_id, ctx.chat_id, message_id):
+            logger.info(f"Message {message_id} already scored, skipping")
+            ctx.stop(silent=True)
+            return
+    except Exception as e:
+        logger.error(f"Redelivery check error: {e}")
+    
     # Validación de seguridad
     try:
-        security_result = security_manager.validate_hashtag_message(text, user_id)
+        security_result = security_manager.validate_hashtag_message(text, user_id, analysis)
         
         if not security_result['is_valid']:
             for block_reason in security_result['blocks']:
-                await update.message.reply_text(f"🚫 {block_reason}")
+                ctx.say(f"🚫 {block_reason}")
+            ctx.stop()
             return
         
         # Mostrar advertencias de seguridad si las hay
         for warning in security_result['warnings']:
-            if security_result['spam_score'] > 7:  # Solo mostrar si es spam severo
-                await update.message.reply_text(f"⚠️ {warning}")
+            if security_result['spam_score'] >= SPAM_THRESHOLD:  # Solo mostrar si es spam probable
+                ctx.say(f"⚠️ {warning}")
+                ctx.stop()
                 return
         
     except Exception as e:
         logger.error(f"Security validation error: {e}")
         # Continuar sin validación de seguridad en caso de error
     
-    # Procesar hashtags
-    total_points = 0
-    found_tags = []
-    warnings = []
-    bonus_messages = []
+    # Casi-copias de mensajes recientes del chat o del usuario (pegar el mismo texto)
+    try:
+        duplicate = security_manager.check_duplicate(ctx.chat_id, user_id, message_id, analysis)
+    except Exception as e:
+        logger.error(f"Duplicate check error: {e}")
+        duplicate = None
     
-    for hashtag, base_points in POINTS.items():
-        if hashtag not in text.lower():
-            continue
-        
-        try:
-            # Validar contenido específico del hashtag
-            validation_result = validate_hashtag_content(hashtag, text)
-            
-            # Calcular puntos con modificadores
-            final_points = max(1, int(base_points * validation_result['points_modifier']))
-            total_points += final_points
-            
-            tag_text = f"{hashtag} (+{final_points})"
-            if validation_result['points_modifier'] != 1.0:
-                tag_text += f" [x{validation_result['points_modifier']:.1f}]"
-            
-            found_tags.append(tag_text)
-            
-            if validation_result['bonus_reason']:
-                bonus_messages.append(validation_result['bonus_reason'])
-            
-            # Agregar a warnings si hay
-            warnings.extend(validation_result['warnings'])
-            
-        except Exception as e:
-            logger.error(f"Error validating hashtag {hashtag}: {e}")
-            # Usar puntos base sin validación
-            total_points += base_points
-            found_tags.append(f"{hashtag} (+{base_points})")
+    # Puntuación pura (la misma que usa el importador de historial)
+    score = score_message(text, analysis=analysis, duplicate=duplicate)
+    total_points = score.base_points
+    ctx.points = total_points
     
     # Si no hay puntos válidos
     if total_points == 0:
-        if warnings:
-            await update.message.reply_text("\n".join(warnings))
+        for warning in score.warnings:
+            ctx.say(warning)
         return
     
-    # Guardar puntos en base de datos
+    # Unidad de trabajo del mensaje: base y bonus se escriben en una transacción
+    unit = ScoringUnit(user_id, username, ctx.chat_id, message_id)
+    for points, hashtag, is_challenge_bonus in score.awards:
+        unit.add(points, hashtag=hashtag, is_challenge_bonus=is_challenge_bonus)
+    
+    # Guardar todos los premios del mensaje de una vez
     try:
-        from db import add_points
-        add_points(
-            user_id=user_id,
-            username=username,
-            points=total_points,
-            hashtag=None,
-            message_text=text[:500],  # Limitar longitud
-            chat_id=update.effective_chat.id,
-            message_id=update.message.message_id,
-            is_challenge_bonus=False,
-            context=context
-        )
-        logger.info(f"Added {total_points} points for user {username}")
+        nuevos_logros = await unit.commit()
+        if unit.duplicate:
+            # Reentrega de un mensaje ya puntuado: no se responde nada
+            logger.info(f"Message {message_id} already scored, skipping reply")
+            ctx.stop(silent=True)
+            return
+        logger.info(f"Added {unit.total} points for user {username}")
     except Exception as e:
         logger.error(f"Error adding points: {e}")
-        await update.message.reply_text("❌ Error interno. Inténtalo más tarde.")
+        ctx.say("❌ Error interno. Inténtalo más tarde.")
+        ctx.stop()
         return
     
-    # Construir respuesta
-    response_parts = []
-    
     # Puntos básicos
-    tags_text = ", ".join(found_tags)
+    tags_text = ", ".join(score.found_tags)
     reaction = get_simple_reaction(found_hashtags[0])
-    response_parts.append(f"✅ +{total_points} puntos por: {tags_text}\n{reaction}")
+    ctx.say(f"✅ +{total_points} puntos por: {tags_text}\n{reaction}")
+    ctx.reacted = True
     
     # Mensajes bonus
-    if bonus_messages:
-        response_parts.extend([f"🌟 {msg}" for msg in bonus_messages])
+    for msg in score.bonus_messages:
+        ctx.say(f"🌟 {msg}")
     
     # Advertencias (solo las importantes)
-    if warnings:
-        response_parts.extend(warnings[:2])  # Máximo 2 advertencias
+    for warning in score.warnings[:2]:  # Máximo 2 advertencias
+        ctx.say(warning)
     
-    # Verificar retos (con manejo de errores)
-    try:
-        await check_challenges(update, context, text, user_id, username, response_parts)
-    except Exception as e:
-        logger.error(f"Error checking challenges: {e}")
+    # Retos completados
+    for msg in score.challenge_messages:
+        ctx.say(msg)
     
-    # Enviar respuesta
-    if response_parts:
-        try:
-            response_text = "\n".join(response_parts)
-            if len(response_text) > 4000:  # Límite de Telegram
-                response_text = response_text[:4000] + "..."
-            
-            await update.message.reply_text(response_text)
-            logger.info(f"Sent response to {username}: {total_points} points")
-            
-        except Exception as e:
-            logger.error(f"Error sending response: {e}")
-            # Respuesta de emergencia
-            try:
-                await update.message.reply_text(f"✅ +{total_points} puntos!")
-            except:
-                pass
+    # Logros desbloqueados: en la misma respuesta, no en mensajes aparte
+    for logro in nuevos_logros or ():
+        ctx.say(format_achievement(logro), markdown=True)
+
+async def handle_hashtags_improved(update: Update, context):
+    """Procesa sólo los hashtags de un mensaje (usado por /debug)"""
+    await run_pipeline(update, context, (hashtag_stage,))
 
-async def check_challenges(update, context, text, user_id, username, response_parts):
-    """Verifica retos con manejo de errores mejorado"""
+def check_challenges(text, score, when=None, analysis=None):
+    """Verifica los retos de la fecha (None = ahora) y añade sus bonus al resultado"""
+    if analysis is None:
+        analysis = MessageAnalysis(text)
     try:
         # Intentar importar módulos de retos
         try:
             from handlers.retos import get_current_challenge, validate_challenge_submission
             # Reto semanal
-            current_challenge = get_current_challenge()
+            current_challenge = get_current_challenge(when)
             if current_challenge and current_challenge.get("hashtag"):
                 hashtag_challenge = current_challenge["hashtag"]
-                if hashtag_challenge in text.lower():
-                    if validate_challenge_submission(current_challenge, text):
-                        from db import add_points
+                if analysis.contains(hashtag_challenge):
+                    if validate_challenge_submission(current_challenge, text, analysis.matches):
                         bonus = current_challenge.get("bonus_points", 10)
-                        add_points(
-                            user_id=user_id,
-                            username=username,
-                            points=bonus,
-                            hashtag=hashtag_challenge,
-                            message_text=text,
-                            chat_id=update.effective_chat.id,
-                            message_id=update.message.message_id,
-                            is_challenge_bonus=True,
-                            context=context
-                        )
-                        response_parts.append(f"🎯 ¡Reto semanal completado! Bonus: +{bonus} puntos 🎉")
+                        score.add(bonus, hashtag=hashtag_challenge, is_challenge_bonus=True)
+                        score.challenge_messages.append(f"🎯 ¡Reto semanal completado! Bonus: +{bonus} puntos 🎉")
         except ImportError:
             logger.debug("Retos module not available")
         
         # Intentar reto diario
         try:
             from handlers.retos_diarios import get_today_challenge
-            daily = get_today_challenge()
-            if daily and check_daily_completion(daily, text):
-                from db import add_points
+            daily = get_today_challenge(when)
+            if daily and check_daily_completion(daily, text, analysis):
                 daily_bonus = daily.get("bonus_points", 5)
-                add_points(
-                    user_id=user_id,
-                    username=username,
-                    points=daily_bonus,
-                    hashtag="(reto_diario)",
-                    message_text=text,
-                    chat_id=update.effective_chat.id,
-                    message_id=update.message.message_id,
-                    is_challenge_bonus=True,
-                    context=context
-                )
-                response_parts.append(f"🎯 ¡Reto diario completado! Bonus: +{daily_bonus} puntos 🎉")
+                score.add(daily_bonus, hashtag="(reto_diario)", is_challenge_bonus=True)
+                score.challenge_messages.append(f"🎯 ¡Reto diario completado! Bonus: +{daily_bonus} puntos 🎉")
         except ImportError:
             logger.debug("Daily challenges module not available")
             
     except Exception as e:
         logger.error(f"Error checking challenges: {e}")
 
-def check_daily_completion(daily_challenge, text):
+def check_daily_completion(daily_challenge, text, analysis=None):
     """Verifica si se completó el reto diario"""
     try:
+        if analysis is None:
+            analysis = MessageAnalysis(text)
+        
         # Verificar hashtag específico
-        if "hashtag" in daily_challenge and daily_challenge["hashtag"] in text.lower():
+        if "hashtag" in daily_challenge and analysis.contains(daily_challenge["hashtag"]):
             if "min_words" in daily_challenge:
-                return count_words(text) >= daily_challenge["min_words"]
+                return analysis.word_count >= daily_challenge["min_words"]
             return True
         
         # Verificar palabras clave
         if "keywords" in daily_challenge:
-            if any(word in text.lower() for word in daily_challenge["keywords"]):
+            if any(analysis.contains(word) for word in daily_challenge["keywords"]):
                 if "min_words" in daily_challenge:
-                    return count_words(text) >= daily_challenge["min_words"]
+                    return analysis.word_count >= daily_challenge["min_words"]
                 return True
         
         return False
@@ -1,5 +1,9 @@
-from telegram import Update
+from matcher import register_terms
 
-async def spam_handler(update: Update, context):
-    if "gratis" in update.message.text.lower():
-        await update.message.reply_text("🛑 ¡Cuidado con el spam!")
+SPAM_WORDS = ("gratis",)
+register_terms("spam_words", SPAM_WORDS)
+
+async def spam_stage(ctx):
+    """Etapa del pipeline: aviso de spam"""
+    if ctx.analysis.matches.any_word(SPAM_WORDS):
+        ctx.say("🛑 ¡Cuidado con el spam!")
@@ -1,6 +1,8 @@
 from telegram import Update
 from telegram.ext import ContextTypes
 
+from outbox import outbox
+
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     mensaje = (
         "🎬 *¡Luces, cámara… acción\\!* 🎬\n\n"
@@ -13,4 +15,4 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "Si eres nuevo, grita `/help` como si fuera el último acto\\.\n\n"
         "_Puntum Bot no es un simple bot\\. Es tu compañero de guion en este drama colectivo llamado cine\\._ 🍿"
     )
-    await update.message.reply_markdown_v2(mensaje)
+    await outbox.reply(update.message, mensaje, parse_mode="MarkdownV2")
@@ -0,0 +1,202 @@
+# importer.py - Puntúa el historial de un grupo desde el export de Telegram Desktop
+#
+# Uso:  python importer.py result.json [--chat-id -100123...]
+#
+# Lee el JSON por trozos (memoria constante), aplica a cada mensaje las mismas
+# reglas que hashtag_stage sin enviar respuestas y escribe los
+# premios en lotes grandes. Ejecutar con el bot parado o reiniciarlo después,
+# para que recargue rankings y logros desde la base de datos.
+import argparse
+import json
+import re
+import time
+from datetime import datetime, timezone
+
+import db
+from analysis import MessageAnalysis
+from ratelimit import RateLimiter
+from simhash import NearDuplicateIndex
+from handlers.security import duplicate_kind, score_message, security_manager
+from rules import get_rules
+
+CHUNK_SIZE = 1 << 20  # 1 MB por lectura
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r"\s*")
+
+class ChatExportReader:
+    """Lector incremental de result.json (export de un solo chat).
+
+    header tiene los campos del chat anteriores a "messages" (name, type, id);
+    al iterar se obtienen los mensajes uno a uno con JSONDecoder.raw_decode,
+    sin cargar nunca el fichero completo.
+    """
+
+    def __init__(self, fp, chunk_size: int = CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.eof = False
+        self.header = self._read_header()
+
+    def _fill(self) -> bool:
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer += chunk
+        return True
+
+    def _read_header(self) -> dict:
+        while True:
+            match = re.search(r'"messages"\s*:\s*\[', self.buffer)
+            if match:
+                break
+            if not self._fill():
+                raise ValueError("El fichero no tiene lista de mensajes (¿export de un solo chat?)")
+        head = self.buffer[:match.start()]
+        self.buffer = self.buffer[match.end():]
+
+        header = {}
+        for key in ("name", "type"):
+            found = re.search(rf'"{key}"\s*:\s*"([^"]*)"', head)
+            if found:
+                header[key] = found.group(1)
+        found = re.search(r'"id"\s*:\s*(-?\d+)', head)
+        if found:
+            header["id"] = int(found.group(1))
+        return header
+
+    def __iter__(self):
+        pos = 0
+        while True:
+            pos = _WHITESPACE.match(self.buffer, pos).end()
+            if pos >= len(self.buffer):
+                self.buffer, pos = "", 0
+                if not self._fill():
+                    raise ValueError("Fin de fichero inesperado dentro de la lista de mensajes")
+                continue
+            if self.buffer[pos] == "]":
+                return
+            if self.buffer[pos] == ",":
+                pos += 1
+                continue
+            try:
+                message, end = _decoder.raw_decode(self.buffer, pos)
+            except json.JSONDecodeError:
+                # Mensaje partido entre dos lecturas: descartar lo ya consumido y leer más
+                self.buffer, pos = self.buffer[pos:], 0
+                if not self._fill():
+                    raise
+                continue
+            pos = end
+            yield message
+
+def export_chat_id(header: dict):
+    """chat_id de la Bot API a partir de la cabecera del export"""
+    chat_type = header.get("type", "")
+    raw_id = header.get("id")
+    if raw_id is None:
+        return None
+    if chat_type.endswith("supergroup") or chat_type.endswith("channel"):
+        return int(f"-100{raw_id}")
+    if chat_type.endswith("group"):
+        return -raw_id
+    return raw_id
+
+def message_text(message: dict) -> str:
+    """Texto plano de un mensaje (el export trocea las entidades en una lista)"""
+    text = message.get("text", "")
+    if isinstance(text, list):
+        return "".join(part if isinstance(part, str) else part.get("text", "") for part in text)
+    return text
+
+def message_timestamp(message: dict) -> float:
+    """Instante del mensaje en segundos Unix (date_unixtime si existe; date es hora local del export)"""
+    if message.get("date_unixtime"):
+        return float(int(message["date_unixtime"]))
+    return datetime.fromisoformat(message["date"]).timestamp()
+
+def message_time(message: dict) -> datetime:
+    """Fecha del mensaje en UTC sin tzinfo, como los timestamps del ledger"""
+    return datetime.fromtimestamp(message_timestamp(message), timezone.utc).replace(tzinfo=None)
+
+def iter_export_awards(reader: ChatExportReader, chat_id: int, stats: dict):
+    """Premios de cada mensaje del export según las reglas de puntuación en vivo"""
+    # El mismo limitador que en vivo, con el reloj de las fechas del historial
+    limiter = RateLimiter(security_manager.action_limits)
+    duplicates = NearDuplicateIndex()
+    for message in reader:
+        stats["messages"] += 1
+        if message.get("type") != "message":
+            continue
+        from_id = message.get("from_id") or ""
+        if not from_id.startswith("user"):
+            continue
+        text = message_text(message)
+        if not text:
+            continue
+        analysis = MessageAnalysis(text)
+        if not any(analysis.contains(tag) for tag in get_rules().hashtags):
+            continue
+
+        user_id = int(from_id[len("user"):])
+        # Los relojes del limitador y de las copias van en segundos Unix: un
+        # datetime sin zona se leería como hora local del equipo
+        moment = message_timestamp(message)
+        when = message_time(message)
+        # Mismos filtros que validate_hashtag_message: límite de uso y spam
+        if limiter.hit(user_id, "hashtag_usage", moment):
+            stats["rate_limited"] += 1
+            continue
+        if security_manager.is_spam_content(text, user_id, analysis):
+            stats["spam"] += 1
+            continue
+
+        duplicate = duplicate_kind(
+            duplicates.check_and_add(chat_id, user_id, analysis.fingerprint, message.get("id"), moment),
+            user_id,
+        )
+        if duplicate:
+            stats["duplicates"] += 1
+        score = score_message(text, when, analysis, duplicate)
+        if not score.base_points:
+            continue
+        stats["scored"] += 1
+        username = message.get("from") or f"user_{user_id}"
+        timestamp = when.strftime("%Y-%m-%d %H:%M:%S")
+        for points, hashtag, is_challenge_bonus in score.awards:
+            yield db.make_award(user_id, username, points, hashtag, chat_id,
+                                message.get("id"), is_challenge_bonus, timestamp)
+
+def import_export(path: str, chat_id: int = None, batch_size: int = db.IMPORT_BATCH_SIZE) -> dict:
+    """Importa un result.json completo; devuelve contadores del proceso"""
+    db.create_tables()
+    get_rules()
+    stats = {"messages": 0, "scored": 0, "rate_limited": 0, "spam": 0, "duplicates": 0}
+    with open(path, encoding="utf-8") as fp:
+        reader = ChatExportReader(fp)
+        if chat_id is None:
+            chat_id = export_chat_id(reader.header)
+        result = db.import_awards(iter_export_awards(reader, chat_id, stats), batch_size)
+    return {**stats, **result, "chat_id": chat_id}
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa el historial de un grupo (result.json de Telegram Desktop)")
+    parser.add_argument("path", help="ruta a result.json")
+    parser.add_argument("--chat-id", type=int, help="chat_id de la Bot API (por defecto, el del export)")
+    parser.add_argument("--db", help="base de datos (por defecto puntum.db)")
+    args = parser.parse_args()
+
+    if args.db:
+        db.DB_PATH = args.db
+    started = time.perf_counter()
+    stats = import_export(args.path, args.chat_id)
+    elapsed = time.perf_counter() - started
+    print(f"[INFO] Chat {stats['chat_id']}: {stats['messages']} mensajes, {stats['scored']} puntuados, "
+          f"{stats['written']} premios nuevos de {stats['read']}, {stats['unlocked']} logros "
+          f"({stats['rate_limited']} por límite, {stats['spam']} spam, {stats['duplicates']} copias) en {elapsed:.1f}s")
+    db.close_pool()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# leaderboard.py - Ranking en memoria con consultas de posición en O(log n)
+import threading
+from bisect import bisect_left, insort
+
+class _Fenwick:
+    """Árbol de Fenwick sobre cubetas de puntuación (cuántos usuarios tienen cada score)"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.tree = [0] * (size + 1)
+
+    def add(self, index: int, delta: int):
+        index += 1
+        while index <= self.size:
+            self.tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index: int) -> int:
+        """Suma de las cubetas [0, index]"""
+        index = min(index, self.size - 1) + 1
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def find(self, k: int) -> int:
+        """Menor índice cuya suma acumulada es >= k (k empieza en 1)"""
+        pos = 0
+        bit = 1 << (self.size.bit_length() - 1)
+        while bit:
+            nxt = pos + bit
+            if nxt <= self.size and self.tree[nxt] < k:
+                pos = nxt
+                k -= self.tree[nxt]
+            bit >>= 1
+        return pos
+
+class Leaderboard:
+    """Ranking incremental: top-N, posición exacta y vecinos sin tocar SQLite.
+
+    Orden: puntos descendentes y, a igualdad, user_id ascendente. La posición
+    de un usuario es 1 + los usuarios que le preceden en ese orden.
+    """
+
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._scores = {}   # user_id -> puntos
+            self._names = {}    # user_id -> username
+            self._buckets = {}  # puntos -> [user_id] ordenados
+            self._tree = _Fenwick(self.INITIAL_CAPACITY)
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __contains__(self, user_id):
+        return user_id in self._scores
+
+    def load(self, rows):
+        """Carga inicial desde filas (user_id, username, puntos)"""
+        with self._lock:
+            self.clear()
+            for user_id, username, score in rows:
+                self.set_score(user_id, username, score)
+
+    def add(self, user_id: int, username, delta: int):
+        """Suma delta a la puntuación del usuario"""
+        with self._lock:
+            self.set_score(user_id, username, self._scores.get(user_id, 0) + delta)
+
+    def set_score(self, user_id: int, username, score: int):
+        score = max(0, int(score))
+        with self._lock:
+            if username:
+                self._names[user_id] = username
+            old = self._scores.get(user_id)
+            if old == score:
+                return
+            if old is not None:
+                self._remove_from_bucket(user_id, old)
+            self._scores[user_id] = score
+            self._ensure_capacity(score)
+            insort(self._buckets.setdefault(score, []), user_id)
+            self._tree.add(score, 1)
+
+    def remove(self, user_id: int):
+        with self._lock:
+            old = self._scores.pop(user_id, None)
+            if old is not None:
+                self._remove_from_bucket(user_id, old)
+            self._names.pop(user_id, None)
+
+    def score(self, user_id: int) -> int:
+        return self._scores.get(user_id, 0)
+
+    def rank(self, user_id: int):
+        """Posición exacta del usuario (1 = primero) o None si no puntúa"""
+        with self._lock:
+            score = self._scores.get(user_id)
+            if score is None:
+                return None
+            ahead = len(self._scores) - self._tree.prefix(score)
+            return ahead + bisect_left(self._buckets[score], user_id) + 1
+
+    def top(self, n: int = 10):
+        """Primeros n como [(user_id, username, puntos)]"""
+        with self._lock:
+            return self._slice(1, n)
+
+    def around(self, user_id: int, radius: int = 2):
+        """Usuarios alrededor del usuario: [(posición, user_id, username, puntos)]"""
+        with self._lock:
+            position = self.rank(user_id)
+            if position is None:
+                return []
+            start = max(1, position - radius)
+            entries = self._slice(start, position + radius - start + 1)
+            return [(start + i, *entry) for i, entry in enumerate(entries)]
+
+    def _slice(self, start: int, count: int):
+        """count entradas a partir de la posición start (1 = primero)"""
+        total = len(self._scores)
+        result = []
+        position = start
+        while len(result) < count and position <= total:
+            # La k-ésima desde arriba es la (total - k + 1)-ésima desde abajo
+            score = self._tree.find(total - position + 1)
+            ties = self._buckets[score]
+            first_position = total - self._tree.prefix(score) + 1
+            for user_id in ties[position - first_position:]:
+                result.append((user_id, self._names.get(user_id), score))
+                if len(result) >= count:
+                    break
+            position = first_position + len(ties)
+        return result
+
+    def _remove_from_bucket(self, user_id: int, score: int):
+        bucket = self._buckets[score]
+        del bucket[bisect_left(bucket, user_id)]
+        if not bucket:
+            del self._buckets[score]
+        self._tree.add(score, -1)
+
+    def _ensure_capacity(self, score: int):
+        if score < self._tree.size:
+            return
+        size = self._tree.size
+        while size <= score:
+            size *= 2
+        tree = _Fenwick(size)
+        for bucket_score, users in self._buckets.items():
+            tree.add(bucket_score, len(users))
+        self._tree = tree
@@ -0,0 +1,138 @@
+# matcher.py - Búsqueda de todos los términos (hashtags, retos, spam) en una sola pasada
+import re
+import threading
+from collections import deque
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+class Matches:
+    """Términos encontrados en un texto.
+
+    words: apariciones como token completo ("#reseña" no cuenta dentro de
+    "#reseñas"); substrings: cualquier aparición, para las reglas que lo
+    necesitan (anclas de las expresiones de spam).
+    """
+
+    __slots__ = ("words", "substrings", "automaton")
+
+    def __init__(self, automaton=None):
+        self.words = set()
+        self.substrings = set()
+        self.automaton = automaton  # autómata que produjo el resultado
+
+    def __contains__(self, term: str) -> bool:
+        return term in self.words
+
+    def any_word(self, terms) -> bool:
+        return any(term in self.words for term in terms)
+
+class AhoCorasick:
+    """Autómata de Aho-Corasick compilado a DFA (las transiciones de fallo ya resueltas)"""
+
+    def __init__(self, terms):
+        self.terms = frozenset(terms)
+        self._delta = [{}]   # estado -> {carácter: estado}; ausente = raíz
+        self._output = [()]  # estado -> términos que terminan aquí
+        self._build()
+
+    def _build(self):
+        goto = [{}]
+        output = [[]]
+        for term in self.terms:
+            state = 0
+            for ch in term:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    output.append([])
+                state = nxt
+            output[state].append(term)
+
+        fail = [0] * len(goto)
+        delta = [dict(goto[0])] + [None] * (len(goto) - 1)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            # Las salidas del estado de fallo también terminan aquí
+            output[state] = output[state] + output[fail[state]]
+            transitions = dict(delta[fail[state]])
+            for ch, nxt in goto[state].items():
+                fail[nxt] = delta[fail[state]].get(ch, 0) if state else 0
+                transitions[ch] = nxt
+                queue.append(nxt)
+            delta[state] = transitions
+
+        self._delta = delta
+        self._output = [tuple(terms) for terms in output]
+
+    def scan(self, text: str, lowered: bool = False) -> Matches:
+        """Una pasada sobre el texto en minúsculas (lowered: ya viene en minúsculas)"""
+        matches = Matches(self)
+        if not lowered:
+            text = text.lower()
+        delta = self._delta
+        output = self._output
+        state = 0
+        for end, ch in enumerate(text, 1):
+            state = delta[state].get(ch, 0)
+            if output[state]:
+                for term in output[state]:
+                    matches.substrings.add(term)
+                    # Mismos límites que (?<!\w)term(?!\w): "x#crítica" no es "#crítica"
+                    start = end - len(term)
+                    if start > 0 and _is_word_char(text[start - 1]):
+                        continue
+                    if end < len(text) and _is_word_char(text[end]):
+                        continue
+                    matches.words.add(term)
+        return matches
+
+# Registro de términos por grupo; el autómata se recompila sólo si cambian
+_groups = {}
+_automaton = None
+_lock = threading.Lock()
+
+def register_terms(group: str, terms):
+    """Declara (o reemplaza) los términos de un grupo de reglas"""
+    global _automaton
+    normalized = frozenset(term.lower() for term in terms if term)
+    with _lock:
+        if _groups.get(group) != normalized:
+            _groups[group] = normalized
+            _automaton = None
+
+def get_automaton() -> AhoCorasick:
+    global _automaton
+    automaton = _automaton
+    if automaton is None:
+        with _lock:
+            if _automaton is None:
+                _automaton = AhoCorasick(frozenset().union(*_groups.values()))
+            automaton = _automaton
+    return automaton
+
+def scan(text: str) -> Matches:
+    """Todos los términos registrados presentes en el texto"""
+    return get_automaton().scan(text or "")
+
+def is_known(term: str) -> bool:
+    """True si el término está registrado (si no, el llamador debe buscarlo por su cuenta)"""
+    return term.lower() in get_automaton().terms
+
+def contains(text: str, term: str, matches=None) -> bool:
+    """True si el término aparece como token completo en el texto
+
+    matches es el resultado de scan(text) si ya se tiene; los términos que
+    no están registrados se buscan con una expresión equivalente.
+    """
+    term = term.lower()
+    automaton = get_automaton()
+    if term in automaton.terms:
+        # Un resultado de antes de registrar el término no sirve: se vuelve a escanear
+        if matches is None or matches.automaton is not automaton:
+            matches = automaton.scan(text or "")
+        return term in matches
+    return re.search(rf"(?<!\w){re.escape(term)}(?!\w)", (text or "").lower()) is not None
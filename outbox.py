@@ -0,0 +1,322 @@
+# outbox.py - Cola de salida hacia la Bot API con control de flood
+import asyncio
+import html
+import itertools
+import os
+import time
+from collections import Counter, deque
+from datetime import timedelta
+
+from telegram.error import BadRequest, RetryAfter
+from telegram.helpers import escape_markdown
+
+# Prioridades: las respuestas a usuarios salen antes que los anuncios
+PRIORITY_REPLY = 0
+PRIORITY_ANNOUNCEMENT = 1
+
+# Límites de Telegram (mensajes, segundos, ráfaga): ~20/min por grupo,
+# ~1/s por chat privado y ~30/s en total por bot
+GROUP_RATE = (20, 60, 3)
+PRIVATE_RATE = (1, 1, 1)
+GLOBAL_RATE = (30, 1, 30)
+
+# Envíos simultáneos (uno por chat como mucho); el pool HTTP se dimensiona con esto
+MAX_IN_FLIGHT = int(os.environ.get("OUTBOX_CONCURRENCY", "8"))
+MAX_MESSAGE_LENGTH = 4000
+
+class TokenBucket:
+    """count mensajes cada period segundos, con ráfagas de hasta burst"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, count: int, period: float, burst: int):
+        self.rate = count / period
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Segundos hasta que haya un token (0 si ya lo hay)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+class OutgoingMessage:
+    """Un envío pendiente; varias respuestas fusionadas comparten uno"""
+
+    __slots__ = ("bot", "chat_id", "text", "parse_mode", "reply_to", "label", "priority", "seq", "futures")
+
+    def __init__(self, bot, chat_id, text, parse_mode, reply_to, label, priority, seq, future):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.text = text
+        self.parse_mode = parse_mode
+        self.reply_to = reply_to
+        self.label = label
+        self.priority = priority
+        self.seq = seq
+        self.futures = [future]
+
+def escape_for(text: str, parse_mode: str) -> str:
+    """Escapa texto plano para insertarlo en un mensaje con ese parse_mode"""
+    if parse_mode == "MarkdownV2":
+        return escape_markdown(text, version=2)
+    if parse_mode == "Markdown":
+        return escape_markdown(text)
+    if parse_mode == "HTML":
+        return html.escape(text)
+    return text
+
+def _retry_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+class Outbox:
+    """Planificador único de los mensajes salientes del bot.
+
+    Cada chat tiene su cola (respuestas antes que anuncios) y su token bucket,
+    y todos comparten un bucket global. Las respuestas pendientes a un mismo
+    chat se fusionan en un solo mensaje al salir. Un RetryAfter pausa ese chat
+    el tiempo indicado y el mensaje se reintenta sin que el handler se entere.
+    Los envíos a un chat van de uno en uno, así que se mantiene el orden.
+    """
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self._queues = {}          # chat_id -> (respuestas, anuncios)
+        self._buckets = {}         # chat_id -> TokenBucket
+        self._blocked_until = {}   # chat_id -> instante (monotonic) tras un RetryAfter
+        self._busy = set()         # chats con un envío en curso
+        self._global = TokenBucket(*GLOBAL_RATE)
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._task = None
+        self._deliveries = set()
+        self.stats = Counter()     # sent, coalesced, retried, failed
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Espera (como mucho timeout segundos) a vaciar la cola y para el planificador"""
+        if self._task is None:
+            return
+        deadline = time.monotonic() + timeout
+        while (self.pending() or self._deliveries) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self.pending():
+            print(f"[WARNING] Outbox detenido con {self.pending()} mensajes sin enviar")
+
+    def pending(self) -> int:
+        return sum(len(replies) + len(announcements) for replies, announcements in self._queues.values())
+
+    async def reply(self, message, text: str, parse_mode: str = None) -> asyncio.Future:
+        """Encola una respuesta a message; devuelve un future con el mensaje enviado
+
+        No espera al envío: el future se resuelve con el Message (o None si
+        falló) cuando el planificador lo entregue.
+        """
+        user = getattr(message, "from_user", None)
+        label = (user.first_name or user.username) if user else None
+        return await self._submit(message.get_bot(), message.chat_id, text, parse_mode,
+                                  message.message_id, label, PRIORITY_REPLY)
+
+    async def send(self, bot, chat_id: int, text: str, parse_mode: str = None,
+                   priority: int = PRIORITY_ANNOUNCEMENT) -> asyncio.Future:
+        """Encola un mensaje al chat (anuncios por defecto); igual que reply()"""
+        return await self._submit(bot, chat_id, text, parse_mode, None, None, priority)
+
+    async def _submit(self, bot, chat_id, text, parse_mode, reply_to, label, priority):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        item = OutgoingMessage(bot, chat_id, text, parse_mode, reply_to, label, priority, next(self._seq), future)
+        if self._task is None:
+            # Sin planificador (scripts, pruebas): envío directo
+            await self._deliver(item)
+            return future
+        queues = self._queues.get(chat_id)
+        if queues is None:
+            queues = self._queues[chat_id] = (deque(), deque())
+        queues[priority].append(item)
+        self._wakeup.set()
+        return future
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(*(GROUP_RATE if chat_id < 0 else PRIVATE_RATE))
+        return bucket
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            delay = self._dispatch()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _dispatch(self):
+        """Lanza todos los envíos posibles ahora; devuelve cuánto esperar (None: hasta nuevo aviso)"""
+        while len(self._deliveries) < self.max_in_flight:
+            now = time.monotonic()
+            global_wait = self._global.wait_time(now)
+            if global_wait > 0:
+                return global_wait
+
+            best = best_key = None
+            next_wait = None
+            for chat_id, queues in self._queues.items():
+                if chat_id in self._busy:
+                    continue
+                head = queues[0][0] if queues[0] else queues[1][0]
+                wait = max(self._bucket(chat_id).wait_time(now), self._blocked_until.get(chat_id, 0) - now)
+                if wait > 0:
+                    next_wait = wait if next_wait is None else min(next_wait, wait)
+                    continue
+                key = (head.priority, head.seq)
+                if best_key is None or key < best_key:
+                    best, best_key = chat_id, key
+            if best is None:
+                if not self._queues:
+                    self._prune(now)
+                return next_wait
+
+            self._global.take(now)
+            self._bucket(best).take(now)
+            self._blocked_until.pop(best, None)
+            item = self._take(best)
+            self._busy.add(best)
+            task = asyncio.get_running_loop().create_task(self._deliver(item))
+            self._deliveries.add(task)
+            task.add_done_callback(self._delivered)
+        return None
+
+    def _take(self, chat_id: int) -> OutgoingMessage:
+        """Saca el siguiente envío del chat, fusionando las respuestas compatibles"""
+        queues = self._queues[chat_id]
+        queue = queues[0] if queues[0] else queues[1]
+        item = queue.popleft()
+        if item.priority == PRIORITY_REPLY and queue:
+            merged = [item]
+            length = len(item.text)
+            while queue:
+                nxt = queue[0]
+                if nxt.parse_mode != item.parse_mode or nxt.bot is not item.bot:
+                    break
+                if length + len(nxt.text) + 64 > MAX_MESSAGE_LENGTH:
+                    break
+                merged.append(queue.popleft())
+                length += len(nxt.text) + 64
+            if len(merged) > 1:
+                item = self._merge(merged)
+        if not queues[0] and not queues[1]:
+            del self._queues[chat_id]
+        return item
+
+    def _merge(self, items) -> OutgoingMessage:
+        # _take sólo junta mensajes con el mismo parse_mode
+        first = items[0]
+        labels = {item.label for item in items}
+        reply_tos = {item.reply_to for item in items}
+        parts = []
+        for item in items:
+            label = item.label
+            if label and len(labels) > 1:
+                parts.append(f"👤 {escape_for(label, item.parse_mode)}\n{item.text}")
+            else:
+                parts.append(item.text)
+        first.text = "\n\n".join(parts)
+        first.reply_to = first.reply_to if len(reply_tos) == 1 else None
+        for item in items[1:]:
+            first.futures.extend(item.futures)
+        self.stats["coalesced"] += len(items) - 1
+        return first
+
+    def _delivered(self, task):
+        self._deliveries.discard(task)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _deliver(self, item: OutgoingMessage):
+        try:
+            kwargs = {"reply_to_message_id": item.reply_to, "allow_sending_without_reply": True} if item.reply_to else {}
+            message = await item.bot.send_message(chat_id=item.chat_id, text=item.text, parse_mode=item.parse_mode, **kwargs)
+        except RetryAfter as e:
+            # Flood control de Telegram: pausar el chat y reintentar el mismo envío
+            seconds = _retry_seconds(e)
+            self.stats["retried"] += 1
+            print(f"[INFO] RetryAfter en chat {item.chat_id}: reintento en {seconds:.0f}s")
+            if not self._requeue(item, seconds):
+                self._resolve(item, None)
+        except BadRequest as e:
+            if not item.parse_mode:
+                self.stats["failed"] += 1
+                print(f"[ERROR] Error enviando mensaje a {item.chat_id}: {e}")
+                self._resolve(item, None)
+                return
+            # Markdown mal formado (p. ej. un texto recortado): reintentar como texto plano
+            print(f"[ERROR] Mensaje a {item.chat_id} rechazado ({e}), reintento sin formato")
+            item.parse_mode = None
+            if not self._requeue(item):
+                await self._deliver(item)
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"[ERROR] Error enviando mensaje a {item.chat_id}: {e}")
+            self._resolve(item, None)
+        else:
+            self.stats["sent"] += 1
+            self._resolve(item, message)
+        finally:
+            self._busy.discard(item.chat_id)
+
+    def _requeue(self, item: OutgoingMessage, delay: float = 0.0) -> bool:
+        """Vuelve a poner el envío al frente de su cola (False si no hay planificador)"""
+        if self._task is None:
+            return False
+        self._blocked_until[item.chat_id] = time.monotonic() + delay
+        queues = self._queues.get(item.chat_id)
+        if queues is None:
+            queues = self._queues[item.chat_id] = (deque(), deque())
+        queues[item.priority].appendleft(item)
+        return True
+
+    @staticmethod
+    def _resolve(item: OutgoingMessage, message):
+        for future in item.futures:
+            if not future.done():
+                future.set_result(message)
+
+    def _prune(self, now: float):
+        # Chats sin nada pendiente y con el bucket lleno no necesitan estado
+        for chat_id in [chat_id for chat_id, bucket in self._buckets.items() if bucket.full(now)]:
+            del self._buckets[chat_id]
+        for chat_id in [chat_id for chat_id, until in self._blocked_until.items() if until <= now]:
+            del self._blocked_until[chat_id]
+
+outbox = Outbox()
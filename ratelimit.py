@@ -0,0 +1,156 @@
+# ratelimit.py - Limitador GCRA con memoria constante por usuario
+import time
+from array import array
+from collections import Counter
+
+class RateLimiter:
+    """Generic Cell Rate Algorithm sobre los límites (max_count, window[, burst]) por acción.
+
+    Como el registro de timestamps al que sustituye, deja pasar max_count
+    acciones seguidas (o burst, si se indica uno menor) y mantiene un ritmo
+    sostenido de max_count por window. La diferencia: cada acción se recupera
+    window / max_count segundos después y no al salir de la ventana, así que
+    tras una ráfaga completa caben hasta 2 * max_count - 1 acciones en una
+    misma ventana (nunca más de max_count + window / intervalo).
+
+    Un usuario guarda sólo su "tiempo teórico de llegada" (TAT) por
+    acción, un float en una columna array('d') indexada por su slot. Una
+    comprobación es O(1) y no crea objetos. Cuando el TAT de todas sus
+    acciones ya pasó, el usuario no tiene estado que recordar y sweep() libera
+    su slot para reutilizarlo.
+
+    Con track_changes, el consumo aceptado se acumula por (usuario, acción)
+    para compartirlo en lote con otros procesos: drain() lo entrega y merge()
+    incorpora los TAT que llegan del estado compartido.
+    """
+
+    EPSILON = 1e-9  # tolerancia de coma flotante en la comparación
+
+    def __init__(self, limits: dict, default=(10, 60), track_changes: bool = False):
+        self.limits = limits    # acción -> (max_count, window_seconds[, burst]); se lee en cada uso
+        self.default = default
+        self._slots = {}        # user_id -> slot
+        self._owners = []       # slot -> user_id (None si está libre)
+        self._free = []
+        self._tat = {}          # acción -> array('d') de TAT por slot
+        self.checks = Counter()   # acción -> comprobaciones
+        self.limited = Counter()  # acción -> veces que se aplicó el límite
+        # (user_id, acción) -> [inicio, coste] aceptado desde el último drain()
+        self._pending = {} if track_changes else None
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _params(self, action: str):
+        """(intervalo entre acciones, tolerancia) de la acción"""
+        limit = self.limits.get(action, self.default)
+        max_count, window = limit[0], limit[1]
+        burst = max(1, min(limit[2] if len(limit) > 2 else max_count, max_count))
+        # Ritmo sostenido max_count / window; ráfaga de hasta burst seguidas
+        interval = window / max_count
+        return interval, (burst - 1) * interval
+
+    def _column(self, action: str) -> array:
+        column = self._tat.get(action)
+        if column is None:
+            column = self._tat[action] = array('d', bytes(8 * len(self._owners)))
+        return column
+
+    def _allocate(self, user_id: int) -> int:
+        if self._free:
+            slot = self._free.pop()
+            for column in self._tat.values():
+                column[slot] = 0.0
+            self._owners[slot] = user_id
+        else:
+            slot = len(self._owners)
+            self._owners.append(user_id)
+            for column in self._tat.values():
+                column.append(0.0)
+        self._slots[user_id] = slot
+        return slot
+
+    def hit(self, user_id: int, action: str, now: float = None) -> bool:
+        """Registra un intento; True si excede el límite (el intento no cuenta)"""
+        now = time.time() if now is None else now
+        interval, tolerance = self._params(action)
+        self.checks[action] += 1
+
+        column = self._column(action)
+        slot = self._slots.get(user_id)
+        tat = max(column[slot], now) if slot is not None else now
+        if tat - now > tolerance + self.EPSILON:
+            self.limited[action] += 1
+            return True
+
+        if slot is None:
+            slot = self._allocate(user_id)
+        column[slot] = tat + interval
+        if self._pending is not None:
+            pending = self._pending.get((user_id, action))
+            if pending is None:
+                self._pending[(user_id, action)] = [tat, interval]
+            else:
+                pending[1] += interval
+        return False
+
+    def drain(self) -> list:
+        """Consumo pendiente [(user_id, acción, inicio, coste)]; lo deja vacío"""
+        if not self._pending:
+            return []
+        pending, self._pending = self._pending, {}
+        return [(user_id, action, start, cost) for (user_id, action), (start, cost) in pending.items()]
+
+    def requeue(self, consumed):
+        """Devuelve a pendientes un drain() que no se pudo compartir"""
+        for user_id, action, start, cost in consumed:
+            pending = self._pending.get((user_id, action))
+            if pending is None:
+                self._pending[(user_id, action)] = [start, cost]
+            else:
+                pending[0] = min(pending[0], start)
+                pending[1] += cost
+
+    def merge(self, tats, now: float = None):
+        """Incorpora TAT externos [(user_id, acción, tat)]; gana el más tardío"""
+        now = time.time() if now is None else now
+        for user_id, action, tat in tats:
+            if tat <= now:
+                continue
+            column = self._column(action)
+            slot = self._slots.get(user_id)
+            if slot is None:
+                slot = self._allocate(user_id)
+            if tat > column[slot]:
+                column[slot] = tat
+
+    def sweep(self, now: float = None) -> int:
+        """Libera los slots de usuarios sin estado pendiente; devuelve cuántos"""
+        now = time.time() if now is None else now
+        columns = list(self._tat.values())
+        evicted = 0
+        for slot, user_id in enumerate(self._owners):
+            if user_id is None:
+                continue
+            if all(column[slot] <= now for column in columns):
+                del self._slots[user_id]
+                self._owners[slot] = None
+                self._free.append(slot)
+                evicted += 1
+        return evicted
+
+    def reset(self):
+        self._slots.clear()
+        self._owners.clear()
+        self._free.clear()
+        self._tat.clear()
+        if self._pending is not None:
+            self._pending.clear()
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._slots),
+            "slots": len(self._owners),
+            "checks": dict(self.checks),
+            "limited": dict(self.limited),
+        }
@@ -0,0 +1,200 @@
+# rules.py - Reglas de puntuación (rules.json) validadas y compiladas una vez
+#
+# Puntos por hashtag, validaciones de contenido, retos semanales y diarios se
+# leen de un único fichero. Al cargar se validan, se compilan las expresiones
+# y se registran los términos en el matcher; el camino caliente sólo lee el
+# objeto ya compilado. reload_rules() construye uno nuevo y lo sustituye de
+# golpe: si el fichero nuevo tiene errores, siguen vigentes las reglas previas.
+import json
+import os
+import re
+import threading
+from datetime import datetime
+
+from matcher import register_terms
+
+RULES_PATH = os.environ.get("RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.json"))
+
+_HASHTAG = re.compile(r"#\w+")
+_WEEKLY_FIELDS = ("id", "title", "description", "hashtag", "bonus_points", "validation_keywords", "validation_type")
+
+class RuleError(ValueError):
+    """rules.json no se pudo cargar o no es válido"""
+
+class HashtagValidation:
+    __slots__ = ("min_words", "bonus_patterns")
+
+    def __init__(self, min_words: int, bonus_patterns: tuple):
+        self.min_words = min_words
+        self.bonus_patterns = bonus_patterns  # expresiones ya compiladas (IGNORECASE)
+
+class Rules:
+    """Reglas compiladas; inmutables una vez construidas (se reemplazan enteras)"""
+
+    __slots__ = ("points", "hashtags", "validations", "weekly_challenges", "daily_challenges",
+                 "admin_ids", "path", "loaded_at")
+
+    def __init__(self, points, validations, weekly_challenges, daily_challenges, admin_ids, path):
+        self.points = points                        # hashtag -> puntos, en el orden del fichero
+        self.hashtags = tuple(points)
+        self.validations = validations              # hashtag -> HashtagValidation
+        self.weekly_challenges = weekly_challenges  # tupla de dicts
+        self.daily_challenges = daily_challenges    # tupla de dicts (lunes = 0)
+        self.admin_ids = admin_ids                  # frozenset de user_id
+        self.path = path
+        self.loaded_at = datetime.utcnow()
+
+    def summary(self) -> str:
+        return (f"{len(self.points)} hashtags, {len(self.validations)} validaciones, "
+                f"{len(self.weekly_challenges)} retos semanales, {len(self.daily_challenges)} diarios, "
+                f"{len(self.admin_ids)} admins")
+
+def _require(condition, message: str):
+    if not condition:
+        raise RuleError(message)
+
+def _is_count(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+def _hashtag(value, where: str) -> str:
+    _require(isinstance(value, str) and _HASHTAG.fullmatch(value), f"{where}: hashtag inválido {value!r}")
+    return value.lower()
+
+def _compile_points(raw) -> dict:
+    _require(isinstance(raw, dict) and raw, "points: debe ser un objeto con al menos un hashtag")
+    points = {}
+    for tag, value in raw.items():
+        tag = _hashtag(tag, "points")
+        _require(_is_count(value) and value > 0, f"points[{tag}]: los puntos deben ser un entero positivo")
+        points[tag] = value
+    return points
+
+def _compile_validations(raw, points: dict) -> dict:
+    _require(isinstance(raw, dict), "hashtag_validations: debe ser un objeto")
+    validations = {}
+    for tag, spec in raw.items():
+        tag = _hashtag(tag, "hashtag_validations")
+        where = f"hashtag_validations[{tag}]"
+        _require(tag in points, f"{where}: el hashtag no está en points")
+        _require(isinstance(spec, dict), f"{where}: debe ser un objeto")
+        min_words = spec.get("min_words", 0)
+        _require(_is_count(min_words), f"{where}.min_words: debe ser un entero >= 0")
+        patterns = spec.get("bonus_patterns", [])
+        _require(isinstance(patterns, list), f"{where}.bonus_patterns: debe ser una lista")
+        compiled = []
+        for pattern in patterns:
+            try:
+                compiled.append(re.compile(pattern, re.IGNORECASE))
+            except (re.error, TypeError) as e:
+                raise RuleError(f"{where}.bonus_patterns: expresión inválida {pattern!r}: {e}")
+        validations[tag] = HashtagValidation(min_words, tuple(compiled))
+    return validations
+
+def _keywords(value, where: str) -> list:
+    _require(isinstance(value, list) and all(isinstance(word, str) and word.strip() for word in value),
+             f"{where}: debe ser una lista de palabras")
+    return list(value)
+
+def _compile_weekly(raw) -> tuple:
+    _require(isinstance(raw, list) and raw, "weekly_challenges: debe ser una lista no vacía")
+    challenges = []
+    for index, spec in enumerate(raw):
+        where = f"weekly_challenges[{index}]"
+        _require(isinstance(spec, dict), f"{where}: debe ser un objeto")
+        missing = [field for field in _WEEKLY_FIELDS if field not in spec]
+        _require(not missing, f"{where}: faltan campos {', '.join(missing)}")
+        _require(_is_count(spec["bonus_points"]), f"{where}.bonus_points: debe ser un entero >= 0")
+        challenge = dict(spec)
+        challenge["hashtag"] = _hashtag(spec["hashtag"], where)
+        challenge["validation_keywords"] = _keywords(spec["validation_keywords"], f"{where}.validation_keywords")
+        challenges.append(challenge)
+    return tuple(challenges)
+
+def _compile_daily(raw) -> tuple:
+    _require(isinstance(raw, list) and raw, "daily_challenges: debe ser una lista no vacía")
+    challenges = []
+    for index, spec in enumerate(raw):
+        where = f"daily_challenges[{index}]"
+        _require(isinstance(spec, dict), f"{where}: debe ser un objeto")
+        _require("hashtag" in spec or "keywords" in spec, f"{where}: necesita hashtag o keywords")
+        _require(_is_count(spec.get("bonus_points")), f"{where}.bonus_points: debe ser un entero >= 0")
+        _require(_is_count(spec.get("min_words", 0)), f"{where}.min_words: debe ser un entero >= 0")
+        challenge = dict(spec)
+        if "hashtag" in spec:
+            challenge["hashtag"] = _hashtag(spec["hashtag"], where)
+        if "keywords" in spec:
+            challenge["keywords"] = _keywords(spec["keywords"], f"{where}.keywords")
+        challenges.append(challenge)
+    return tuple(challenges)
+
+def parse_admin_ids(raw: str) -> frozenset:
+    try:
+        return frozenset(int(part) for part in (raw or "").split(",") if part.strip())
+    except ValueError:
+        raise RuleError(f"ADMIN_IDS: lista de ids inválida {raw!r}")
+
+def compile_rules(data: dict, admin_ids: frozenset = frozenset(), path: str = None) -> Rules:
+    """Valida y compila el contenido de rules.json; RuleError si algo no cuadra"""
+    _require(isinstance(data, dict), "el fichero debe contener un objeto JSON")
+    points = _compile_points(data.get("points"))
+    return Rules(
+        points=points,
+        validations=_compile_validations(data.get("hashtag_validations", {}), points),
+        weekly_challenges=_compile_weekly(data.get("weekly_challenges")),
+        daily_challenges=_compile_daily(data.get("daily_challenges")),
+        admin_ids=admin_ids,
+        path=path,
+    )
+
+def load_rules(path: str = None) -> Rules:
+    """Lee y compila un fichero de reglas (ADMIN_IDS se toma del entorno)"""
+    path = path or RULES_PATH
+    try:
+        with open(path, encoding="utf-8") as fp:
+            data = json.load(fp)
+    except (OSError, ValueError) as e:
+        raise RuleError(f"No se pudo leer {path}: {e}")
+    return compile_rules(data, parse_admin_ids(os.environ.get("ADMIN_IDS", "")), path)
+
+def _register(rules: Rules):
+    # Términos para la pasada única del matcher
+    register_terms("hashtags", rules.points)
+    register_terms("weekly_challenges", (
+        term
+        for challenge in rules.weekly_challenges
+        for term in (challenge["hashtag"], *challenge["validation_keywords"])
+    ))
+    register_terms("daily_challenges", (
+        term
+        for challenge in rules.daily_challenges
+        for term in (challenge.get("hashtag"), *challenge.get("keywords", ()))
+    ))
+
+_rules = None
+_lock = threading.Lock()
+
+def get_rules() -> Rules:
+    """Reglas vigentes (se cargan en el primer uso)"""
+    rules = _rules
+    if rules is None:
+        with _lock:
+            if _rules is None:
+                _install(load_rules())
+            rules = _rules
+    return rules
+
+def _install(rules: Rules):
+    global _rules
+    _register(rules)
+    _rules = rules  # cambio atómico: los lectores ven las reglas viejas o las nuevas
+
+def reload_rules(path: str = None) -> Rules:
+    """Recarga el fichero y cambia las reglas de golpe (RuleError deja las anteriores)"""
+    rules = load_rules(path)
+    with _lock:
+        _install(rules)
+    print(f"[INFO] Reglas recargadas desde {rules.path}: {rules.summary()}")
+    return rules
+
+def is_admin(user_id: int) -> bool:
+    return user_id in get_rules().admin_ids
@@ -0,0 +1,234 @@
+# simhash.py - Huellas SimHash de 64 bits e índice de casi-duplicados recientes
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from hashlib import blake2b
+
+BITS = 64
+BANDS = 8                  # 8 bandas de 8 bits para la búsqueda
+MAX_DISTANCE = 12          # bits distintos como máximo para considerarse copia
+MIN_TOKENS = 8             # los textos más cortos no tienen huella estable
+WINDOW_SECONDS = float(os.environ.get("DUPLICATE_WINDOW_HOURS", "168")) * 3600
+MAX_PER_CHAT = 5000
+MAX_PER_USER = 200
+
+_WORD = re.compile(r"\w+")
+_BAND_BITS = BITS // BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+
+# Cada bit de la huella de un término suma 1 en su carril de 16 bits de un
+# entero grande: sumar los términos cuenta los unos de cada posición a la vez
+_LANE = 16
+_SPREAD = tuple(
+    tuple(sum(1 << (_LANE * (8 * byte + bit)) for bit in range(8) if value >> bit & 1) for value in range(256))
+    for byte in range(8)
+)
+_LANE_MASK = (1 << _LANE) - 1
+# Valor de una banda y los que están a un bit de distancia
+_PROBES = tuple((key, *(key ^ (1 << bit) for bit in range(_BAND_BITS))) for key in range(1 << _BAND_BITS))
+_MAX_FEATURES = _LANE_MASK
+
+def fingerprint_tokens(tokens):
+    """SimHash de 64 bits de una lista de palabras (None si hay menos de MIN_TOKENS)
+
+    Las características son las palabras distintas: con pares de palabras un
+    solo cambio altera tres términos y las copias retocadas se alejan más.
+    """
+    tokens = list(tokens)
+    if len(tokens) < MIN_TOKENS:
+        return None
+    terms = set(tokens)
+    if len(terms) > _MAX_FEATURES:
+        terms = set(list(terms)[:_MAX_FEATURES])
+    s0, s1, s2, s3, s4, s5, s6, s7 = _SPREAD
+    total = 0
+    for term in terms:
+        d = blake2b(term.encode("utf-8"), digest_size=8).digest()
+        total += s0[d[0]] + s1[d[1]] + s2[d[2]] + s3[d[3]] + s4[d[4]] + s5[d[5]] + s6[d[6]] + s7[d[7]]
+    half = len(terms) // 2
+    result = 0
+    for bit in range(BITS):
+        if (total >> (_LANE * bit)) & _LANE_MASK > half:
+            result |= 1 << bit
+    return result
+
+def fingerprint(text: str):
+    return fingerprint_tokens(_WORD.findall((text or "").lower()))
+
+def distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+class DuplicateMatch:
+    """Mensaje anterior del que el nuevo es casi una copia"""
+
+    __slots__ = ("user_id", "chat_id", "message_id", "timestamp", "distance")
+
+    def __init__(self, entry, distance: int):
+        self.user_id = entry.user_id
+        self.chat_id = entry.chat_id
+        self.message_id = entry.message_id
+        self.timestamp = entry.timestamp
+        self.distance = distance
+
+class _Entry:
+    __slots__ = ("fingerprint", "user_id", "chat_id", "message_id", "timestamp")
+
+    def __init__(self, fingerprint, user_id, chat_id, message_id, timestamp):
+        self.fingerprint = fingerprint
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.timestamp = timestamp
+
+class _Window:
+    """Huellas recientes de un ámbito (un chat o un usuario) con sus tablas por banda"""
+
+    __slots__ = ("entries", "bands", "limit")
+
+    def __init__(self, limit: int):
+        self.entries = deque()
+        self.bands = [{} for _ in range(BANDS)]  # valor de la banda -> deque de entradas
+        self.limit = limit
+
+    def add(self, entry: _Entry):
+        self.entries.append(entry)
+        fp = entry.fingerprint
+        for band, table in enumerate(self.bands):
+            key = (fp >> (band * _BAND_BITS)) & _BAND_MASK
+            bucket = table.get(key)
+            if bucket is None:
+                bucket = table[key] = deque()
+            bucket.append(entry)
+        while len(self.entries) > self.limit:
+            self._pop_oldest()
+
+    def _pop_oldest(self):
+        # Las entradas salen en orden de llegada: en cada cubo también es la primera
+        entry = self.entries.popleft()
+        fp = entry.fingerprint
+        for band, table in enumerate(self.bands):
+            key = (fp >> (band * _BAND_BITS)) & _BAND_MASK
+            bucket = table[key]
+            bucket.popleft()
+            if not bucket:
+                del table[key]
+
+    def expire(self, oldest: float):
+        while self.entries and self.entries[0].timestamp < oldest:
+            self._pop_oldest()
+
+    def buckets(self, fp: int):
+        """Cubos con las huellas que pueden estar cerca de fp (una huella puede repetirse)"""
+        # Con d bits distintos, alguna banda difiere en d // BANDS bits como mucho:
+        # probar cada banda y sus vecinas a un bit cubre hasta 2 * BANDS - 1
+        found = []
+        for band, table in enumerate(self.bands):
+            get = table.get
+            for probe in _PROBES[(fp >> (band * _BAND_BITS)) & _BAND_MASK]:
+                bucket = get(probe)
+                if bucket:
+                    found.append(bucket)
+        return found
+
+class NearDuplicateIndex:
+    """Casi-duplicados entre los mensajes recientes de cada chat y de cada usuario.
+
+    Sólo se comparan las huellas de los cubos de cada banda (y sus vecinos a
+    un bit), que incluyen todas las que están a MAX_DISTANCE o menos. La
+    memoria está acotada por la ventana de tiempo y por MAX_PER_CHAT /
+    MAX_PER_USER huellas por ámbito; los ámbitos sin actividad dentro de la
+    ventana se olvidan en add() aunque no se vuelvan a usar.
+    """
+
+    def __init__(self, max_distance: int = MAX_DISTANCE, window_seconds: float = WINDOW_SECONDS,
+                 max_per_chat: int = MAX_PER_CHAT, max_per_user: int = MAX_PER_USER):
+        self.max_distance = max_distance
+        self.window_seconds = window_seconds
+        self.max_per_chat = max_per_chat
+        self.max_per_user = max_per_user
+        # Ordenados por último add(): los primeros son los más inactivos
+        self._chats = OrderedDict()   # chat_id -> _Window
+        self._users = OrderedDict()   # user_id -> _Window (copias del mismo usuario entre chats)
+
+    def __len__(self):
+        return sum(len(window.entries) for window in self._chats.values())
+
+    def _best(self, window, fp, user_id, chat_id, message_id, oldest):
+        if window is None:
+            return None
+        window.expire(oldest)
+        max_distance = self.max_distance
+        best = None
+        for bucket in window.buckets(fp):
+            for entry in bucket:
+                d = (fp ^ entry.fingerprint).bit_count()
+                if d > max_distance:
+                    continue
+                if entry.chat_id == chat_id and entry.message_id == message_id and message_id is not None:
+                    continue  # el mismo mensaje reentregado
+                # Una copia propia pesa más que una ajena; después, la más parecida
+                key = (entry.user_id != user_id, d)
+                if best is None or key < best[0]:
+                    best = (key, entry, d)
+        return best
+
+    def check(self, chat_id: int, user_id: int, fp, message_id: int = None, now: float = None):
+        """Mensaje reciente del que fp es casi una copia (DuplicateMatch) o None"""
+        if fp is None:
+            return None
+        now = time.time() if now is None else now
+        oldest = now - self.window_seconds
+        found = [
+            best for best in (
+                self._best(self._chats.get(chat_id), fp, user_id, chat_id, message_id, oldest),
+                self._best(self._users.get(user_id), fp, user_id, chat_id, message_id, oldest),
+            ) if best is not None
+        ]
+        if not found:
+            return None
+        _, entry, d = min(found, key=lambda best: best[0])
+        return DuplicateMatch(entry, d)
+
+    def add(self, chat_id: int, user_id: int, fp, message_id: int = None, now: float = None):
+        if fp is None:
+            return
+        now = time.time() if now is None else now
+        entry = _Entry(fp, user_id, chat_id, message_id, now)
+        oldest = now - self.window_seconds
+        for windows, key, limit in ((self._chats, chat_id, self.max_per_chat), (self._users, user_id, self.max_per_user)):
+            window = windows.get(key)
+            if window is None:
+                window = windows[key] = _Window(limit)
+            else:
+                windows.move_to_end(key)
+            window.add(entry)
+            self._drop_idle(windows, oldest)
+
+    @staticmethod
+    def _drop_idle(windows, oldest: float):
+        """Olvida los ámbitos cuya huella más reciente ya está fuera de la ventana"""
+        while windows:
+            window = next(iter(windows.values()))
+            if window.entries and window.entries[-1].timestamp >= oldest:
+                break
+            windows.popitem(last=False)
+
+    def check_and_add(self, chat_id: int, user_id: int, fp, message_id: int = None, now: float = None):
+        """check() y, si no es copia, recuerda la huella (en un solo paso, sin awaits entre medias)"""
+        match = self.check(chat_id, user_id, fp, message_id, now)
+        if match is None:
+            self.add(chat_id, user_id, fp, message_id, now)
+        return match
+
+    def sweep(self, now: float = None) -> int:
+        """Caduca huellas fuera de la ventana y olvida ámbitos vacíos; devuelve cuántos"""
+        oldest = (time.time() if now is None else now) - self.window_seconds
+        dropped = 0
+        for windows in (self._chats, self._users):
+            for key in list(windows):
+                windows[key].expire(oldest)
+                if not windows[key].entries:
+                    del windows[key]
+                    dropped += 1
+        return dropped
@@ -0,0 +1,257 @@
+# spamclf.py - Clasificador lineal de spam sobre n-gramas hasheados
+#
+# Entrenamiento (offline, requiere NumPy):
+#   python spamclf.py train mensajes.jsonl --out spam_model.bin
+# donde cada línea es {"text": "...", "spam": 0|1}.
+#
+# En el bot sólo se usa la biblioteca estándar: los pesos se cargan en un
+# array('f') y puntuar un mensaje es un producto escalar disperso (la suma de
+# los pesos de sus n-gramas) seguido de una sigmoide.
+import argparse
+import json
+import math
+import os
+import random
+import re
+import struct
+import sys
+import zlib
+from array import array
+
+SPAM_MODEL_PATH = os.environ.get("SPAM_MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "spam_model.bin"))
+
+HASH_BITS = 18             # 262144 pesos float32 (1 MB)
+CHAR_NGRAMS = (3, 5)       # n-gramas de caracteres, de 3 a 5
+WORD_NGRAMS = (1, 2)       # palabras sueltas y pares
+
+_MAGIC = b"PSPM"
+_HEADER = struct.Struct("<4sBBBBBf")  # magic, versión, bits, char min/max, word max, bias
+_VERSION = 1
+_WORD = re.compile(r"\w+|[^\w\s]")
+_DIGITS = re.compile(r"\d")
+
+def _sigmoid(z: float) -> float:
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+class SpamClassifier:
+    """Regresión logística sobre n-gramas de caracteres y palabras hasheados.
+
+    Las características son binarias y se normalizan por 1/sqrt(n), así que
+    un mensaje largo no suma más que uno corto sólo por su longitud. El hash
+    es crc32 (estable entre procesos, a diferencia de hash()).
+    """
+
+    def __init__(self, weights: array, bias: float = 0.0, hash_bits: int = HASH_BITS,
+                 char_ngrams=CHAR_NGRAMS, word_ngrams=WORD_NGRAMS):
+        if len(weights) != 1 << hash_bits:
+            raise ValueError(f"Se esperaban {1 << hash_bits} pesos, hay {len(weights)}")
+        self.weights = weights
+        self.bias = bias
+        self.hash_bits = hash_bits
+        self.char_ngrams = tuple(char_ngrams)
+        self.word_ngrams = tuple(word_ngrams)
+
+    @classmethod
+    def empty(cls, hash_bits: int = HASH_BITS, **kwargs):
+        return cls(array('f', bytes(4 << hash_bits)), 0.0, hash_bits, **kwargs)
+
+    def features(self, text: str) -> list:
+        """Índices (sin repetir) de los n-gramas del texto"""
+        return list(hashed_features(text, self.hash_bits, self.char_ngrams, self.word_ngrams))
+
+    def decision(self, features) -> float:
+        if not features:
+            return self.bias
+        weights = self.weights
+        return self.bias + sum(weights[i] for i in features) / math.sqrt(len(features))
+
+    def score(self, text: str) -> float:
+        """Probabilidad de spam del texto (0..1)"""
+        return _sigmoid(self.decision(self.features(text)))
+
+    def score_batch(self, texts) -> list:
+        """Probabilidades de muchos textos (backfills); vectorizado si NumPy está disponible"""
+        texts = list(texts)
+        try:
+            import numpy as np
+        except ImportError:
+            return [self.score(text) for text in texts]
+        indices, offsets, scales = _sparse_rows(self, texts, np)
+        weights = np.frombuffer(self.weights, dtype=np.float32)
+        return _predict(np, weights, self.bias, indices, offsets, scales, len(texts)).tolist()
+
+    def to_bytes(self) -> bytes:
+        header = _HEADER.pack(_MAGIC, _VERSION, self.hash_bits, self.char_ngrams[0],
+                              self.char_ngrams[1], self.word_ngrams[1], self.bias)
+        weights = self.weights
+        if sys.byteorder != "little":
+            weights = array('f', weights)
+            weights.byteswap()
+        return header + weights.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        """Modelo serializado con to_bytes(); ValueError si está truncado o corrupto"""
+        if len(data) < _HEADER.size:
+            raise ValueError(f"Modelo de spam truncado: {len(data)} bytes")
+        magic, version, bits, char_min, char_max, word_max, bias = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("No es un modelo de spam de Puntum (o es de otra versión)")
+        if not 1 <= bits <= 30 or not 1 <= char_min <= char_max or word_max < 1 or not math.isfinite(bias):
+            raise ValueError("Cabecera del modelo de spam corrupta")
+        expected = _HEADER.size + (4 << bits)
+        if len(data) != expected:
+            raise ValueError(f"Modelo de spam corrupto: {len(data)} bytes, se esperaban {expected}")
+        weights = array('f')
+        weights.frombytes(data[_HEADER.size:])
+        if sys.byteorder != "little":
+            weights.byteswap()
+        return cls(weights, bias, bits, (char_min, char_max), (1, word_max))
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as fp:
+            fp.write(self.to_bytes())
+        os.replace(tmp_path, path)
+
+def load_model(path: str = None):
+    """Modelo guardado en path (SPAM_MODEL_PATH por defecto); None si no existe"""
+    path = path or SPAM_MODEL_PATH
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as fp:
+        return SpamClassifier.from_bytes(fp.read())
+
+def normalize(text: str) -> str:
+    # Minúsculas y dígitos colapsados: "50%" y "70%" son la misma característica
+    return _DIGITS.sub("0", (text or "").lower())
+
+def hashed_features(text: str, hash_bits: int = HASH_BITS, char_ngrams=CHAR_NGRAMS, word_ngrams=WORD_NGRAMS) -> set:
+    mask = (1 << hash_bits) - 1
+    text = normalize(text)
+    features = set()
+    padded = f" {' '.join(text.split())} ".encode("utf-8")
+    low, high = char_ngrams
+    for n in range(low, high + 1):
+        seed = n  # n-gramas de distinto tamaño no comparten cubos
+        for start in range(len(padded) - n + 1):
+            features.add(zlib.crc32(padded[start:start + n], seed) & mask)
+    words = _WORD.findall(text)
+    for n in range(word_ngrams[0], word_ngrams[1] + 1):
+        seed = 0x100 + n
+        for start in range(len(words) - n + 1):
+            features.add(zlib.crc32(" ".join(words[start:start + n]).encode("utf-8"), seed) & mask)
+    return features
+
+def _sparse_rows(model: SpamClassifier, texts, np):
+    """Matriz dispersa por filas (CSR sin scipy): índices, inicio de cada fila y escala"""
+    rows = [model.features(text) for text in texts]
+    lengths = np.fromiter((len(row) for row in rows), dtype=np.int64, count=len(rows))
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    indices = np.fromiter((i for row in rows for i in row), dtype=np.int64, count=int(offsets[-1]))
+    scales = np.where(lengths > 0, 1.0 / np.sqrt(np.maximum(lengths, 1)), 0.0)
+    return indices, offsets, scales
+
+def _row_sums(np, values, offsets, count):
+    sums = np.zeros(count)
+    nonempty = offsets[1:] > offsets[:-1]
+    if values.size:
+        sums[nonempty] = np.add.reduceat(values, offsets[:-1][nonempty])
+    return sums
+
+def _predict(np, weights, bias, indices, offsets, scales, count):
+    z = bias + _row_sums(np, weights[indices].astype(np.float64), offsets, count) * scales
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -35, 35)))
+
+def train(texts, labels, hash_bits: int = HASH_BITS, epochs: int = 30, learning_rate: float = 0.5,
+          l2: float = 1e-6, seed: int = 13) -> SpamClassifier:
+    """Entrena con Adagrad por lotes completos; requiere NumPy"""
+    import numpy as np
+
+    model = SpamClassifier.empty(hash_bits)
+    texts = list(texts)
+    y = np.asarray(labels, dtype=np.float64)
+    indices, offsets, scales = _sparse_rows(model, texts, np)
+    row_of = np.repeat(np.arange(len(texts)), np.diff(offsets))
+    values = scales[row_of]
+
+    size = 1 << hash_bits
+    weights = np.zeros(size)
+    bias = float(np.log((y.mean() + 1e-6) / (1 - y.mean() + 1e-6)))
+    history = np.full(size, 1e-8)
+    bias_history = 1e-8
+    # Clases desequilibradas: cada clase pesa lo mismo en la pérdida
+    positives = max(y.sum(), 1.0)
+    negatives = max(len(y) - y.sum(), 1.0)
+    sample_weight = np.where(y > 0, len(y) / (2 * positives), len(y) / (2 * negatives))
+
+    for _ in range(epochs):
+        z = bias + _row_sums(np, weights[indices] * values, offsets, len(texts))
+        p = 1.0 / (1.0 + np.exp(-np.clip(z, -35, 35)))
+        error = (p - y) * sample_weight / len(texts)
+        grad = np.bincount(indices, weights=error[row_of] * values, minlength=size) + l2 * weights
+        history += grad * grad
+        weights -= learning_rate * grad / np.sqrt(history)
+        bias_grad = float(error.sum())
+        bias_history += bias_grad * bias_grad
+        bias -= learning_rate * bias_grad / math.sqrt(bias_history)
+
+    model.weights = array('f', weights.astype(np.float32).tobytes())
+    model.bias = bias
+    return model
+
+def read_labeled(path: str):
+    """Mensajes etiquetados de un JSONL ({"text", "spam"}); devuelve (textos, etiquetas)"""
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            texts.append(row["text"])
+            labels.append(1 if row["spam"] else 0)
+    return texts, labels
+
+def evaluate(model: SpamClassifier, texts, labels, threshold: float = 0.5) -> dict:
+    predicted = [p >= threshold for p in model.score_batch(texts)]
+    tp = sum(1 for p, y in zip(predicted, labels) if p and y)
+    fp = sum(1 for p, y in zip(predicted, labels) if p and not y)
+    fn = sum(1 for p, y in zip(predicted, labels) if not p and y)
+    return {
+        "precision": tp / (tp + fp) if tp + fp else 0.0,
+        "recall": tp / (tp + fn) if tp + fn else 0.0,
+        "accuracy": sum(1 for p, y in zip(predicted, labels) if p == bool(y)) / max(len(labels), 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Entrena el clasificador de spam a partir de mensajes etiquetados")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train_cmd = sub.add_parser("train", help="entrenar y guardar el modelo")
+    train_cmd.add_argument("path", help="JSONL con {\"text\", \"spam\"} por línea")
+    train_cmd.add_argument("--out", default=SPAM_MODEL_PATH, help="fichero del modelo")
+    train_cmd.add_argument("--bits", type=int, default=HASH_BITS, help="log2 del número de pesos")
+    train_cmd.add_argument("--epochs", type=int, default=30)
+    train_cmd.add_argument("--holdout", type=float, default=0.1, help="fracción reservada para evaluar")
+    args = parser.parse_args()
+
+    texts, labels = read_labeled(args.path)
+    order = list(range(len(texts)))
+    random.Random(13).shuffle(order)
+    cut = int(len(order) * (1 - args.holdout))
+    train_rows, test_rows = order[:cut], order[cut:]
+
+    model = train([texts[i] for i in train_rows], [labels[i] for i in train_rows], args.bits, args.epochs)
+    if test_rows:
+        metrics = evaluate(model, [texts[i] for i in test_rows], [labels[i] for i in test_rows])
+        print(f"[INFO] Holdout ({len(test_rows)} mensajes): precisión {metrics['precision']:.3f}, "
+              f"recall {metrics['recall']:.3f}, exactitud {metrics['accuracy']:.3f}")
+    model.save(args.out)
+    print(f"[INFO] Modelo guardado en {args.out} ({os.path.getsize(args.out) // 1024} KB, "
+          f"{len(texts)} mensajes, {sum(labels)} spam)")
+
+if __name__ == "__main__":
+    main()
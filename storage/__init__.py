@@ -0,0 +1,76 @@
+# storage/__init__.py - Interfaz de almacenamiento intercambiable (SQLite o memoria)
+import os
+import threading
+from typing import Protocol, runtime_checkable
+
+@runtime_checkable
+class StorageBackend(Protocol):
+    """Operaciones de almacenamiento que usan los handlers (a través de db_async).
+
+    blocking indica si las llamadas hacen I/O y deben ir al executor; las
+    consultas *_ready() dicen si una lectura se responde desde memoria.
+    """
+
+    name: str
+    blocking: bool
+
+    def open(self): ...
+    def close(self): ...
+
+    # Premios y logros
+    def add_points_batch(self, awards) -> dict: ...
+    def add_achievement(self, user_id: int, achievement_id: int): ...
+    def message_scored(self, chat_id: int, message_id: int) -> bool: ...
+
+    # Estadísticas
+    def get_user_total_points(self, user_id: int) -> int: ...
+    def get_user_stats(self, user_id: int): ...
+    def get_cached_user_stats(self, user_id: int): ...
+
+    # Rankings
+    def leaderboard_ready(self) -> bool: ...
+    def get_top10(self, chat_id: int = None): ...
+    def get_user_rank(self, user_id: int, chat_id: int = None): ...
+    def get_rank_neighborhood(self, user_id: int, radius: int = 2, chat_id: int = None): ...
+    def get_top_range(self, start_day: str, end_day: str, limit: int = 10, chat_id: int = None): ...
+
+    # Configuración de chats
+    def chat_registry_ready(self) -> bool: ...
+    def set_chat_config(self, chat_id: int, chat_name: str, rankings_enabled: bool = True, challenges_enabled: bool = True): ...
+    def get_chat_config(self, chat_id: int): ...
+    def get_configured_chats(self): ...
+
+    # Estado de seguridad compartido (límites y blacklist)
+    def sync_security_state(self, consumed, blacklist, now: float): ...
+
+# PUNTUM_STORAGE=memory arranca sin base de datos (benchmarks, pruebas)
+DEFAULT_BACKEND = os.environ.get("PUNTUM_STORAGE", "sqlite")
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def create_backend(name: str) -> StorageBackend:
+    """Build a backend by name ("sqlite" or "memory")"""
+    if name == "sqlite":
+        from storage.sqlite import SqliteBackend
+        return SqliteBackend()
+    if name == "memory":
+        from storage.memory import MemoryBackend
+        return MemoryBackend()
+    raise ValueError(f"Backend de almacenamiento desconocido: {name}")
+
+def get_backend() -> StorageBackend:
+    """Get the active backend (the default one is created on first use)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(DEFAULT_BACKEND)
+    return _backend
+
+def set_backend(backend: StorageBackend) -> StorageBackend:
+    """Replace the active backend; returns the previous one (not closed)"""
+    global _backend
+    with _backend_lock:
+        previous, _backend = _backend, backend
+    return previous
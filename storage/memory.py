@@ -0,0 +1,274 @@
+# storage/memory.py - Backend en memoria: misma semántica que SQLite, sin I/O
+import threading
+from datetime import datetime
+
+import db
+from leaderboard import Leaderboard
+
+def _now() -> str:
+    # Mismo formato que CURRENT_TIMESTAMP de SQLite (UTC)
+    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+def _week_of(timestamp: str) -> str:
+    # Igual que strftime('%W', ...) en query_user_stats
+    return datetime.strptime(timestamp[:10], "%Y-%m-%d").strftime("%W")
+
+class _UserRecord:
+    """Agregados de un usuario equivalentes a lo que db.query_user_stats lee del ledger"""
+
+    __slots__ = (
+        "username",
+        "points",
+        "count",
+        "member_since",
+        "hashtag_counts",
+        "active_days",
+        "daily_by_week",
+        "weekly_weeks",
+        "recent",
+        "achievements",
+    )
+
+    def __init__(self):
+        self.username = None
+        self.points = 0
+        self.count = 0
+        self.member_since = None
+        self.hashtag_counts = {}
+        self.active_days = set()
+        self.daily_by_week = {}   # semana -> retos diarios
+        self.weekly_weeks = set()  # semanas con reto semanal
+        self.recent = []           # [(hashtag, puntos, timestamp)] más recientes primero
+        self.achievements = {}     # achievement_id -> None (orden de desbloqueo)
+
+class MemoryBackend:
+    """Almacenamiento en memoria del proceso.
+
+    Aplica las mismas reglas que el backend SQLite (premios idempotentes por
+    mensaje, niveles, rankings global/por chat y por rango de días, commit
+    listeners) para que handlers y benchmarks corran sin base de datos.
+    """
+
+    name = "memory"
+    blocking = False
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users = {}
+        self._message_keys = set()
+        self._scored_messages = set()  # (chat_id, message_id) con premios
+        self._daily = {}       # día -> {user_id: puntos}
+        self._chat_daily = {}  # chat_id -> {día -> {user_id: puntos}}
+        self._leaderboard = Leaderboard()
+        self._chat_leaderboards = {}
+        self._chats = {}
+        self._rate_state = {}  # (user_id, action) -> tat
+        self._blacklist = {}   # user_id -> (reason, until)
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    # Premios y logros
+
+    def add_points_batch(self, awards) -> dict:
+        with self._lock:
+            written = [self._write_award(award) for award in awards]
+            new_awards = [award for award, ok in zip(awards, written) if ok]
+            unlocked = db.notify_commit(self, new_awards) if new_awards else {}
+        return {"written": written, "unlocked": unlocked}
+
+    def _write_award(self, award: dict) -> bool:
+        # Misma clave que el índice único idx_points_message_award
+        if award["message_id"] is not None and award["chat_id"] is not None:
+            key = (award["chat_id"], award["message_id"], award["is_challenge_bonus"], award["hashtag"] or "")
+            if key in self._message_keys:
+                return False
+            self._message_keys.add(key)
+            self._scored_messages.add((award["chat_id"], award["message_id"]))
+
+        user_id = award["user_id"]
+        points = award["points"]
+        timestamp = award["timestamp"] or _now()
+        day = timestamp[:10]
+
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = _UserRecord()
+        if award["username"]:
+            user.username = award["username"]
+        user.points += points
+        user.count += 1
+        if user.member_since is None or timestamp < user.member_since:
+            user.member_since = timestamp
+        user.hashtag_counts[award["hashtag"]] = user.hashtag_counts.get(award["hashtag"], 0) + 1
+        user.active_days.add(day)
+        if award["is_challenge_bonus"]:
+            if award["hashtag"] == "(reto_diario)":
+                week = _week_of(timestamp)
+                user.daily_by_week[week] = user.daily_by_week.get(week, 0) + 1
+            elif (award["hashtag"] or "").startswith("#"):
+                user.weekly_weeks.add(_week_of(timestamp))
+        user.recent.append((award["hashtag"], points, timestamp))
+        user.recent = sorted(user.recent, key=lambda row: row[2], reverse=True)[:5]
+
+        daily = self._daily.setdefault(day, {})
+        daily[user_id] = daily.get(user_id, 0) + points
+        self._leaderboard.add(user_id, award["username"], points)
+        if award["chat_id"] is not None:
+            chat_daily = self._chat_daily.setdefault(award["chat_id"], {}).setdefault(day, {})
+            chat_daily[user_id] = chat_daily.get(user_id, 0) + points
+            board = self._chat_leaderboards.get(award["chat_id"])
+            if board is None:
+                board = self._chat_leaderboards[award["chat_id"]] = Leaderboard()
+            board.add(user_id, award["username"], points)
+        return True
+
+    def add_achievement(self, user_id: int, achievement_id: int):
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                user = self._users[user_id] = _UserRecord()
+            user.achievements[achievement_id] = None
+
+    # Vista de transacción para los commit listeners de db
+
+    @property
+    def scope(self):
+        return self
+
+    def user_stats(self, user_id: int):
+        return self.get_user_stats(user_id)
+
+    # Estadísticas
+
+    def message_scored(self, chat_id: int, message_id: int) -> bool:
+        with self._lock:
+            return (chat_id, message_id) in self._scored_messages
+
+    def get_user_total_points(self, user_id: int) -> int:
+        user = self._users.get(user_id)
+        return user.points if user else 0
+
+    def get_user_stats(self, user_id: int):
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None or user.points == 0:
+                return None
+
+            level = db.calculate_level(user.points)
+            level_info = db.get_level_info(level)
+            points_to_next = 0
+            if level_info["next_points"]:
+                points_to_next = level_info["next_points"] - user.points
+            week = datetime.utcnow().strftime("%W")
+
+            return db.UserStats(
+                username=user.username,
+                points=user.points,
+                count=user.count,
+                level=level,
+                level_name=level_info["name"],
+                points_to_next=max(0, points_to_next),
+                recent_contributions=list(user.recent),
+                member_since=user.member_since,
+                hashtag_counts=dict(sorted(user.hashtag_counts.items(), key=lambda item: item[1], reverse=True)),
+                active_days=set(user.active_days),
+                daily_challenges_week=user.daily_by_week.get(week, 0),
+                weekly_challenge_done=week in user.weekly_weeks,
+                achievements=list(user.achievements)
+            )
+
+    def get_cached_user_stats(self, user_id: int):
+        return self.get_user_stats(user_id)
+
+    # Rankings
+
+    def leaderboard_ready(self) -> bool:
+        return True
+
+    def _board(self, chat_id: int = None) -> Leaderboard:
+        if chat_id is None:
+            return self._leaderboard
+        return self._chat_leaderboards.get(chat_id) or Leaderboard()
+
+    def get_top10(self, chat_id: int = None):
+        return [
+            (username, total_points, db.calculate_level(total_points))
+            for user_id, username, total_points in self._board(chat_id).top(10)
+        ]
+
+    def get_user_rank(self, user_id: int, chat_id: int = None):
+        board = self._board(chat_id)
+        rank = board.rank(user_id)
+        if rank is None:
+            return None
+        return {"rank": rank, "points": board.score(user_id), "total_users": len(board)}
+
+    def get_rank_neighborhood(self, user_id: int, radius: int = 2, chat_id: int = None):
+        return [
+            (rank, username, points)
+            for rank, _, username, points in self._board(chat_id).around(user_id, radius)
+        ]
+
+    def get_top_range(self, start_day: str, end_day: str, limit: int = 10, chat_id: int = None):
+        with self._lock:
+            buckets = self._daily if chat_id is None else self._chat_daily.get(chat_id, {})
+            totals = {}
+            for day, users in buckets.items():
+                if start_day <= day <= end_day:
+                    for user_id, points in users.items():
+                        totals[user_id] = totals.get(user_id, 0) + points
+            ranked = sorted(
+                ((total, user_id) for user_id, total in totals.items() if total > 0),
+                key=lambda item: (-item[0], item[1])
+            )[:limit]
+            return [
+                (self._users[user_id].username, total, db.calculate_level(self._users[user_id].points))
+                for total, user_id in ranked
+            ]
+
+    # Configuración de chats
+
+    def chat_registry_ready(self) -> bool:
+        return True
+
+    def set_chat_config(self, chat_id: int, chat_name: str, rankings_enabled: bool = True, challenges_enabled: bool = True):
+        with self._lock:
+            self._chats[chat_id] = {
+                "chat_name": chat_name,
+                "rankings_enabled": bool(rankings_enabled),
+                "challenges_enabled": bool(challenges_enabled)
+            }
+
+    def get_chat_config(self, chat_id: int):
+        config = self._chats.get(chat_id)
+        return dict(config) if config else None
+
+    def get_configured_chats(self):
+        with self._lock:
+            items = list(self._chats.items())
+        return [
+            {"chat_id": chat_id, **config}
+            for chat_id, config in items
+            if config["rankings_enabled"] or config["challenges_enabled"]
+        ]
+
+    # Estado de seguridad (un solo proceso, pero con la misma fusión que SQLite)
+
+    def sync_security_state(self, consumed, blacklist, now: float):
+        with self._lock:
+            for user_id, action, start, cost in consumed:
+                key = (user_id, action)
+                self._rate_state[key] = max(self._rate_state.get(key, start), start) + cost
+            for user_id, reason, until in blacklist:
+                current = self._blacklist.get(user_id)
+                if current is None or until > current[1]:
+                    self._blacklist[user_id] = (reason, until)
+            self._rate_state = {key: tat for key, tat in self._rate_state.items() if tat > now}
+            self._blacklist = {user_id: entry for user_id, entry in self._blacklist.items() if entry[1] > now}
+            tats = [(user_id, action, tat) for (user_id, action), tat in self._rate_state.items()]
+            active = [(user_id, reason, until) for user_id, (reason, until) in self._blacklist.items()]
+        return tats, active
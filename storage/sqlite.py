@@ -0,0 +1,63 @@
+# storage/sqlite.py - Backend SQLite: delega en las funciones de db.py
+import db
+
+class SqliteBackend:
+    """Almacenamiento en puntum.db con el pool, los agregados y los rankings de db.py"""
+
+    name = "sqlite"
+    blocking = True
+
+    def open(self):
+        db.create_tables()
+        db.warm_leaderboard()
+
+    def close(self):
+        db.close_pool()
+
+    def add_points_batch(self, awards) -> dict:
+        return db.add_points_batch(awards)
+
+    def add_achievement(self, user_id: int, achievement_id: int):
+        return db.add_achievement(user_id, achievement_id)
+
+    def message_scored(self, chat_id: int, message_id: int) -> bool:
+        return db.message_scored(chat_id, message_id)
+
+    def get_user_total_points(self, user_id: int) -> int:
+        return db.get_user_total_points(user_id)
+
+    def get_user_stats(self, user_id: int):
+        return db.get_user_stats(user_id)
+
+    def get_cached_user_stats(self, user_id: int):
+        return db.get_cached_user_stats(user_id)
+
+    def leaderboard_ready(self) -> bool:
+        return db.leaderboard_ready()
+
+    def get_top10(self, chat_id: int = None):
+        return db.get_top10(chat_id)
+
+    def get_user_rank(self, user_id: int, chat_id: int = None):
+        return db.get_user_rank(user_id, chat_id)
+
+    def get_rank_neighborhood(self, user_id: int, radius: int = 2, chat_id: int = None):
+        return db.get_rank_neighborhood(user_id, radius, chat_id)
+
+    def get_top_range(self, start_day: str, end_day: str, limit: int = 10, chat_id: int = None):
+        return db.get_top_range(start_day, end_day, limit, chat_id)
+
+    def chat_registry_ready(self) -> bool:
+        return db.chat_registry_ready()
+
+    def set_chat_config(self, chat_id: int, chat_name: str, rankings_enabled: bool = True, challenges_enabled: bool = True):
+        return db.set_chat_config(chat_id, chat_name, rankings_enabled, challenges_enabled)
+
+    def get_chat_config(self, chat_id: int):
+        return db.get_chat_config(chat_id)
+
+    def get_configured_chats(self):
+        return db.get_configured_chats()
+
+    def sync_security_state(self, consumed, blacklist, now: float):
+        return db.sync_security_state(consumed, blacklist, now)
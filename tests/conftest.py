@@ -0,0 +1,29 @@
+# tests/conftest.py - Fixtures comunes: base de datos temporal y backend activo
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+import storage
+from storage.sqlite import SqliteBackend
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Ruta de una puntum.db temporal (el pool se recrea al cambiar DB_PATH)"""
+    path = str(tmp_path / "puntum.db")
+    monkeypatch.setattr(db, "DB_PATH", path)
+    yield path
+    db.close_pool()
+
+@pytest.fixture
+def sqlite_backend(db_path):
+    """Backend SQLite abierto (migrado y con los rankings cargados) como backend activo"""
+    backend = SqliteBackend()
+    previous = storage.set_backend(backend)
+    backend.open()
+    yield backend
+    backend.close()
+    storage.set_backend(previous)
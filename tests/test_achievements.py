@@ -0,0 +1,33 @@
+import db
+from handlers.achievements import achievement_engine
+
+def _award(user_id, message_id, hashtag="#crítica"):
+    return db.make_award(user_id, f"u{user_id}", 3, hashtag, -100, message_id)
+
+def test_counters_are_bounded_and_rebuilt_after_eviction(sqlite_backend, monkeypatch):
+    monkeypatch.setattr(achievement_engine, "max_users", 2)
+    achievement_engine.reset()
+
+    unlocked = {}
+    message_id = 0
+    for round_ in range(3):
+        for user_id in range(1, 6):
+            message_id += 1
+            result = db.add_points_batch([_award(user_id, message_id)])
+            for uid, logros in result["unlocked"].items():
+                unlocked.setdefault(uid, []).extend(logro["id"] for logro in logros)
+            assert len(achievement_engine._users) <= 2
+
+    # Tres #crítica por usuario: el logro 2 se desbloquea una vez aunque sus
+    # contadores se hayan expulsado y reconstruido entre premios
+    assert unlocked == {user_id: [2] for user_id in range(1, 6)}
+    assert list(db.get_user_stats(3).achievements) == [2]
+
+def test_recently_used_counters_stay_cached(sqlite_backend, monkeypatch):
+    monkeypatch.setattr(achievement_engine, "max_users", 2)
+    achievement_engine.reset()
+    db.add_points_batch([_award(1, 1)])
+    db.add_points_batch([_award(2, 2)])
+    db.add_points_batch([_award(1, 3)])
+    db.add_points_batch([_award(3, 4)])
+    assert list(achievement_engine._users) == [1, 3]
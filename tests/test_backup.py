@@ -0,0 +1,25 @@
+import asyncio
+import itertools
+import os
+import sqlite3
+
+import db
+from handlers import backup
+
+def test_backup_job_writes_verified_snapshots_and_rotates(sqlite_backend, tmp_path, monkeypatch):
+    backup_dir = tmp_path / "backups"
+    counter = itertools.count()
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(backup_dir))
+    monkeypatch.setattr(backup, "BACKUP_KEEP", 2)
+    monkeypatch.setattr(backup, "snapshot_path", lambda: str(backup_dir / f"puntum-{next(counter):04d}.db"))
+    db.add_points_batch([db.make_award(1, "ana", 7, "#aporte", -100, 1)])
+
+    for _ in range(3):
+        asyncio.run(backup.backup_job(None))
+
+    assert sorted(os.listdir(backup_dir)) == ["puntum-0001.db", "puntum-0002.db"]
+    conn = sqlite3.connect(backup_dir / "puntum-0002.db")
+    try:
+        assert conn.execute("SELECT points FROM users WHERE id = 1").fetchone() == (7,)
+    finally:
+        conn.close()
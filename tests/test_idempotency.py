@@ -0,0 +1,64 @@
+import asyncio
+import sqlite3
+
+import db
+import db_async
+
+def _totals(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return (
+            conn.execute("SELECT COUNT(*), SUM(points) FROM points").fetchone(),
+            conn.execute("SELECT points, count FROM users WHERE id = 1").fetchone(),
+            conn.execute("SELECT points, awards FROM chat_user_totals WHERE chat_id = -100 AND user_id = 1").fetchone(),
+        )
+    finally:
+        conn.close()
+
+def test_redelivered_awards_are_written_once(sqlite_backend, db_path):
+    awards = [
+        db.make_award(1, "ana", 5, "#reseña", -100, 7),
+        db.make_award(1, "ana", 10, "#reto", -100, 7, is_challenge_bonus=True),
+    ]
+    first = db.add_points_batch(awards)
+    before = _totals(db_path)
+    second = db.add_points_batch(awards)
+
+    assert first["written"] == [True, True]
+    assert second["written"] == [False, False]
+    assert before == ((2, 15), (15, 2), (15, 2))
+    assert _totals(db_path) == before
+    assert db.get_user_total_points(1) == 15
+    assert db.get_user_rank(1)["points"] == 15
+
+def test_scoring_unit_flags_a_redelivered_message(sqlite_backend, db_path, monkeypatch):
+    monkeypatch.setattr(db_async, "write_buffer", db_async.PointsWriteBuffer())
+
+    async def score_twice():
+        units = []
+        for _ in range(2):
+            unit = db_async.ScoringUnit(1, "ana", chat_id=-100, message_id=7)
+            unit.add(5, hashtag="#reseña")
+            await unit.commit()
+            units.append(unit)
+        return units
+
+    first, second = asyncio.run(score_twice())
+    assert not first.duplicate
+    assert second.duplicate
+    assert _totals(db_path)[0] == (1, 5)
+
+def test_different_messages_are_not_duplicates(sqlite_backend, db_path):
+    result = db.add_points_batch([
+        db.make_award(1, "ana", 5, "#reseña", -100, 7),
+        db.make_award(1, "ana", 5, "#reseña", -100, 8),
+        db.make_award(1, "ana", 5, "#reseña", -200, 7),
+    ])
+    assert result["written"] == [True, True, True]
+    assert _totals(db_path)[0] == (3, 15)
+
+def test_message_scored(sqlite_backend):
+    assert not db.message_scored(-100, 7)
+    db.add_points_batch([db.make_award(1, "ana", 5, "#reseña", -100, 7)])
+    assert db.message_scored(-100, 7)
+    assert not db.message_scored(-200, 7)
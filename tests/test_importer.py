@@ -0,0 +1,50 @@
+import io
+import json
+import time
+from datetime import datetime
+
+import pytest
+
+import importer
+
+@pytest.fixture
+def madrid_tz(monkeypatch):
+    """Equipo con hora local distinta de UTC (y con cambio de horario)"""
+    monkeypatch.setenv("TZ", "Europe/Madrid")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+def test_message_time_is_utc_on_a_non_utc_host(madrid_tz):
+    # 2025-03-30 00:30 UTC, justo antes del cambio a horario de verano en Madrid
+    message = {"date": "2025-03-30T01:30:00", "date_unixtime": "1743294600"}
+    assert importer.message_timestamp(message) == 1743294600
+    assert importer.message_time(message) == datetime(2025, 3, 30, 0, 30)
+
+def test_local_date_fallback_is_converted_to_utc(madrid_tz):
+    assert importer.message_time({"date": "2025-01-15T13:00:00"}) == datetime(2025, 1, 15, 12, 0)
+
+def test_rate_limit_clock_uses_real_gaps_across_dst(madrid_tz):
+    # Seis hashtags de un usuario, 20 minutos entre cada uno, cruzando el cambio de hora:
+    # con el reloj real ninguno excede 5 por 5 minutos
+    start = 1743293400  # 2025-03-30 00:10 UTC
+    texts = [
+        "#aporte Bergman filmaba los rostros como paisajes",
+        "#aporte Tarkovski y el agua: una obsesión que recorre toda su obra",
+        "#aporte Varda inventó la nouvelle vague antes que nadie",
+        "#aporte El montaje de Eisenstein sigue siendo una lección",
+        "#aporte Kiarostami convierte un coche en un plató entero",
+        "#aporte Ozu coloca la cámara a la altura de un tatami",
+    ]
+    messages = [
+        {"id": i, "type": "message", "from": "ana", "from_id": "user1",
+         "date_unixtime": str(start + i * 1200), "text": text}
+        for i, text in enumerate(texts)
+    ]
+    data = json.dumps({"name": "Cine", "type": "private_supergroup", "id": 1, "messages": messages})
+    stats = {"messages": 0, "scored": 0, "rate_limited": 0, "spam": 0, "duplicates": 0}
+    awards = list(importer.iter_export_awards(importer.ChatExportReader(io.StringIO(data)), -1001, stats))
+    assert stats["rate_limited"] == 0
+    assert stats["scored"] == 6
+    assert sorted({award["timestamp"] for award in awards})[-1] == "2025-03-30 01:50:00"
@@ -0,0 +1,47 @@
+import random
+
+from leaderboard import Leaderboard
+
+def _brute(scores):
+    return sorted(((user_id, score) for user_id, score in scores.items()), key=lambda item: (-item[1], item[0]))
+
+def test_leaderboard_matches_brute_force():
+    rng = random.Random(7)
+    board = Leaderboard()
+    scores = {}
+    for step in range(3000):
+        user_id = rng.randrange(60)
+        op = rng.random()
+        if op < 0.6:
+            delta = rng.randrange(0, 8)
+            board.add(user_id, f"u{user_id}", delta)
+            scores[user_id] = scores.get(user_id, 0) + delta
+        elif op < 0.8:
+            # Puntuaciones grandes fuerzan a ampliar el árbol
+            score = rng.choice((0, 3, 5, rng.randrange(3000)))
+            board.set_score(user_id, f"u{user_id}", score)
+            scores[user_id] = score
+        else:
+            board.remove(user_id)
+            scores.pop(user_id, None)
+
+        if step % 25:
+            continue
+        expected = _brute(scores)
+        assert len(board) == len(expected)
+        assert [(user_id, score) for user_id, _, score in board.top(10)] == expected[:10]
+        for position, (user_id, score) in enumerate(expected, 1):
+            assert board.rank(user_id) == position
+        if expected:
+            user_id = rng.choice(expected)[0]
+            position = board.rank(user_id)
+            start = max(1, position - 2)
+            around = [(pos, uid, score) for pos, uid, _, score in board.around(user_id, 2)]
+            assert around == [(start + i, uid, score) for i, (uid, score) in enumerate(expected[start - 1:position + 2])]
+
+def test_rank_of_unknown_user_is_none():
+    board = Leaderboard()
+    board.load([(1, "ana", 5), (2, "luis", 5)])
+    assert board.rank(3) is None
+    assert board.around(3) == []
+    assert board.top() == [(1, "ana", 5), (2, "luis", 5)]
@@ -0,0 +1,36 @@
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta
+
+import db
+from handlers.maintenance import compaction_job
+
+def _ledger(path):
+    conn = sqlite3.connect(path)
+    try:
+        return (
+            conn.execute("SELECT COUNT(*), SUM(points), SUM(awards) FROM points").fetchone(),
+            conn.execute("SELECT id, points, count FROM users ORDER BY id").fetchall(),
+        )
+    finally:
+        conn.close()
+
+def test_compaction_job_folds_old_rows_and_keeps_totals(sqlite_backend, db_path):
+    old = (datetime.utcnow() - timedelta(days=200)).strftime("%Y-%m-%d 12:00:00")
+    awards = [db.make_award(1, "ana", 3, "#aporte", -100, message_id, timestamp=old) for message_id in range(10)]
+    awards.append(db.make_award(1, "ana", 5, "#reseña", -100, 99))  # reciente: no se toca
+    db.add_points_batch(awards)
+    (rows, points, count), users = _ledger(db_path)
+    assert (rows, points, count) == (11, 35, 11)
+
+    asyncio.run(compaction_job(None))
+
+    assert _ledger(db_path) == ((2, 35, 11), users)
+
+def test_migrations_do_not_vacuum_and_the_admin_step_does(db_path):
+    db.create_tables()
+    assert db.auto_vacuum_mode() != db.AUTO_VACUUM_INCREMENTAL
+    assert db.enable_incremental_vacuum() == db.AUTO_VACUUM_INCREMENTAL
+    assert db.auto_vacuum_mode() == db.AUTO_VACUUM_INCREMENTAL
+    db.add_points_batch([db.make_award(1, "ana", 3, "#aporte", -100, 1)])
+    assert db.incremental_vacuum() == 0
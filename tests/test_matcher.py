@@ -0,0 +1,41 @@
+import random
+import re
+
+import matcher
+from analysis import MessageAnalysis
+from matcher import AhoCorasick
+
+TERMS = ["#crítica", "#reseña", "#reseñas", "cine", "spam!", "gratis", "#a", "a_b"]
+ALPHABET = ["#", "x", "a", "_", "b", " ", "!", "é", "cine", "#crítica", "#reseña", "s", "gratis", "spam", "\n", "."]
+
+def _regex_words(text, terms):
+    text = text.lower()
+    return {term for term in terms if re.search(rf"(?<!\w){re.escape(term)}(?!\w)", text)}
+
+def test_scan_agrees_with_regex_fallback():
+    automaton = AhoCorasick(TERMS)
+    rng = random.Random(17)
+    for _ in range(3000):
+        text = "".join(rng.choice(ALPHABET) for _ in range(rng.randrange(1, 12)))
+        assert automaton.scan(text).words == _regex_words(text, TERMS), text
+
+def test_hashtag_needs_a_left_boundary():
+    automaton = AhoCorasick(TERMS)
+    assert "#crítica" not in automaton.scan("x#crítica")
+    assert "#crítica" not in automaton.scan("_#crítica")
+    assert "#crítica" in automaton.scan("ver #crítica.")
+    assert "#reseña" not in automaton.scan("#reseñas")
+    assert "#crítica" in automaton.scan("#Crítica")
+
+def test_analysis_rescans_after_new_terms():
+    analysis = MessageAnalysis("Mi #estreno de hoy")
+    try:
+        matcher.register_terms("test", [])
+        assert "#estreno" not in analysis.matches
+        matcher.register_terms("test", ["#estreno"])
+        # El resultado anterior es de otro autómata: se vuelve a escanear
+        assert "#estreno" in analysis.matches
+        assert analysis.contains("#estreno")
+        assert not MessageAnalysis("x#estreno").contains("#estreno")
+    finally:
+        matcher.register_terms("test", [])
@@ -0,0 +1,129 @@
+import sqlite3
+
+import pytest
+
+import db
+
+# Esquema que creaba create_tables() antes de las migraciones
+BASELINE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS points (
+    user_id INTEGER,
+    username TEXT,
+    points INTEGER,
+    hashtag TEXT,
+    timestamp TEXT DEFAULT CURRENT_TIMESTAMP,
+    chat_id INTEGER,
+    message_id INTEGER,
+    is_challenge_bonus INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS user_achievements (
+    user_id INTEGER,
+    achievement_id INTEGER,
+    date TEXT DEFAULT CURRENT_DATE,
+    PRIMARY KEY (user_id, achievement_id)
+);
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    username TEXT,
+    points INTEGER DEFAULT 0,
+    count INTEGER DEFAULT 0,
+    level INTEGER DEFAULT 1,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS chat_config (
+    chat_id INTEGER PRIMARY KEY,
+    chat_name TEXT,
+    rankings_enabled BOOLEAN DEFAULT 1,
+    challenges_enabled BOOLEAN DEFAULT 1,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+BASELINE_POINTS = [
+    # user_id, username, points, hashtag, timestamp, chat_id, message_id
+    (1, "ana", 3, "#aporte", "2025-01-01 10:00:00", -100, 1),
+    (1, "ana", 3, "#aporte", "2025-01-01 10:00:05", -100, 1),   # reentrega duplicada
+    (1, "ana", 5, "#reseña", "2025-01-02 10:00:00", -100, 2),
+    (2, "luis", 4, "#debate", "2025-01-02 11:00:00", -200, 3),
+]
+
+def _baseline_db(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany(
+        "INSERT INTO points (user_id, username, points, hashtag, timestamp, chat_id, message_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        BASELINE_POINTS,
+    )
+    # El agregado antiguo podía estar desfasado respecto al ledger
+    conn.execute("INSERT INTO users (id, username, points, count, level) VALUES (1, 'ana', 999, 1, 1)")
+    conn.execute("INSERT INTO chat_config (chat_id, chat_name) VALUES (-100, 'Cine')")
+    conn.commit()
+    conn.close()
+
+def test_migrations_upgrade_a_baseline_database(db_path):
+    _baseline_db(db_path)
+
+    assert db.create_tables() == db.MIGRATIONS[-1][0]
+
+    conn = sqlite3.connect(db_path)
+    try:
+        versions = [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+        assert versions == [version for version, _, _ in db.MIGRATIONS]
+        # La reentrega duplicada se elimina y los agregados salen del ledger
+        assert conn.execute("SELECT COUNT(*), SUM(points) FROM points").fetchone() == (3, 12)
+        assert conn.execute("SELECT id, points, count FROM users ORDER BY id").fetchall() == [(1, 8, 2), (2, 4, 1)]
+        assert conn.execute("SELECT chat_id, user_id, points, awards FROM chat_user_totals ORDER BY chat_id").fetchall() == [
+            (-200, 2, 4, 1), (-100, 1, 8, 2),
+        ]
+        assert conn.execute("SELECT day, user_id, points FROM user_daily_points ORDER BY day, user_id").fetchall() == [
+            ("2025-01-01", 1, 3), ("2025-01-02", 1, 5), ("2025-01-02", 2, 4),
+        ]
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {"idx_points_user_time", "idx_points_message_award", "idx_points_uncompacted"} <= indexes
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("SELECT chat_name FROM chat_config").fetchall() == [("Cine",)]
+    finally:
+        conn.close()
+
+def test_migrations_are_idempotent(db_path):
+    _baseline_db(db_path)
+    version = db.create_tables()
+    db.close_pool()
+
+    assert db.create_tables() == version
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == len(db.MIGRATIONS)
+        assert conn.execute("SELECT SUM(points) FROM users").fetchone()[0] == 12
+    finally:
+        conn.close()
+
+def test_fresh_database_accepts_awards(db_path):
+    db.create_tables()
+    result = db.add_points_batch([db.make_award(1, "ana", 3, "#aporte", -100, 1)])
+    assert result["written"] == [True]
+    assert db.get_user_total_points(1) == 3
+
+def test_failed_migration_leaves_nothing_behind(db_path, monkeypatch):
+    db.create_tables()
+    version = db.MIGRATIONS[-1][0]
+
+    def half_done(conn):
+        conn.execute("CREATE TABLE half_done (id INTEGER)")
+        conn.execute("ALTER TABLE users ADD COLUMN half_done INTEGER")
+        conn.execute("INSERT INTO half_done VALUES (1)")
+        raise RuntimeError("falla a mitad")
+
+    monkeypatch.setattr(db, "MIGRATIONS", db.MIGRATIONS + [(version + 1, "half done", half_done)])
+    with pytest.raises(RuntimeError):
+        db.create_tables()
+
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] == version
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchall() == []
+        assert "half_done" not in [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+    finally:
+        conn.close()
+    # El pool sigue usable con transacciones implícitas
+    assert db.add_points_batch([db.make_award(1, "ana", 3, "#aporte", -100, 1)])["written"] == [True]
@@ -0,0 +1,55 @@
+from collections import deque
+
+from outbox import PRIORITY_REPLY, OutgoingMessage, Outbox
+
+BOT = object()
+
+def _reply(seq, text, parse_mode, first_name):
+    return OutgoingMessage(BOT, -100, text, parse_mode, 100 + seq, first_name, PRIORITY_REPLY, seq, None)
+
+def _take_all(outbox, *items):
+    outbox._queues[-100] = (deque(items), deque())
+    taken = []
+    while -100 in outbox._queues:
+        taken.append(outbox._take(-100))
+    return taken
+
+def test_merge_escapes_labels_for_markdown_v2():
+    outbox = Outbox()
+    [merged] = _take_all(
+        outbox,
+        _reply(1, "*Hola*", "MarkdownV2", "ana_b."),
+        _reply(2, "*Ayuda*", "MarkdownV2", "jo-se (2)"),
+    )
+    assert merged.parse_mode == "MarkdownV2"
+    assert merged.text == "👤 ana\\_b\\.\n*Hola*\n\n👤 jo\\-se \\(2\\)\n*Ayuda*"
+    assert merged.reply_to is None
+    assert outbox.stats["coalesced"] == 1
+
+def test_merge_escapes_labels_for_markdown():
+    outbox = Outbox()
+    [merged] = _take_all(outbox, _reply(1, "uno", "Markdown", "ana_b"), _reply(2, "dos", "Markdown", "luis*"))
+    assert merged.text == "👤 ana\\_b\nuno\n\n👤 luis\\*\ndos"
+
+def test_merge_leaves_plain_labels_untouched():
+    outbox = Outbox()
+    [merged] = _take_all(outbox, _reply(1, "uno", None, "ana_b."), _reply(2, "dos", None, "luis"))
+    assert merged.text == "👤 ana_b.\nuno\n\n👤 luis\ndos"
+
+def test_same_sender_is_not_labelled():
+    outbox = Outbox()
+    [merged] = _take_all(outbox, _reply(1, "uno", None, "ana"), _reply(2, "dos", None, "ana"))
+    assert merged.text == "uno\n\ndos"
+
+def test_different_parse_modes_are_not_merged():
+    outbox = Outbox()
+    taken = _take_all(
+        outbox,
+        _reply(1, "uno", "MarkdownV2", "ana"),
+        _reply(2, "dos", "Markdown", "luis"),
+        _reply(3, "tres", None, "eva"),
+    )
+    assert [(item.text, item.parse_mode) for item in taken] == [
+        ("uno", "MarkdownV2"), ("dos", "Markdown"), ("tres", None),
+    ]
+    assert outbox.stats["coalesced"] == 0
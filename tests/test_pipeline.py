@@ -0,0 +1,82 @@
+import asyncio
+from types import SimpleNamespace
+
+from handlers.phrases import phrase_stage
+from handlers.pipeline import PipelineContext
+
+def _ctx(text):
+    update = SimpleNamespace(
+        update_id=None,
+        message=SimpleNamespace(text=text, message_id=1),
+        effective_user=SimpleNamespace(id=1, username="ana"),
+        effective_chat=SimpleNamespace(id=-100),
+    )
+    return PipelineContext(update, None)
+
+def test_phrase_stage_reacts_to_unscored_hashtag():
+    ctx = _ctx("Una #pregunta sobre Tarkovski")
+    asyncio.run(phrase_stage(ctx))
+    assert ctx.reacted
+    assert len(ctx.parts) == 1
+
+def test_phrase_stage_skips_messages_scored_with_zero_points():
+    ctx = _ctx("Una #pregunta sobre Tarkovski")
+    ctx.points = 0
+    ctx.say("⚠️ Mensaje demasiado corto")
+    asyncio.run(phrase_stage(ctx))
+    assert not ctx.reacted
+    assert ctx.parts == [("⚠️ Mensaje demasiado corto", False)]
+
+def test_redelivered_message_does_not_charge_the_limiter(monkeypatch):
+    import db
+    import db_async
+    import storage
+    from handlers.security import hashtag_stage, security_manager
+    from storage.memory import MemoryBackend
+
+    backend = MemoryBackend()
+    previous = storage.set_backend(backend)
+    monkeypatch.setattr(db_async, "write_buffer", db_async.PointsWriteBuffer())
+    try:
+        backend.add_points_batch([db.make_award(1, "ana", 5, "#pregunta", -100, 1)])
+        ctx = _ctx("Una #pregunta sobre el montaje soviético y Eisenstein")
+        checks = security_manager.limiter.checks["hashtag_usage"]
+        asyncio.run(hashtag_stage(ctx))
+        assert ctx.stopped and not ctx.parts
+        assert security_manager.limiter.checks["hashtag_usage"] == checks
+    finally:
+        storage.set_backend(previous)
+
+def test_render_cuts_long_replies_at_part_boundaries():
+    from handlers.pipeline import MAX_REPLY_LENGTH
+
+    ctx = _ctx("#aporte")
+    ctx.say("✅ +5 puntos por: #aporte")
+    ctx.say("*Logro desbloqueado*: _Cinéfilo_", markdown=True)
+    ctx.say("a_b*c " * 2000)
+    text, parse_mode = ctx.render()
+    assert parse_mode == "Markdown"
+    assert len(text) <= MAX_REPLY_LENGTH
+    assert text.startswith("✅ +5 puntos por: #aporte\n\n*Logro desbloqueado*: _Cinéfilo_\n\n")
+    # El recorte no deja entidades ni escapes a medias
+    body = text.rsplit("\n\n", 1)[1]
+    assert body.endswith("...")
+    assert body[:-3].replace("\\_", "").replace("\\*", "").count("_") == 0
+    assert body[:-3].replace("\\_", "").replace("\\*", "").count("*") == 0
+    assert not body[:-3].endswith("\\")
+
+def test_render_drops_markdown_parts_that_do_not_fit():
+    ctx = _ctx("#aporte")
+    ctx.say("x" * 3990)
+    ctx.say("*Logro desbloqueado*", markdown=True)
+    text, parse_mode = ctx.render()
+    assert text == "x" * 3990
+    assert parse_mode == "Markdown"
+
+def test_render_plain_text():
+    ctx = _ctx("#aporte")
+    ctx.say("uno")
+    ctx.say("y" * 5000)
+    text, parse_mode = ctx.render()
+    assert parse_mode is None
+    assert text == "uno\n" + "y" * 3993 + "..."
@@ -0,0 +1,48 @@
+import random
+
+import pytest
+
+from ratelimit import RateLimiter
+from handlers.security import SecurityManager
+
+def _accepted(limiter, times, user_id=1, action="a"):
+    return [t for t in times if not limiter.hit(user_id, action, t)]
+
+@pytest.mark.parametrize("limit", [(5, 300), (10, 60), (3, 30), (5, 300, 3)])
+def test_sustained_rate_is_max_count_per_window(limit):
+    max_count, window = limit[:2]
+    rng = random.Random(7)
+    times = sorted(rng.uniform(0, window * 6) for _ in range(600))
+    accepted = _accepted(RateLimiter({"a": limit}), times)
+    # Una ráfaga completa más lo que se recupera en la ventana
+    for i, t in enumerate(accepted):
+        assert sum(1 for s in accepted[:i + 1] if s > t - window) <= 2 * max_count - 1
+    assert len(accepted) <= max_count * 7
+
+def test_full_burst_is_accepted_like_the_timestamp_log():
+    limiter = RateLimiter(SecurityManager().action_limits)
+    assert [limiter.hit(1, "hashtag_usage", t) for t in (0, 1, 2, 3, 4)] == [False] * 5
+    assert limiter.hit(1, "hashtag_usage", 5)
+    # Cada hashtag se recupera a los 300 / 5 segundos
+    assert not limiter.hit(1, "hashtag_usage", 60)
+    assert limiter.hit(1, "hashtag_usage", 61)
+
+def test_smaller_burst_spaces_the_rest():
+    limiter = RateLimiter({"a": (5, 300, 3)})
+    assert _accepted(limiter, [0, 0, 0, 0, 50, 60, 100, 120]) == [0, 0, 0, 60, 120]
+
+def test_sweep_frees_idle_users():
+    limiter = RateLimiter({"a": (2, 10)})
+    for user_id in range(100):
+        limiter.hit(user_id, "a", 0)
+    assert limiter.sweep(1) == 0
+    assert limiter.sweep(100) == 100
+    assert len(limiter) == 0
+    # Los slots libres se reutilizan
+    limiter.hit(7, "a", 100)
+    assert limiter.stats()["slots"] == 100
+
+def test_five_quick_hashtag_posts_are_accepted():
+    manager = SecurityManager()
+    assert [manager.is_rate_limited(1, "hashtag_usage") for _ in range(5)] == [False] * 5
+    assert manager.is_rate_limited(1, "hashtag_usage")
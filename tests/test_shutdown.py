@@ -0,0 +1,45 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import db_async
+
+class _RecordingOutbox:
+    def __init__(self):
+        self.events = []
+
+    async def announce(self, text):
+        self.events.append(("announce", text))
+
+    async def stop(self):
+        self.events.append(("stop", None))
+
+def test_shutdown_flushes_awards_before_stopping_the_outbox(sqlite_backend, monkeypatch):
+    # bot abre el almacenamiento al importarse: aquí ya es la base temporal
+    import bot
+
+    # aclose() cierra el executor: se usa uno propio para no afectar a otros tests
+    monkeypatch.setattr(db_async, "_executor", ThreadPoolExecutor(max_workers=2))
+    monkeypatch.setattr(db_async, "write_buffer", db_async.PointsWriteBuffer(flush_interval=60))
+    fake_outbox = _RecordingOutbox()
+    monkeypatch.setattr(bot, "outbox", fake_outbox)
+    monkeypatch.setattr(bot, "bot_app", None)
+
+    async def handler():
+        # Como hashtag_stage: espera al commit y anuncia los logros desbloqueados
+        unit = db_async.ScoringUnit(1, "ana", chat_id=-100, message_id=7)
+        unit.add(3, hashtag="#aporte")
+        logros = await unit.commit()
+        for logro in logros:
+            await fake_outbox.announce(logro["name"])
+
+    async def scenario():
+        task = asyncio.ensure_future(handler())
+        await asyncio.sleep(0)
+        assert db_async.write_buffer.has_pending(1)
+        await bot.shutdown_bot()
+        await task
+
+    asyncio.run(scenario())
+    kinds = [kind for kind, _ in fake_outbox.events]
+    assert kinds[-1] == "stop"
+    assert "announce" in kinds
@@ -0,0 +1,44 @@
+from simhash import NearDuplicateIndex, fingerprint
+
+REVIEW = "La fotografía de Stalker convierte la zona en un personaje más, con planos largos y agua por todas partes"
+EDITED = "La fotografía de Stalker convierte la zona en un personaje más, con planos largos y agua en todas partes"
+OTHER = "Hoy vi Cinema Paradiso por primera vez y el final con los besos censurados me dejó llorando un buen rato"
+
+def test_near_copies_are_detected():
+    index = NearDuplicateIndex(window_seconds=3600)
+    assert index.check_and_add(-100, 1, fingerprint(REVIEW), message_id=1, now=0) is None
+    match = index.check(-100, 1, fingerprint(EDITED), message_id=2, now=10)
+    assert match is not None
+    assert (match.user_id, match.message_id) == (1, 1)
+    # Otro chat: la copia se encuentra por la ventana del usuario
+    assert index.check(-200, 1, fingerprint(EDITED), message_id=3, now=10) is not None
+
+def test_unrelated_texts_are_not_duplicates():
+    index = NearDuplicateIndex(window_seconds=3600)
+    index.add(-100, 1, fingerprint(REVIEW), message_id=1, now=0)
+    assert index.check(-100, 2, fingerprint(OTHER), message_id=2, now=10) is None
+    assert index.check(-100, 2, fingerprint("muy corto"), message_id=3, now=10) is None
+
+def test_same_message_redelivered_is_not_a_copy():
+    index = NearDuplicateIndex(window_seconds=3600)
+    index.add(-100, 1, fingerprint(REVIEW), message_id=1, now=0)
+    assert index.check(-100, 1, fingerprint(REVIEW), message_id=1, now=10) is None
+
+def test_idle_windows_are_dropped_without_sweep():
+    index = NearDuplicateIndex(window_seconds=100)
+    for user_id in range(50):
+        index.add(-user_id, user_id, fingerprint(REVIEW), message_id=1, now=0)
+    assert len(index._users) == 50
+    index.add(-1000, 1000, fingerprint(OTHER), message_id=1, now=200)
+    # Ni los chats ni los usuarios abandonados siguen en memoria
+    assert list(index._users) == [1000]
+    assert list(index._chats) == [-1000]
+
+def test_active_windows_survive():
+    index = NearDuplicateIndex(window_seconds=100)
+    index.add(-100, 1, fingerprint(REVIEW), message_id=1, now=0)
+    index.add(-100, 2, fingerprint(OTHER), message_id=2, now=90)
+    index.add(-200, 3, fingerprint(OTHER), message_id=1, now=150)
+    assert list(index._users) == [2, 3]
+    assert list(index._chats) == [-100, -200]
+    assert index.check(-300, 2, fingerprint(OTHER), message_id=5, now=160) is not None
@@ -0,0 +1,73 @@
+import random
+import struct
+from array import array
+
+import pytest
+
+import spamclf
+from spamclf import SpamClassifier
+
+TEXTS = [
+    "Descarga gratis el pack completo en mi canal",
+    "Gana dinero desde casa con esta oferta 50% ya",
+    "La fotografía de Stalker es hipnótica",
+    "¿Alguien vio la nueva de Kaurismäki?",
+    "",
+    "#reseña Paris, Texas: Wenders en estado de gracia",
+]
+
+def _model(bits=10, seed=3):
+    rng = random.Random(seed)
+    weights = array('f', (rng.uniform(-2, 2) for _ in range(1 << bits)))
+    return SpamClassifier(weights, bias=-0.25, hash_bits=bits)
+
+def test_round_trip(tmp_path):
+    model = _model()
+    loaded = SpamClassifier.from_bytes(model.to_bytes())
+    assert loaded.weights == model.weights
+    assert loaded.bias == pytest.approx(model.bias)
+    assert (loaded.hash_bits, loaded.char_ngrams, loaded.word_ngrams) == (10, model.char_ngrams, model.word_ngrams)
+
+    path = str(tmp_path / "spam_model.bin")
+    model.save(path)
+    assert [spamclf.load_model(path).score(text) for text in TEXTS] == pytest.approx([model.score(text) for text in TEXTS])
+
+@pytest.mark.parametrize("corrupt", [
+    lambda data: data[:5],                       # cabecera truncada
+    lambda data: data[:-4],                      # faltan pesos
+    lambda data: data[:-2],                      # no es múltiplo de 4
+    lambda data: data + b"\0\0\0\0",             # pesos de más
+    lambda data: b"XXXX" + data[4:],             # otro formato
+    lambda data: data[:5] + bytes([40]) + data[6:],  # bits fuera de rango
+    lambda data: b"",
+])
+def test_corrupt_model_raises_value_error(corrupt):
+    with pytest.raises(ValueError):
+        SpamClassifier.from_bytes(corrupt(_model().to_bytes()))
+
+def test_corrupt_file_falls_back_to_patterns(tmp_path, monkeypatch):
+    from handlers.security import SecurityManager
+
+    path = tmp_path / "spam_model.bin"
+    path.write_bytes(_model().to_bytes()[:100])
+    monkeypatch.setattr(spamclf, "SPAM_MODEL_PATH", str(path))
+    assert SecurityManager().classifier is None
+
+def test_score_batch_matches_score():
+    model = _model()
+    expected = [model.score(text) for text in TEXTS]
+    assert model.score_batch(TEXTS) == pytest.approx(expected, abs=1e-6)
+
+def test_score_batch_without_numpy(monkeypatch):
+    import builtins
+
+    real_import = builtins.__import__
+
+    def no_numpy(name, *args, **kwargs):
+        if name == "numpy":
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    model = _model()
+    monkeypatch.setattr(builtins, "__import__", no_numpy)
+    assert model.score_batch(TEXTS) == [model.score(text) for text in TEXTS]
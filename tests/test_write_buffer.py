@@ -0,0 +1,33 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import db_async
+
+def test_aclose_writes_buffered_awards(sqlite_backend, db_path, monkeypatch):
+    # aclose() cierra el executor: se usa uno propio para no afectar a otros tests
+    monkeypatch.setattr(db_async, "_executor", ThreadPoolExecutor(max_workers=2))
+    buffer = db_async.PointsWriteBuffer(flush_interval=60)
+    monkeypatch.setattr(db_async, "write_buffer", buffer)
+
+    async def scenario():
+        unit = db_async.ScoringUnit(1, "ana", chat_id=-100, message_id=7)
+        unit.add(5, hashtag="#reseña")
+        unit.add(10, hashtag="#reto", is_challenge_bonus=True)
+        commit = asyncio.ensure_future(unit.commit())
+        await asyncio.sleep(0)
+        # Todavía en el buffer: el lote sólo saldría tras flush_interval
+        assert buffer.has_pending(1)
+        await db_async.aclose()
+        await commit
+        return unit
+
+    unit = asyncio.run(scenario())
+    assert not unit.duplicate
+
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*), SUM(points) FROM points").fetchone() == (2, 15)
+        assert conn.execute("SELECT points, count FROM users WHERE id = 1").fetchone() == (15, 2)
+    finally:
+        conn.close()
@@ -1,7 +1,9 @@
 
 from telegram import Update
 from telegram.ext import ContextTypes
-from db import get_user_stats
+from db_async import get_user_stats, get_user_rank, get_rank_neighborhood
+from handlers.ranking import ranking_scope
+from outbox import outbox
 
 def get_user_level(points):
     if points < 50:
@@ -16,40 +18,48 @@ def get_user_level(points):
 async def cmd_mipuntaje(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     username = update.effective_user.username or update.effective_user.first_name
-    stats = get_user_stats(user_id)
+    stats = await get_user_stats(user_id)
 
     if not stats:
-        await update.message.reply_text("❌ Aún no tienes puntos.")
+        await outbox.reply(update.message, "❌ Aún no tienes puntos.")
         return
 
     points = stats.get("points", 0)
     level = get_user_level(points)
 
-    await update.message.reply_text(
+    await outbox.reply(update.message,
         f"🎟️ {username}, tienes {points} puntos.\n"
         f"🌟 Nivel actual: {level}"
     )
 
 async def cmd_miperfil(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    stats = get_user_stats(user_id)
+    stats = await get_user_stats(user_id)
 
     if not stats:
-        await update.message.reply_text("❌ No tienes actividad registrada.")
+        await outbox.reply(update.message, "❌ No tienes actividad registrada.")
         return
 
-    await update.message.reply_text(
+    await outbox.reply(update.message,
         f"🎭 Perfil de {update.effective_user.first_name}:\n"
         f"- Puntos: {stats['points']}\n"
         f"- Nivel: {get_user_level(stats['points'])}\n"
-        f"- Hashtags usados: {stats['hashtags']}\n"
-        f"- Días activo: {stats['active_days']}"
+        f"- Hashtags usados: {sum(stats['hashtag_counts'].values())}\n"
+        f"- Días activo: {len(stats['active_days'])}"
     )
 
 async def cmd_mirank(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    rank = get_user_stats(user_id).get("rank", "No disponible")
+    chat_id = ranking_scope(update)
+    rank_info = await get_user_rank(user_id, chat_id)
 
-    await update.message.reply_text(
-        f"📈 Estás en la posición #{rank} del ranking."
-    )
+    if not rank_info:
+        await outbox.reply(update.message, "❌ Aún no apareces en el ranking.")
+        return
+
+    lines = [f"📈 Estás en la posición #{rank_info['rank']} de {rank_info['total_users']} del ranking."]
+    for rank, username, points in await get_rank_neighborhood(user_id, chat_id=chat_id):
+        marker = "👉" if rank == rank_info["rank"] else "  "
+        lines.append(f"{marker} {rank}. {username} - {points} pts")
+
+    await outbox.reply(update.message, "\n".join(lines))